@@ -0,0 +1,261 @@
+import json
+import os
+import sys
+import time
+import faiss
+import numpy as np
+
+from config import (
+    INDEX_TYPE, IVF_NLIST, PQ_M, PQ_NBITS, HNSW_M, HNSW_EF_CONSTRUCTION,
+    TRAIN_SAMPLE_SIZE, SEARCH_NPROBE, SEARCH_EF_SEARCH, INDEX_MMAP
+)
+
+INDEX_TYPES = ('flat', 'ivf_flat', 'hnsw', 'ivf_pq')
+
+
+def default_params(index_type=INDEX_TYPE):
+    params = {
+        'flat': {},
+        'ivf_flat': {'nlist': IVF_NLIST},
+        'hnsw': {'M': HNSW_M, 'efConstruction': HNSW_EF_CONSTRUCTION},
+        'ivf_pq': {'nlist': IVF_NLIST, 'm': PQ_M, 'nbits': PQ_NBITS},
+    }
+    if index_type not in params:
+        raise ValueError(f"Tipo de índice desconhecido: {index_type}. Use um de {', '.join(INDEX_TYPES)}")
+    return params[index_type]
+
+
+def min_train_size(index_type, params):
+    """
+    Quantidade mínima de vetores para treinar o índice. Abaixo disso o FAISS
+    falha ou gera centróides ruins, então usamos Flat.
+    """
+    if index_type == 'ivf_flat':
+        return params['nlist'] * 4
+    if index_type == 'ivf_pq':
+        return max(params['nlist'] * 4, 2 ** params['nbits'])
+    return 0
+
+
+def create_index(dimension, index_type=INDEX_TYPE, params=None):
+    """
+    Cria o índice vazio (ainda não treinado) dentro de um IndexIDMap2, para manter os IDs dos chunks.
+    """
+    params = params if params is not None else default_params(index_type)
+
+    if index_type == 'flat':
+        inner = faiss.IndexFlatL2(dimension)
+    elif index_type == 'ivf_flat':
+        inner = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, params['nlist'])
+    elif index_type == 'hnsw':
+        inner = faiss.IndexHNSWFlat(dimension, params['M'])
+        inner.hnsw.efConstruction = params['efConstruction']
+    elif index_type == 'ivf_pq':
+        inner = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, params['nlist'], params['m'], params['nbits'])
+    else:
+        raise ValueError(f"Tipo de índice desconhecido: {index_type}")
+
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None:
+        # Permite reconstruct() e remove_ids() por ID depois do treino
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+    return faiss.IndexIDMap2(inner)
+
+
+def build_index(vectors, ids, dimension, index_type=INDEX_TYPE, params=None, train_sample=TRAIN_SAMPLE_SIZE):
+    """
+    Cria, treina (com amostra de até train_sample vetores) e preenche o índice.
+    Devolve (índice, info) onde info descreve o tipo e os parâmetros realmente usados.
+    """
+    params = params if params is not None else default_params(index_type)
+    info = {'type': index_type, 'params': params}
+
+    if len(vectors) < min_train_size(index_type, params):
+        info = {'type': 'flat', 'params': {}, 'fallback_from': index_type}
+        index_type, params = 'flat', {}
+
+    index = create_index(dimension, index_type, params)
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = vectors
+        if len(vectors) > train_sample:
+            sample = vectors[rng.choice(len(vectors), train_sample, replace=False)]
+        inicio = time.perf_counter()
+        index.train(np.ascontiguousarray(sample, dtype=np.float32))
+        info['train_size'] = int(len(sample))
+        info['train_seconds'] = round(time.perf_counter() - inicio, 3)
+
+    if len(ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), np.asarray(ids, dtype=np.int64))
+
+    apply_search_params(index)
+    return index, info
+
+
+def inner_index(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def supports_remove(index):
+    return not isinstance(inner_index(index), faiss.IndexHNSW)
+
+
+def apply_search_params(index, nprobe=SEARCH_NPROBE, ef_search=SEARCH_EF_SEARCH):
+    """
+    Define os parâmetros padrão de busca do índice (usado ao carregar e ao construir).
+    """
+    inner = inner_index(index)
+    ivf = faiss.try_extract_index_ivf(inner)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    if isinstance(inner, faiss.IndexHNSW) and ef_search:
+        inner.hnsw.efSearch = ef_search
+
+
+def search_parameters(index, nprobe=None, ef_search=None):
+    """
+    Parâmetros de busca por consulta (sem alterar o índice compartilhado entre threads).
+    """
+    inner = inner_index(index)
+    if nprobe and faiss.try_extract_index_ivf(inner) is not None:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search and isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
+
+
+def search(index, queries, k, nprobe=None, ef_search=None):
+    """
+    Busca com os ajustes desta consulta. Índices com shards (shard_index.ShardedIndex)
+    recebem nprobe e ef_search e repassam a cada shard.
+    """
+    if getattr(index, 'is_sharded', False):
+        return index.search(queries, k, nprobe=nprobe, ef_search=ef_search)
+    return index.search(queries, k, params=search_parameters(index, nprobe, ef_search))
+
+
+def read_index(path, mmap=INDEX_MMAP):
+    """
+    Abre o índice salvo. Com mmap, os dados ficam no cache de páginas do sistema e são
+    compartilhados entre processos em vez de copiados para a memória de cada um.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+    # Versões mais novas do FAISS também mapeiam os códigos de índices Flat/PQ
+    flags |= getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+    return faiss.read_index(path, flags)
+
+
+def write_index(index, path):
+    """
+    Grava num arquivo temporário e troca por rename: quem abrir o arquivo vê a versão
+    antiga ou a nova inteira, e os processos que já mapearam a antiga continuam lendo dela.
+    """
+    tmp_path = path + '.tmp'
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def copy_index(index):
+    """
+    Cópia em memória (e modificável) do índice. Passa pela serialização: o clone_index de
+    um índice aberto com mmap continua apontando para o arquivo e aborta no próximo add.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+def info_path(index_file):
+    return os.path.splitext(index_file)[0] + '.json'
+
+
+def write_index_info(index_file, info):
+    path = info_path(index_file)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(info, f, ensure_ascii=False, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def read_index_info(index_file):
+    path = info_path(index_file)
+    if not os.path.exists(path):
+        return {'type': 'flat', 'params': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare_index_types(vectors, k=10, n_queries=200, types=INDEX_TYPES, train_sample=TRAIN_SAMPLE_SIZE,
+                        nprobe=SEARCH_NPROBE, ef_search=SEARCH_EF_SEARCH):
+    """
+    Compara cada tipo de índice com a busca exata (Flat): recall@k, latência por
+    consulta, tempo de construção e memória (tamanho serializado).
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dimension = vectors.shape[1]
+    ids = np.arange(len(vectors), dtype=np.int64)
+
+    # Consultas: vetores do próprio corpus com um pouco de ruído
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)]
+    queries = queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+    reference, _ = build_index(vectors, ids, dimension, 'flat')
+    _, truth = reference.search(queries, k)
+
+    results = []
+    for index_type in types:
+        inicio = time.perf_counter()
+        index, info = build_index(vectors, ids, dimension, index_type, train_sample=train_sample)
+        build_seconds = time.perf_counter() - inicio
+        apply_search_params(index, nprobe, ef_search)
+
+        inicio = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_seconds = time.perf_counter() - inicio
+
+        recall = np.mean([
+            len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))
+        ])
+        results.append({
+            'type': index_type,
+            'used': info['type'],
+            'params': info['params'],
+            f'recall@{k}': round(float(recall), 4),
+            'latency_ms': round(search_seconds / len(queries) * 1000, 4),
+            'build_seconds': round(build_seconds, 3),
+            'memory_bytes': int(faiss.serialize_index(index).size),
+        })
+
+    return results
+
+
+if __name__ == '__main__':
+    # Compara os tipos de índice com os vetores do corpus atual:
+    # python ann_index.py [text|table|image] [k]
+    from config import EMBEDDING_MODEL
+    from document_index import DocumentIndex
+    from encoder_backend import loaded_variant
+    from model_registry import embedding_model
+
+    chunk_type = sys.argv[1] if len(sys.argv) > 1 else 'text'
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    # Mesmo carregamento do servidor: o backend configurado (torch ou onnx), e os índices conferidos
+    # com a variante do encoder que subiu de fato (o ONNX pode ter voltado para o SentenceTransformer)
+    model = embedding_model(EMBEDDING_MODEL)
+    documents = DocumentIndex(lambda: model, variant=loaded_variant(model))
+    snapshot = documents.load()
+    ids = [chunk_id for chunk_id, _ in snapshot.chunks.by_type(chunk_type)]
+    if not ids:
+        print(f"Nenhum chunk do tipo {chunk_type}.")
+        sys.exit(1)
+
+    vectors = snapshot.chunks.vectors(ids)
+    print(f"Comparando índices com {len(vectors)} vetores ({chunk_type}), k={k}")
+    for result in compare_index_types(vectors, k=min(k, len(vectors))):
+        print(json.dumps(result, ensure_ascii=False))
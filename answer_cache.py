@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_ENTRIES, ANSWER_CACHE_MAX_BYTES, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_SIMILARITY
+)
+from text_normalization import normalize_question
+import metrics
+
+# Custo aproximado de cada entrada além da resposta e do vetor (chave, dicionário, etc.)
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class AnswerCache:
+    """
+    Cache de respostas na frente do /ask, em dois níveis:
+    - exato: pergunta normalizada (sem acentos, pontuação e caixa) + versão do índice;
+    - semântico: reaproveita a resposta de uma pergunta com embedding parecido (cosseno
+      acima de similarity), sempre dentro da mesma versão e do mesmo contexto.
+    Entradas saem por LRU, por tempo de vida (ttl_seconds) e pelo limite de memória.
+    Quando a versão muda (novo índice publicado), o cache inteiro é descartado.
+    Acertos, faltas e ocupação também vão para o /metrics (rag_answer_cache_*).
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_ENTRIES, max_bytes=ANSWER_CACHE_MAX_BYTES,
+                 ttl_seconds=ANSWER_CACHE_TTL_SECONDS, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+
+        self.entries = OrderedDict()
+        self.version = None
+        self.bytes = 0
+        self._lock = threading.Lock()
+        # Matriz dos vetores em cache, refeita só quando as entradas mudam
+        self._matrix = None
+        self._matrix_keys = []
+
+        self.stats = {'exact_hits': 0, 'semantic_hits': 0, 'misses': 0, 'evictions': 0,
+                      'invalidations': 0, 'saved_seconds': 0.0}
+        self._publish()
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.stats['invalidations'] += 1
+                metrics.REGISTRY.inc('rag_answer_cache_invalidations_total')
+            self.entries.clear()
+            self.bytes = 0
+            self._matrix = None
+            self.version = version
+
+    def _expired(self, entry):
+        return self.ttl_seconds and time.monotonic() - entry['created'] > self.ttl_seconds
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes -= entry['size']
+        if entry['vector'] is not None:
+            self._matrix = None
+
+    def _hit(self, key, entry, tier):
+        self.entries.move_to_end(key)
+        self.stats[f'{tier}_hits'] += 1
+        self.stats['saved_seconds'] += entry['seconds']
+        metrics.REGISTRY.inc('rag_answer_cache_hits_total', tier=tier)
+        metrics.REGISTRY.inc('rag_answer_cache_saved_seconds_total', entry['seconds'])
+        self._publish()
+        return entry['answer']
+
+    def _hit_rate(self):
+        hits = self.stats['exact_hits'] + self.stats['semantic_hits']
+        lookups = hits + self.stats['misses']
+        return round(hits / lookups, 4) if lookups else 0.0
+
+    def _publish(self):
+        # Gauges do /metrics; chamado com o lock do cache
+        metrics.REGISTRY.set('rag_answer_cache_entries', len(self.entries))
+        metrics.REGISTRY.set('rag_answer_cache_bytes', self.bytes)
+        metrics.REGISTRY.set('rag_answer_cache_hit_rate', self._hit_rate())
+
+    def get(self, question, version, context=()):
+        """
+        Nível exato. context separa respostas que dependem de outros parâmetros
+        (tipo da pergunta, nprobe, ef_search).
+        """
+        key = (normalize_question(question), context)
+        with self._lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry):
+                self._remove(key)
+                return None
+            return self._hit(key, entry, 'exact')
+
+    def get_similar(self, embedding, version, context=()):
+        """
+        Nível semântico: a entrada mais parecida com o embedding, se passar do limite.
+        """
+        if not self.similarity:
+            return None
+        query = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            self._check_version(version)
+            if self._matrix is None:
+                self._matrix_keys = [key for key, entry in self.entries.items() if entry['vector'] is not None]
+                self._matrix = (
+                    np.vstack([self.entries[key]['vector'] for key in self._matrix_keys])
+                    if self._matrix_keys else np.zeros((0, len(query)), dtype=np.float32)
+                )
+            if not len(self._matrix_keys):
+                return None
+
+            scores = self._matrix @ query
+            for position in np.argsort(-scores):
+                if scores[position] < self.similarity:
+                    break
+                key = self._matrix_keys[position]
+                entry = self.entries.get(key)
+                if entry is None or key[1] != context:
+                    continue
+                if self._expired(entry):
+                    self._remove(key)
+                    return None
+                return self._hit(key, entry, 'semantic')
+            return None
+
+    def miss(self):
+        with self._lock:
+            self.stats['misses'] += 1
+            metrics.REGISTRY.inc('rag_answer_cache_misses_total')
+            self._publish()
+
+    def put(self, question, version, answer, context=(), embedding=None, seconds=0.0):
+        """
+        Guarda a resposta com o tempo que ela custou (é o tempo economizado a cada acerto).
+        """
+        vector = None
+        if embedding is not None and self.similarity:
+            vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+
+        key = (normalize_question(question), context)
+        size = len(str(answer).encode('utf-8')) + len(key[0]) + ENTRY_OVERHEAD_BYTES
+        size += vector.nbytes if vector is not None else 0
+
+        with self._lock:
+            self._check_version(version)
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = {
+                'answer': answer, 'vector': vector, 'size': size,
+                'seconds': seconds, 'created': time.monotonic()
+            }
+            self.bytes += size
+            if vector is not None:
+                self._matrix = None
+
+            while self.entries and (len(self.entries) > self.max_entries or self.bytes > self.max_bytes):
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+                metrics.REGISTRY.inc('rag_answer_cache_evictions_total')
+            self._publish()
+
+    def clear(self):
+        with self._lock:
+            self._check_version(None)
+            self._publish()
+
+    def metrics(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                saved_seconds=round(self.stats['saved_seconds'], 4),
+                hit_rate=self._hit_rate(),
+                entries=len(self.entries),
+                bytes=self.bytes,
+                version=self.version,
+            )
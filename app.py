@@ -1,19 +1,31 @@
-from flask import Flask, request, jsonify
+import time
+INICIO_PROCESSO = time.perf_counter()
+
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 import os
 import sys
 from subprocess import call
-from sentence_transformers import SentenceTransformer
-import faiss
-import numpy as np
 import json
-from io import BytesIO
-import pdfplumber
-import fitz
-import easyocr
-import subprocess
+import hashlib
+import shutil
+import threading
+from query_engine import QueryEngine
+from ingestion import PdfIngestion
+from chunk_store import ChunkStore
+from ocr_stage import OcrStage
+from jobs import JobQueue, QueueFullError
+from llm_server import LLMServer, build_prompt
+import metrics
+from model_registry import REGISTRY as MODELS
+from config import LLM_PRELOAD, MODEL_PRELOAD, ASK_BATCH_MAX_QUESTIONS
 
 app = Flask(__name__)
 
+# Com python app.py, os pools de processos (forkserver/spawn) importam este arquivo de novo
+# como __mp_main__, só para achar as funções dos workers: lá não se carregam modelos nem se
+# mexe na fila de jobs (que marcaria os jobs em andamento do servidor como interrompidos)
+SERVIDOR = __name__ != '__mp_main__'
+
 IMAGES_DIR = "img"
 TEXT_DIR = "text"
 TABLES_DIR = "table"
@@ -29,13 +41,93 @@ for directory in [IMAGES_DIR, TEXT_DIR, TABLES_DIR]:
         print(f"Erro ao criar a pasta {directory}: {e}")
 
 
-reader = easyocr.Reader(['pt', 'en'], gpu=False)
-
-MODEL = SentenceTransformer('all-MiniLM-L6-v2')
-INDEX = None
-FAISS_INDEX_FILE = 'faiss_index.faiss'
-CHUNKED_DATA_FILE = 'chunked_data.json'
-LLM_SCRIPT = 'generate_response.py'  # Arquivo para gerar resposta com LLM
+# OCR das imagens com deduplicação, cache persistente e pool de workers do easyocr
+OCR_STAGE = OcrStage()
+
+# Motor de consulta residente: índices e chunks carregados uma única vez
+ENGINE = QueryEngine(table_path=TABLES_DIR)
+
+# LLM local residente; com LLM_PRELOAD=1 já é carregado na subida do servidor
+LLM = LLMServer()
+
+# Nenhum modelo é carregado na importação: cada um sobe no primeiro uso, no POST /warmup
+# ou aqui mesmo, se estiver em MODEL_PRELOAD
+MODELS.register_warmup('embedding', ENGINE._get_model)
+MODELS.register_warmup('ocr', OCR_STAGE.get_reader)
+MODELS.register_warmup('llm', LLM.get_model)
+if SERVIDOR and MODEL_PRELOAD:
+    MODELS.warmup(MODEL_PRELOAD)
+if SERVIDOR and LLM_PRELOAD:
+    threading.Thread(target=LLM.get_model, daemon=True).start()
+
+# Ingestão em memória: dos bytes do PDF direto para o índice
+INGESTION = PdfIngestion(ENGINE, OCR_STAGE, text_dir=TEXT_DIR, tables_dir=TABLES_DIR, images_dir=IMAGES_DIR)
+
+# Ingestão em segundo plano: o POST devolve um job_id e o status fica em /jobs/<id>
+JOBS = JobQueue() if SERVIDOR else None
+
+
+def document_dirs(doc_id):
+    return [os.path.join(directory, doc_id) for directory in [TEXT_DIR, TABLES_DIR, IMAGES_DIR]]
+
+
+def delete_document_files(doc_id):
+    for directory in document_dirs(doc_id):
+        shutil.rmtree(directory, ignore_errors=True)
+
+@app.before_request
+def iniciar_cronometro():
+    g.inicio = time.perf_counter()
+
+@app.after_request
+def registrar_requisicao(response):
+    inicio = g.pop('inicio', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else 'desconhecida'
+        metrics.observe_request(rota, response.status_code, time.perf_counter() - inicio)
+    return response
+
+@app.route('/health', methods=['GET'])
+def health():
+    # Não carrega nada: responde assim que o processo sobe, com ou sem modelos e índices
+    return jsonify({
+        "status": "ok",
+        "uptime_seconds": round(time.perf_counter() - INICIO_PROCESSO, 3),
+        "models_loaded": sorted(MODELS.status()['models']),
+        "index_loaded": ENGINE.documents.snapshot is not None,
+    })
+
+@app.route('/models', methods=['GET'])
+def models_status():
+    # Tempo de carga e memória de cada modelo deste processo
+    return jsonify(MODELS.status())
+
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    # Carrega os modelos antes da primeira pergunta: JSON {"models": ["embedding", "ocr"]} ou o
+    # campo model repetido no formulário; sem lista, carrega todos. index=1 também carrega os índices
+    dados = request.get_json(silent=True) or {}
+    names = dados.get('models') or request.form.getlist('model') or None
+    try:
+        resultado = {"models": MODELS.warmup(names)}
+    except KeyError as e:
+        return f"Erro: {e.args[0]}", 400
+
+    if dados.get('index') or request.form.get('index'):
+        inicio = time.perf_counter()
+        try:
+            ENGINE.ensure_loaded()
+            resultado["index"] = {"seconds": round(time.perf_counter() - inicio, 3)}
+        except FileNotFoundError:
+            resultado["index"] = {"error": "Nenhum dado processado."}
+
+    resultado.update(MODELS.status())
+    return jsonify(resultado)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Histogramas por etapa e por rota, contadores de itens e o cache de respostas, no formato texto do Prometheus
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/')
 def home():
@@ -64,6 +156,10 @@ def home():
             <t>Por padrão está um modelo de baixa potência</t>
             <p>⚠️ Ao enviar pode demorara muito. Aguarde ⚠️ </p>
         </form>
+        <h2>Acompanhar Processamento</h2>
+        <form action="/jobs" method="GET">
+            <button type="submit">Ver jobs</button>
+        </form>
     </body>
     </html>
     '''
@@ -80,96 +176,148 @@ def process_pdf():
     if not pdf_file.filename.endswith('.pdf'):
         return "Erro: O arquivo enviado não é um PDF", 400
 
-    try:
-        dados_pdf = {
-            "numero_paginas": 0,
-            "imagens_paginas": {},
-            "textos_paginas": {},
-            "tabelas_paginas": {}
-        }
-
-        pdf_bytes = BytesIO(pdf_file.read())
-
-        with pdfplumber.open(pdf_bytes) as pdf:
-            dados_pdf["numero_paginas"] = len(pdf.pages)
-            for i, pagina in enumerate(pdf.pages):
-                tabelas = pagina.extract_tables()
-                texto_exclusivo = pagina.extract_text()
-
-                if tabelas:
-                    table_path = os.path.join(TABLES_DIR, f"page_{i+1}_table.csv")
-                    with open(table_path, "w", encoding="utf-8") as table_file:
-                        for tabela in tabelas:
-                            for linha in tabela:
-                                table_file.write(",".join(map(str, linha)) + "\n")
-
-                    for tabela in tabelas:
-                        tabela_texto = [" ".join(map(str, linha)) for linha in tabela]
-                        for linha in tabela_texto:
-                            texto_exclusivo = texto_exclusivo.replace(linha, "")
-
-                    dados_pdf["tabelas_paginas"][f"pagina_{i+1}"] = table_path
+    # Documento que este upload substitui (opcional)
+    replace_doc_id = request.form.get('replace')
 
-                if texto_exclusivo.strip():
-                    text_path = os.path.join(TEXT_DIR, f"page_{i+1}.txt")
-                    with open(text_path, "w", encoding="utf-8") as text_file:
-                        text_file.write(texto_exclusivo.strip())
-                    dados_pdf["textos_paginas"][f"pagina_{i+1}"] = text_path
-
-        pdf_bytes.seek(0) 
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        for i in range(len(doc)):
-            page = doc[i]
-            imagens = []
-            for img_index, img in enumerate(page.get_images(full=True)):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image_ext = base_image["ext"]
-
-                image_path = os.path.join(IMAGES_DIR, f"page_{i+1}_image_{img_index + 1}.{image_ext}")
-                with open(image_path, "wb") as image_file:
-                    image_file.write(image_bytes)
+    try:
+        recebido = time.perf_counter()
+        conteudo = pdf_file.read()
+        job_id = JOBS.submit('process', ingest_pdf, conteudo, pdf_file.filename, replace_doc_id, recebido)
+    except QueueFullError as e:
+        return f"Erro: {e}", 503
+    except Exception as e:
+        return f"Erro ao processar o PDF: {e}", 500
 
-                ocr_text = reader.readtext(image_path, detail=0)
-                ocr_text_path = os.path.join(IMAGES_DIR, f"page_{i+1}_image_{img_index + 1}_ocr.txt")
-                with open(ocr_text_path, "w", encoding="utf-8") as ocr_file:
-                    ocr_file.write("\n".join(ocr_text))
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
 
-                imagens.append({"path": image_path, "ocr_text_path": ocr_text_path, "type": image_ext})
+def ingest_pdf(job, conteudo, filename, replace_doc_id=None, recebido=None):
+    # ID estável: o mesmo PDF sempre gera o mesmo doc_id
+    doc_id = hashlib.sha1(conteudo).hexdigest()[:16]
+    delete_document_files(doc_id)
 
-            if imagens:
-                dados_pdf["imagens_paginas"][f"pagina_{i+1}"] = imagens
+    # Extração, OCR, chunking e embeddings em memória, numa passada só
+    dados_pdf = {"doc_id": doc_id}
+    dados_pdf.update(INGESTION.run(doc_id, conteudo, filename, job, recebido))
 
-        doc.close()
+    if replace_doc_id and replace_doc_id != doc_id:
+        try:
+            ENGINE.remove_document(replace_doc_id)
+        except KeyError:
+            pass
+        delete_document_files(replace_doc_id)
+        dados_pdf["documento_substituido"] = replace_doc_id
 
-        return jsonify(dados_pdf)
-
-    except Exception as e:
-        return f"Erro ao processar o PDF: {e}", 500
+    return dados_pdf
 
 @app.route('/execute', methods=['POST'])
 def execute_processing():
     try:
-        python_executable = sys.executable  
+        job_id = JOBS.submit('execute', rebuild_all)
+    except QueueFullError as e:
+        return f"Erro: {e}", 503
+
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+def rebuild_all(job):
+    # Os PDFs enviados não deixam arquivos intermediários (só com INGESTION_DEBUG):
+    # a reconstrução parte dos chunks já indexados
+    if ChunkStore.exists(ENGINE.documents.db_file):
+        with job.stage("embeddings"):
+            ENGINE.documents.rebuild()
+        with job.stage("recarga"):
+            ENGINE.reload()
+        return "Processamento concluído com sucesso!"
+
+    python_executable = sys.executable
+
+    with job.stage("chunking"):
         print("Executando chunk_processing.py...")
         result_chunk = call([python_executable, "chunk_processing.py"])
         if result_chunk != 0:
-            return f"Erro ao executar chunk_processing.py. Código de saída: {result_chunk}", 500
+            raise RuntimeError(f"Erro ao executar chunk_processing.py. Código de saída: {result_chunk}")
 
+    with job.stage("embeddings"):
         print("Executando generate_embeddings.py...")
         result_embeddings = call([python_executable, "generate_embeddings.py"])
         if result_embeddings != 0:
-            return f"Erro ao executar generate_embeddings.py. Código de saída: {result_embeddings}", 500
+            raise RuntimeError(f"Erro ao executar generate_embeddings.py. Código de saída: {result_embeddings}")
+
+    with job.stage("tabelas"):
+        ENGINE.tables.rebuild_from_csv(TABLES_DIR)
+
+    # Recarregar o motor de consulta com os novos índices
+    with job.stage("recarga"):
+        ENGINE.reload()
+
+    return "Processamento concluído com sucesso!"
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify(JOBS.store.recent())
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return f"Erro: Job {job_id} não encontrado", 404
+    return jsonify(job)
+
+@app.route('/documents', methods=['GET'])
+def list_documents():
+    snapshot = ENGINE.documents.snapshot
+    if snapshot is None:
+        try:
+            snapshot = ENGINE.ensure_loaded()
+        except FileNotFoundError:
+            return jsonify({})
+
+    return jsonify({
+        doc_id: {"filename": info.get("filename"), "chunks": len(info.get("chunk_ids", []))}
+        for doc_id, info in snapshot.documents.items()
+    })
+
+@app.route('/documents/<doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    try:
+        ENGINE.remove_document(doc_id)
+    except KeyError:
+        return f"Erro: Documento {doc_id} não encontrado", 404
+    except FileNotFoundError:
+        return "Erro: Nenhum dado processado.", 404
+    except Exception as e:
+        return f"Erro ao remover o documento: {e}", 500
 
-        # Carregar o índice FAISS
-        global INDEX
-        if os.path.exists(FAISS_INDEX_FILE):
-            INDEX = faiss.read_index(FAISS_INDEX_FILE)
+    delete_document_files(doc_id)
+    return f"Documento {doc_id} removido com sucesso!"
 
-        return "Processamento concluído com sucesso!"
+@app.route('/shards', methods=['GET', 'POST'])
+def shards():
+    # GET: documentos e vetores de cada shard; POST: sobe mais um shard e rebalanceia
+    if ENGINE.shards is None:
+        return "Erro: Índice sem shards (defina SHARDS para ativar).", 404
+    try:
+        if request.method == 'POST':
+            ENGINE.ensure_loaded()
+            shard_id = ENGINE.shards.add_shard()
+            return jsonify({"shard_id": shard_id, **ENGINE.shards.stats()}), 201
+    except FileNotFoundError:
+        return "Erro: Nenhum dado processado.", 404
     except Exception as e:
-        return f"Erro ao executar o processamento: {e}", 500
+        return f"Erro ao adicionar o shard: {e}", 500
+    return jsonify(ENGINE.shards.stats())
+
+@app.route('/shards/<int:shard_id>', methods=['DELETE'])
+def remove_shard(shard_id):
+    # Os documentos do shard vão para os outros antes de o processo ser encerrado
+    if ENGINE.shards is None:
+        return "Erro: Índice sem shards (defina SHARDS para ativar).", 404
+    try:
+        movidos = ENGINE.shards.remove_shard(shard_id)
+    except KeyError:
+        return f"Erro: Shard {shard_id} não encontrado", 404
+    except ValueError as e:
+        return f"Erro: {e}", 400
+    return jsonify({"documentos_movidos": movidos, **ENGINE.shards.stats()})
 
 @app.route('/ask', methods=['POST'])
 def ask_question():
@@ -180,38 +328,114 @@ def ask_question():
 
     print(f"Pergunta recebida: {question}")
 
+    # Ajustes opcionais de busca para índices aproximados
+    search_options = {
+        'nprobe': request.form.get('nprobe', type=int),
+        'ef_search': request.form.get('ef_search', type=int),
+        # vector, bm25 ou hybrid (padrão: RETRIEVAL_MODE)
+        'mode': request.form.get('mode'),
+    }
+
     try:
-        python_executable = sys.executable
-        print("Executando script LLM...")
-
-        # Usar Popen para capturar saída em tempo real
-        process = subprocess.Popen(
-            [python_executable, "-u", LLM_SCRIPT, question],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            bufsize=1,
-            text=True
-        )
-
-        output = []  
-        for line in iter(process.stdout.readline, ''):
-            output.append(line.strip())  
-            print(line.strip(), flush=True)  
-
-        process.wait() 
-        stderr = process.stderr.read() 
-
-        if process.returncode != 0:
-            print(f"Erro ao executar o script LLM: {stderr.strip()}")
-            return f"Erro ao gerar a resposta: {stderr.strip()}", 500
-
-        full_output = "\n".join(output)
-        print("Script LLM executado com sucesso!")
-        return full_output, 200
+        # Com timings=1 a resposta vem em JSON com o tempo de cada etapa desta pergunta
+        with metrics.trace() as spans:
+            response = ENGINE.answer(question, **search_options)
+        print(response, flush=True)
+        if request.form.get('timings'):
+            return jsonify({"answer": response, "timings": spans})
+        return response, 200
+    except FileNotFoundError as e:
+        print(f"Erro: dados ainda não processados: {e}")
+        return "Erro: Nenhum dado processado. Envie um PDF e execute o processamento antes de perguntar.", 400
     except Exception as e:
         print(f"Erro ao processar a pergunta: {e}")
         return f"Erro ao processar a pergunta: {e}", 500
 
+@app.route('/ask_batch', methods=['POST'])
+def ask_batch():
+    # Várias perguntas numa chamada: JSON {"questions": [...], "nprobe", "ef_search", "mode", "compare",
+    # "timings"} ou o campo question repetido no formulário. Com compare, mede também as perguntas
+    # por segundo do caminho de uma pergunta por vez; com timings, devolve o tempo de cada etapa
+    dados = request.get_json(silent=True) or {}
+    questions = dados.get('questions') or request.form.getlist('question')
+    if not questions or not all(isinstance(question, str) and question for question in questions):
+        return "Erro: Envie uma lista de perguntas não vazias.", 400
+    if len(questions) > ASK_BATCH_MAX_QUESTIONS:
+        return f"Erro: No máximo {ASK_BATCH_MAX_QUESTIONS} perguntas por chamada.", 400
+
+    def option(name, kind=str):
+        value = dados.get(name, request.form.get(name))
+        return kind(value) if value not in (None, '') else None
+
+    try:
+        search_options = {'nprobe': option('nprobe', int), 'ef_search': option('ef_search', int), 'mode': option('mode')}
+    except ValueError:
+        return "Erro: nprobe e ef_search devem ser inteiros.", 400
+
+    try:
+        inicio = time.perf_counter()
+        with metrics.trace() as spans:
+            answers = ENGINE.answer_batch(questions, **search_options)
+        seconds = time.perf_counter() - inicio
+        resultado = {
+            "results": [{"question": question, "answer": answer} for question, answer in zip(questions, answers)],
+            "seconds": round(seconds, 4),
+            "qps": round(len(questions) / seconds, 2) if seconds else None,
+        }
+        if dados.get('timings') or request.form.get('timings'):
+            resultado["timings"] = spans
+        if dados.get('compare') or request.form.get('compare'):
+            resultado["throughput"] = ENGINE.throughput(questions, **search_options)
+        print(f"Lote de {len(questions)} perguntas em {seconds:.3f}s", flush=True)
+        return jsonify(resultado)
+    except FileNotFoundError as e:
+        print(f"Erro: dados ainda não processados: {e}")
+        return "Erro: Nenhum dado processado. Envie um PDF e execute o processamento antes de perguntar.", 400
+    except Exception as e:
+        print(f"Erro ao processar as perguntas: {e}")
+        return f"Erro ao processar as perguntas: {e}", 500
+
+@app.route('/ask/cache', methods=['GET'])
+def answer_cache_metrics():
+    # Taxa de acerto (exato e semântico) e tempo economizado pelo cache de respostas
+    return jsonify(ENGINE.cache.metrics())
+
+@app.route('/ask_llm', methods=['POST'])
+def ask_llm():
+    question = request.form.get('question')
+    if not question:
+        return "Erro: Nenhuma pergunta enviada.", 400
+
+    try:
+        packed = ENGINE.llm_context(question)
+    except FileNotFoundError:
+        return "Erro: Nenhum dado processado. Envie um PDF e execute o processamento antes de perguntar.", 400
+    except Exception as e:
+        return f"Erro ao processar a pergunta: {e}", 500
+
+    prompt = build_prompt(packed['context'], question)
+
+    # Server-Sent Events: um evento por token e um evento final com o TTFT, as fontes do
+    # contexto e os tokens usados dele
+    def eventos():
+        stats = {}
+        try:
+            for token in LLM.stream(prompt, stats=stats):
+                yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            return
+        stats.update(sources=packed['sources'], context_tokens=packed['tokens'])
+        yield f"event: done\ndata: {json.dumps(stats, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(eventos()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+print(f"App importado em {time.perf_counter() - INICIO_PROCESSO:.2f}s")
+
 if __name__ == '__main__':
     print("Iniciando o servidor Flask...")
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import hashlib
+import re
+import numpy as np
+
+from synthetic_pdf import read_product_image
+
+
+class FakeEncoder:
+    """
+    Encoder determinístico sem modelo: soma vetores aleatórios fixos por palavra (o hash da
+    palavra é a semente) e normaliza. Textos com palavras em comum ficam próximos, o que basta
+    para medir busca, índice e cache sem baixar o SentenceTransformer.
+    """
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self._words = {}
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def _word_vector(self, word):
+        vector = self._words.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.sha256(word.encode('utf-8')).digest()[:8], 'little')
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            self._words[word] = vector
+        return vector
+
+    def encode(self, texts, batch_size=None, show_progress_bar=False, convert_to_numpy=True):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row] += self._word_vector(word)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class FakeOcrReader:
+    """
+    Substitui o easyocr.Reader: devolve as linhas do produto desenhado pelo synthetic_pdf.
+    """
+
+    def readtext(self, image_bytes, detail=0):
+        return read_product_image(image_bytes)
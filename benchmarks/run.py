@@ -0,0 +1,251 @@
+"""
+Benchmark reproduzível da ingestão e das consultas, com um relatório de vendas sintético.
+
+    python benchmarks/run.py --pages 20 --fake-encoder --fake-ocr
+    python benchmarks/run.py --pages 20 --save-baseline
+
+Mede páginas/s da extração, imagens/s do OCR, chunks/s do chunking e dos embeddings,
+o tempo de construção do índice e a latência p50/p95/p99 do /ask por tipo de pergunta.
+O resultado vai para um JSON e é comparado com o baseline salvo: uma métrica que piorar
+além da tolerância faz o script sair com código 1.
+
+--fake-encoder e --fake-ocr trocam o SentenceTransformer e o easyocr por versões
+determinísticas sem modelo (benchmarks/fakes.py), para rodar offline e em CI.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import tempfile
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import numpy as np
+
+import ann_index
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_QUANTIZE, INDEX_TYPE, EXTRACTION_WORKERS, OCR_WORKERS
+from ingestion import page_chunks
+from ocr_stage import OcrStage
+from pdf_extraction import extract_pdf
+from query_engine import QueryEngine
+from synthetic_pdf import generate_report, PRODUCTS
+from fakes import FakeEncoder, FakeOcrReader
+
+DEFAULT_OUTPUT = os.path.join(BENCHMARKS_DIR, 'results', 'latest.json')
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+# Piora relativa tolerada por unidade da métrica, e a diferença absoluta mínima para contar
+# (latências de menos de 1 ms oscilam mais do que 30% só com o ruído do sistema)
+TOLERANCES = {'per_second': 0.20, 'seconds': 0.25, 'ms': 0.30}
+MIN_DELTAS = {'per_second': 0.0, 'seconds': 0.01, 'ms': 1.0}
+
+# Campos do meta que precisam ser iguais para o baseline ser comparável
+COMPARABLE_META = ('pages', 'images_per_page', 'seed', 'fake_encoder', 'fake_ocr', 'model', 'embedding_backend', 'index_type')
+
+QUESTIONS = {
+    'text': [
+        "Qual foi a estratégia comercial do trimestre?",
+        "Como o desempenho das vendas recorrentes mudou com o CRM?",
+        "O que o relatório diz sobre o custo de aquisição de clientes?",
+    ],
+    'table': [
+        "Qual é o total de vendas por produto?",
+        "Quais são os valores de vendas por mês?",
+        "Qual o total de vendas?",
+    ],
+    'image': [f"Quais características da {nome} {codigo}?" for nome, codigo, _ in PRODUCTS[:3]],
+}
+
+
+def percentile(values, p):
+    # Nearest-rank: sempre um valor medido, sem interpolação
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def rate(count, seconds):
+    return round(count / seconds, 2) if seconds else None
+
+
+def timed(func, *args, **kwargs):
+    inicio = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - inicio
+
+
+def run(args):
+    pdf_bytes, resumo = generate_report(args.pages, args.images_per_page, seed=args.seed)
+    results = {}
+
+    (numero_paginas, paginas), seconds = timed(extract_pdf, pdf_bytes, workers=args.workers)
+    results['extraction'] = {'pages': numero_paginas, 'seconds': round(seconds, 4),
+                             'pages_per_second': rate(numero_paginas, seconds)}
+
+    imagens = [imagem for pagina in paginas for imagem in pagina["images"]]
+    ocr_stage = OcrStage(workers=1 if args.fake_ocr else args.ocr_workers, cache_file='ocr_cache.sqlite')
+    if args.fake_ocr:
+        ocr_stage._reader = FakeOcrReader()
+    textos, seconds = timed(ocr_stage.run, imagens)
+    ocr_stage.close()
+    for imagem, ocr_text in zip(imagens, textos):
+        imagem["ocr_text"] = ocr_text
+    results['ocr'] = {'images': len(imagens), 'seconds': round(seconds, 4),
+                      'images_per_second': rate(len(imagens), seconds)}
+
+    chunks, seconds = timed(lambda: [chunk for pagina in paginas for chunk in page_chunks(pagina, 'img')])
+    results['chunking'] = {'chunks': len(chunks), 'seconds': round(seconds, 4),
+                           'chunks_per_second': rate(len(chunks), seconds)}
+
+    engine = QueryEngine(model_name='fake-encoder' if args.fake_encoder else args.model)
+    if args.fake_encoder:
+        engine.model = FakeEncoder()
+    else:
+        # O carregamento do modelo não entra nos chunks/s
+        engine._get_model()
+    embeddings, seconds = timed(engine.documents.encode, chunks)
+    results['embedding'] = {'chunks': len(chunks), 'seconds': round(seconds, 4),
+                            'chunks_per_second': rate(len(chunks), seconds)}
+
+    _, seconds = timed(ann_index.build_index, embeddings, np.arange(len(chunks), dtype=np.int64), embeddings.shape[1])
+    results['index'] = {'vectors': len(chunks), 'build_seconds': round(seconds, 4)}
+
+    tabelas = [(pagina["page"], indice, tabela) for pagina in paginas for indice, tabela in enumerate(pagina["tables"])]
+    _, seconds = timed(engine.add_document, 'benchmark', chunks, filename='benchmark.pdf',
+                       tables=tabelas, embeddings=embeddings)
+    results['index']['add_document_seconds'] = round(seconds, 4)
+
+    results['ask'] = {}
+    for question_type, questions in QUESTIONS.items():
+        # A primeira pergunta de cada tipo aquece caches de página e de processo
+        engine.answer(questions[0], use_cache=False)
+        latencies = []
+        for _ in range(args.repeat):
+            for question in questions:
+                _, seconds = timed(engine.answer, question, use_cache=False)
+                latencies.append(seconds * 1000)
+        results['ask'][question_type] = {
+            'questions': len(latencies),
+            **{f'p{p}_ms': round(percentile(latencies, p), 3) for p in (50, 95, 99)},
+        }
+
+    meta = {
+        'pages': args.pages, 'images_per_page': args.images_per_page, 'seed': args.seed,
+        'images': resumo['images'], 'tables': resumo['tables'], 'repeat': args.repeat,
+        'fake_encoder': args.fake_encoder, 'fake_ocr': args.fake_ocr,
+        'model': 'fake-encoder' if args.fake_encoder else args.model, 'index_type': INDEX_TYPE,
+        'embedding_backend': None if args.fake_encoder else EMBEDDING_BACKEND + ('-int8' if EMBEDDING_QUANTIZE else ''),
+        'workers': args.workers, 'python': platform.python_version(), 'platform': platform.platform(),
+        'cpu_count': os.cpu_count(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    return {'meta': meta, 'metrics': results}
+
+
+def flatten(metrics, prefix=''):
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def metric_unit(name):
+    for unit in TOLERANCES:
+        if name.endswith(unit):
+            return unit
+    return None
+
+
+def compare(current, baseline, tolerance=None):
+    """
+    Lista de (métrica, baseline, atual, variação) que pioraram além da tolerância.
+    Métricas */s pioram quando caem; tempos (seconds, ms) pioram quando sobem.
+    """
+    regressions = []
+    atual, anterior = flatten(current['metrics']), flatten(baseline['metrics'])
+    for name, old in sorted(anterior.items()):
+        unit = metric_unit(name)
+        new = atual.get(name)
+        if unit is None or new is None or not old:
+            continue
+        limite = tolerance if tolerance is not None else TOLERANCES[unit]
+        worse = old - new if unit == 'per_second' else new - old
+        if worse > MIN_DELTAS[unit] and worse / old > limite:
+            regressions.append((name, old, new, (new - old) / old))
+    return regressions
+
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão e consultas com PDFs sintéticos")
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--images-per-page', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=10, help="Rodadas de cada pergunta na medida de latência")
+    parser.add_argument('--workers', type=int, default=EXTRACTION_WORKERS, help="Workers da extração")
+    parser.add_argument('--ocr-workers', type=int, default=OCR_WORKERS)
+    parser.add_argument('--model', default=EMBEDDING_MODEL)
+    parser.add_argument('--fake-encoder', action='store_true')
+    parser.add_argument('--fake-ocr', action='store_true')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Grava o resultado como novo baseline")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help="Piora relativa tolerada para todas as métricas (padrão: por unidade)")
+    args = parser.parse_args()
+
+    output, baseline_file = os.path.abspath(args.output), os.path.abspath(args.baseline)
+    diretorio_original = os.getcwd()
+    # Índices, caches e bancos do benchmark ficam numa pasta temporária, longe dos dados reais
+    with tempfile.TemporaryDirectory(prefix='bosch_benchmark_') as workdir:
+        os.chdir(workdir)
+        try:
+            current = run(args)
+        finally:
+            os.chdir(diretorio_original)
+
+    save_json(current, output)
+    print(json.dumps(current['metrics'], ensure_ascii=False, indent=2))
+    print(f"Resultado salvo em: {output}")
+
+    if args.save_baseline:
+        save_json(current, baseline_file)
+        print(f"Baseline salvo em: {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print("Sem baseline para comparar (use --save-baseline para criar um).")
+        return 0
+
+    with open(baseline_file, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    diferentes = [key for key in COMPARABLE_META if baseline['meta'].get(key) != current['meta'].get(key)]
+    if diferentes:
+        print(f"Baseline gerado com outra configuração ({', '.join(diferentes)}), comparação ignorada.")
+        return 0
+    if baseline['meta'].get('platform') != current['meta'].get('platform'):
+        print("Aviso: baseline gerado em outra máquina, os números podem não ser comparáveis.")
+
+    regressions = compare(current, baseline, args.tolerance)
+    for name, old, new, change in regressions:
+        print(f"REGRESSÃO {name}: {old} -> {new} ({change:+.1%})")
+    if regressions:
+        return 1
+    print("Nenhuma regressão em relação ao baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
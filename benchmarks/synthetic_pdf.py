@@ -0,0 +1,127 @@
+import random
+import fitz
+
+# Produtos no estilo do relatório de vendas da Bosch: nome, código e características (texto das imagens)
+PRODUCTS = [
+    ("Furadeira/Parafusadeira a Bateria 12V", "GSR120-LI", ["Luz de LED integrada", "2 baterias de lítio", "Torque de 30 Nm"]),
+    ("Furadeira de Impacto", "GSB 450 RE", ["Função de impacto para concreto", "450W", "Mandril de 13 mm"]),
+    ("Esmerilhadeira Angular", "GWS 700", ["Disco de 115 mm", "700W", "Empunhadura lateral"]),
+    ("Serra Tico-Tico", "GST 650", ["Corte em madeira e metal", "450W", "Base inclinável"]),
+    ("Lixadeira Orbital", "GSS 140", ["Coleta de pó", "220W", "Placa de 1/4"]),
+    ("Martelete Perfurador", "GBH 2-24 D", ["Três funções", "820W", "Sistema SDS plus"]),
+]
+MONTHS = ["Janeiro", "Fevereiro", "Março", "Abril", "Maio", "Junho",
+          "Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+SENTENCES = [
+    "A estratégia comercial do trimestre priorizou a expansão dos canais de revenda.",
+    "O desempenho das vendas recorrentes melhorou após a adoção das ferramentas de CRM.",
+    "Os produtos {produto} e {outro} concentraram a maior parte do crescimento no período.",
+    "O relatório indica que as campanhas regionais reduziram o custo de aquisição de clientes.",
+    "A revisão das práticas de atendimento ao cliente aumentou a taxa de recompra.",
+    "O estoque de {produto} foi ajustado para acompanhar a demanda sazonal.",
+    "As margens ficaram estáveis apesar do aumento do custo logístico.",
+    "A linha profissional respondeu por {percentual}% da receita do mês.",
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+
+
+def product_lines(indice):
+    nome, codigo, caracteristicas = PRODUCTS[indice]
+    return [f"{nome} {codigo}"] + caracteristicas
+
+
+def product_image(indice, width=360, height=160):
+    """
+    PNG de uma "foto" de produto: o texto desenhado é o que o OCR deve reconhecer. A cor do
+    fundo identifica o produto, para o OCR falso dos benchmarks devolver o texto certo.
+    """
+    doc = fitz.open()
+    page = doc.new_page(width=width, height=height)
+    page.draw_rect(page.rect, color=(0.1, 0.3, 0.6), fill=(0.9, (200 + indice * 8) / 255, 1.0), width=3)
+    page.insert_textbox(fitz.Rect(12, 12, width - 12, height - 12), "\n".join(product_lines(indice)), fontsize=13)
+    png = page.get_pixmap(dpi=110).tobytes("png")
+    doc.close()
+    return png
+
+
+def read_product_image(image_bytes):
+    """
+    Linhas do produto desenhado na imagem, lidas pela cor do fundo (o "OCR" sem modelo).
+    """
+    pixmap = fitz.Pixmap(image_bytes)
+    green = pixmap.pixel(pixmap.width // 2, pixmap.height - 8)[1]
+    indice = round((green - 200) / 8)
+    return product_lines(indice) if 0 <= indice < len(PRODUCTS) else []
+
+
+def draw_table(page, top, headers, rows, row_height=18):
+    """
+    Tabela com bordas, para o pdfplumber achar as células pelas linhas.
+    """
+    column_width = (PAGE_WIDTH - 2 * MARGIN) / len(headers)
+    for row_index, row in enumerate([headers] + rows):
+        y = top + row_index * row_height
+        for column_index, value in enumerate(row):
+            x = MARGIN + column_index * column_width
+            rect = fitz.Rect(x, y, x + column_width, y + row_height)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.6)
+            page.insert_text((x + 4, y + row_height - 5), str(value), fontsize=9)
+    return top + (len(rows) + 1) * row_height
+
+
+def generate_report(pages=10, images_per_page=1, table_rows=8, seed=42):
+    """
+    Relatório de vendas sintético: cada página tem parágrafos, uma tabela de vendas
+    (Mês, Produto, Vendas) e imagens de produtos. Devolve (bytes do PDF, resumo), onde o
+    resumo conta páginas, tabelas e imagens.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    images = tables = 0
+
+    for numero in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        produto, outro = rng.sample(PRODUCTS, 2)
+
+        paragrafos = [
+            " ".join(
+                rng.choice(SENTENCES).format(produto=produto[1], outro=outro[1], percentual=rng.randint(10, 60))
+                for _ in range(rng.randint(3, 6))
+            )
+            for _ in range(2)
+        ]
+        page.insert_textbox(fitz.Rect(MARGIN, MARGIN, PAGE_WIDTH - MARGIN, 250),
+                            f"Relatório de Vendas Mensais - página {numero + 1}\n\n" + "\n\n".join(paragrafos),
+                            fontsize=10)
+
+        rows = [
+            [rng.choice(MONTHS), rng.choice(PRODUCTS)[1], str(rng.randint(100, 5000))]
+            for _ in range(table_rows)
+        ]
+        top = draw_table(page, 270, ["Mês", "Produto", "Vendas"], rows)
+        tables += 1
+
+        for posicao in range(images_per_page):
+            y = top + 20 + posicao * 170
+            if y + 160 > PAGE_HEIGHT - MARGIN:
+                break
+            page.insert_image(fitz.Rect(MARGIN, y, MARGIN + 360, y + 160),
+                              stream=product_image(rng.randrange(len(PRODUCTS))))
+            images += 1
+
+    conteudo = doc.tobytes(deflate=True)
+    doc.close()
+    return conteudo, {'pages': pages, 'tables': tables, 'images': images}
+
+
+if __name__ == '__main__':
+    # python benchmarks/synthetic_pdf.py saida.pdf [páginas]
+    import sys
+    destino = sys.argv[1] if len(sys.argv) > 1 else 'relatorio_sintetico.pdf'
+    paginas = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    conteudo, _ = generate_report(paginas)
+    with open(destino, 'wb') as f:
+        f.write(conteudo)
+    print(f"PDF sintético com {paginas} páginas salvo em: {destino}")
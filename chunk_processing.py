@@ -1,112 +1,267 @@
 import os
+import sys
 import json
 import csv
-from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
-directory_text = 'text' 
-directory_table = 'table' 
-directory_img = 'img'  
-chunk_size = 500  
-output_file = 'chunked_data.json' 
+from config import (
+    TEXT_DIR, TABLES_DIR, IMAGES_DIR, CHUNKED_DATA_FILE, CHUNK_SETTINGS, CHUNKING_WORKERS, CHUNKING_MAX_PENDING,
+    PROCESS_START_METHOD
+)
+
+directory_text = TEXT_DIR
+directory_table = TABLES_DIR
+directory_img = IMAGES_DIR
+output_file = CHUNKED_DATA_FILE
+# Arquivos concluídos (um por linha), para retomar uma execução interrompida
+progress_file = CHUNKED_DATA_FILE + '.progress'
+
+# Tipo de chunk, pasta e extensão dos arquivos; a ordem aqui é a ordem de gravação
+FILE_TYPES = (
+    ('text', directory_text, '.txt'),
+    ('table', directory_table, '.csv'),
+    ('image', directory_img, '.png'),
+)
+TYPE_ORDER = {chunk_type: position for position, (chunk_type, _, _) in enumerate(FILE_TYPES)}
+
+
+@lru_cache(maxsize=None)
+def get_splitter(chunk_size, chunk_overlap):
+    # Importado só aqui: o langchain pesa na subida do servidor, que importa este módulo pelo ingestion.py
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=["\n\n", "\n", " "]
+    )
 
 # Função para criar chunks de texto usando LangChain TextSplitter
-def chunk_text_with_langchain(text, chunk_size):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, separators=["\n\n", "\n", " "])
-    chunks = text_splitter.split_text(text)
+def chunk_text_with_langchain(text, chunk_size, chunk_overlap=0):
+    return get_splitter(chunk_size, chunk_overlap).split_text(text)
+
+def page_number(filename):
+    # page_3.txt, page_3_table_2.csv, page_3_image_1.png -> '3'
+    return filename.split('_')[1].split('.')[0] if '_' in filename else 'unknown'
+
+def text_chunks(content, filename, chunk_size, chunk_overlap):
+    return [{
+        'page_content': chunk,
+        'metadata': {
+            'type': 'text',
+            'filename': filename,
+            'page': page_number(filename),
+            'chunk_index': index + 1
+        }
+    } for index, chunk in enumerate(chunk_text_with_langchain(content, chunk_size, chunk_overlap))]
+
+def table_chunks(headers, rows, filename, chunk_size, chunk_overlap):
+    """
+    Uma tabela vira um chunk, ou vários de chunk_size linhas (repetindo o cabeçalho)
+    quando o tamanho é configurado.
+    """
+    metadata = {'type': 'table', 'filename': filename, 'page': page_number(filename)}
+    if not chunk_size or len(rows) <= chunk_size:
+        return [{'page_content': json.dumps({"headers": headers, "rows": rows}), 'metadata': metadata}]
+
+    step = max(1, chunk_size - chunk_overlap)
+    return [{
+        'page_content': json.dumps({"headers": headers, "rows": rows[start:start + chunk_size]}),
+        'metadata': dict(metadata, chunk_index=index + 1)
+    } for index, start in enumerate(range(0, max(len(rows) - chunk_overlap, 1), step))]
+
+def image_chunks(ocr_content, filename, path, chunk_size, chunk_overlap):
+    metadata = {
+        'type': 'image',
+        'filename': filename,
+        'page': page_number(filename),
+        'description': filename.replace('_', ' ').split('.')[0],
+        'path': path
+    }
+    if not chunk_size or len(ocr_content) <= chunk_size:
+        return [{'page_content': ocr_content, 'metadata': metadata}]
+
+    return [{
+        'page_content': chunk,
+        'metadata': dict(metadata, chunk_index=index + 1)
+    } for index, chunk in enumerate(chunk_text_with_langchain(ocr_content, chunk_size, chunk_overlap))]
+
+def chunk_text_file(file_path, chunk_size, chunk_overlap):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    return text_chunks(content, os.path.basename(file_path), chunk_size, chunk_overlap)
+
+def chunk_table_file(file_path, chunk_size, chunk_overlap):
+    with open(file_path, 'r', encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        headers = next(reader, [])
+        rows = [row for row in reader]
+    return table_chunks(headers, rows, os.path.basename(file_path), chunk_size, chunk_overlap)
+
+def chunk_image_file(file_path, chunk_size, chunk_overlap):
+    ocr_file_path = file_path.replace('.png', '_ocr.txt')
+    ocr_content = ""
+    if os.path.exists(ocr_file_path):
+        with open(ocr_file_path, 'r', encoding='utf-8') as ocr_file:
+            ocr_content = ocr_file.read()
+    return image_chunks(ocr_content, os.path.basename(file_path), file_path, chunk_size, chunk_overlap)
+
+CHUNKERS = {'text': chunk_text_file, 'table': chunk_table_file, 'image': chunk_image_file}
+
+def chunk_file(task):
+    """
+    Chunks de um arquivo de origem. Roda nos processos do pool, por isso recebe tudo na tarefa.
+    """
+    doc_id, chunk_type, file_path, (chunk_size, chunk_overlap) = task
+    chunks = CHUNKERS[chunk_type](file_path, chunk_size, chunk_overlap)
+    for chunk in chunks:
+        chunk['metadata']['doc_id'] = doc_id
     return chunks
 
-def process_text_files(directory, chunk_size):
-    chunked_texts = []
-
-    for filename in os.listdir(directory):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(directory, filename)
-            
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-
-            chunks = chunk_text_with_langchain(content, chunk_size)
-
-            page_number = filename.split('_')[1].split('.')[0] if '_' in filename else 'unknown'
-
-            for index, chunk in enumerate(chunks):
-                chunked_texts.append(Document(
-                    page_content=chunk,
-                    metadata={
-                        'type': 'text',
-                        'filename': filename,
-                        'page': page_number,
-                        'chunk_index': index + 1
-                    }
-                ))
-
-    return chunked_texts
-
-def process_table_files(directory):
-    chunked_tables = []
-
-    for filename in os.listdir(directory):
-        if filename.endswith('.csv'):
-            file_path = os.path.join(directory, filename)
-
-            with open(file_path, 'r', encoding='utf-8') as file:
-                reader = csv.reader(file)
-                headers = next(reader)
-                rows = [row for row in reader]
-
-            page_number = filename.split('_')[1] if '_' in filename else 'unknown'
-
-            chunked_tables.append(Document(
-                page_content=json.dumps({"headers": headers, "rows": rows}),
-                metadata={
-                    'type': 'table',
-                    'filename': filename,
-                    'page': page_number
-                }
-            ))
-
-    return chunked_tables
-
-def process_image_files(directory):
-    chunked_images = []
-
-    for filename in os.listdir(directory):
-        if filename.endswith('.png'):
-            file_path = os.path.join(directory, filename)
-
-            page_number = filename.split('_')[1] if '_' in filename else 'unknown'
-            description = filename.replace('_', ' ').split('.')[0]
-
-            ocr_file_path = file_path.replace('.png', '_ocr.txt')
-            ocr_content = ""
-            if os.path.exists(ocr_file_path):
-                with open(ocr_file_path, 'r', encoding='utf-8') as ocr_file:
-                    ocr_content = ocr_file.read()
-
-            chunked_images.append(Document(
-                page_content=ocr_content,
-                metadata={
-                    'type': 'image',
-                    'filename': filename,
-                    'page': page_number,
-                    'description': description,
-                    'path': file_path
-                }
-            ))
-
-    return chunked_images
-
-chunked_texts = process_text_files(directory_text, chunk_size)
-chunked_tables = process_table_files(directory_table)
-chunked_images = process_image_files(directory_img)
-
-all_chunks = chunked_texts + chunked_tables + chunked_images
-
-with open(output_file, 'w', encoding='utf-8') as json_file:
-    json.dump([{
-        'page_content': doc.page_content,
-        'metadata': doc.metadata
-    } for doc in all_chunks], json_file, ensure_ascii=False, indent=4)
-
-print(f"Processamento concluído! Chunks salvos em: {output_file}")
+def list_documents():
+    """
+    Cada PDF enviado fica numa subpasta com o seu doc_id dentro de text/, table/ e img/.
+    """
+    doc_ids = set()
+    for directory in [directory_text, directory_table, directory_img]:
+        if os.path.isdir(directory):
+            doc_ids.update(
+                name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))
+            )
+    return sorted(doc_ids)
+
+def document_files(doc_id, chunk_settings=CHUNK_SETTINGS):
+    """
+    Tarefas (doc_id, tipo, caminho, (tamanho, sobreposição)) de um documento, numa ordem estável.
+    """
+    for chunk_type, directory, extension in FILE_TYPES:
+        directory = os.path.join(directory, doc_id)
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.endswith(extension):
+                yield doc_id, chunk_type, os.path.join(directory, filename), chunk_settings[chunk_type]
+
+def task_key(task):
+    # Posição do arquivo na ordem de gravação: documento, tipo e nome
+    doc_id, chunk_type, file_path, _ = task
+    return doc_id, TYPE_ORDER[chunk_type], os.path.basename(file_path)
+
+def iter_chunked_files(tasks, workers=CHUNKING_WORKERS, max_pending=CHUNKING_MAX_PENDING):
+    """
+    Gera (tarefa, chunks) na ordem das tarefas, processando os arquivos em paralelo. No máximo
+    max_pending arquivos ficam em andamento ou esperando gravação, então a memória não cresce
+    com o tamanho do corpus.
+    """
+    if workers <= 1:
+        for task in tasks:
+            yield task, chunk_file(task)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append((task, pool.submit(chunk_file, task)))
+            if len(pending) >= max(1, max_pending):
+                done, future = pending.popleft()
+                yield done, future.result()
+        while pending:
+            done, future = pending.popleft()
+            yield done, future.result()
+
+def process_document(doc_id, chunk_settings=CHUNK_SETTINGS, workers=1):
+    """
+    Gera os chunks de um único documento, no mesmo formato das linhas de chunked_data.jsonl.
+    """
+    return [
+        chunk
+        for _, chunks in iter_chunked_files(document_files(doc_id, chunk_settings), workers)
+        for chunk in chunks
+    ]
+
+def _read_progress(path):
+    """
+    Progresso salvo: a primeira linha tem a configuração e cada linha seguinte um arquivo
+    concluído, com o tamanho da saída depois dele. Uma linha cortada no fim (interrupção no meio
+    da gravação) é ignorada. None se não há progresso ou se ele é do formato antigo.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError):
+        return None
+    if 'last_file' in header:
+        return None
+
+    progress = {'settings': header.get('settings'), 'done': set(), 'offset': 0, 'files': 0, 'chunks': 0}
+    for line in lines[1:]:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            break
+        progress['done'].add(tuple(entry['file']))
+        progress.update(offset=entry['offset'], files=progress['files'] + 1, chunks=progress['chunks'] + entry['chunks'])
+    return progress
+
+def _start_progress(path, settings):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'settings': settings}) + "\n")
+    os.replace(tmp_path, path)
+    return {'settings': settings, 'done': set(), 'offset': 0, 'files': 0, 'chunks': 0}
+
+def write_chunks(output_file=output_file, progress_file=progress_file, resume=True,
+                 chunk_settings=CHUNK_SETTINGS, workers=CHUNKING_WORKERS, max_pending=CHUNKING_MAX_PENDING):
+    """
+    Grava os chunks de todos os documentos em JSONL, arquivo de origem por arquivo de origem,
+    à medida que ficam prontos. Cada arquivo concluído é anotado no progresso; com resume=True
+    uma execução interrompida pula só os arquivos já concluídos (os novos entram no fim) e
+    recomeça do início se a configuração mudou ou se um arquivo concluído deixou de existir.
+    """
+    settings = {chunk_type: list(values) for chunk_type, values in chunk_settings.items()}
+    progress = _read_progress(progress_file) if resume and os.path.exists(output_file) else None
+    if progress and progress['settings'] != settings:
+        print("Configuração de chunks mudou, recomeçando do início.")
+        progress = None
+
+    tasks = [task for doc_id in list_documents() for task in document_files(doc_id, chunk_settings)]
+    if progress and not progress['done'] <= {task_key(task) for task in tasks}:
+        # Os chunks de arquivos removidos já estão na saída
+        print("Arquivos de origem mudaram, recomeçando do início.")
+        progress = None
+    if progress:
+        tasks = [task for task in tasks if task_key(task) not in progress['done']]
+        print(f"Retomando: {progress['files']} arquivos e {progress['chunks']} chunks já gravados, "
+              f"{len(tasks)} arquivos restantes")
+    else:
+        progress = _start_progress(progress_file, settings)
+
+    with open(output_file, 'r+b' if progress['offset'] else 'wb') as out, \
+            open(progress_file, 'a', encoding='utf-8') as journal:
+        # Descarta o que foi gravado depois do último arquivo concluído
+        out.truncate(progress['offset'])
+        out.seek(progress['offset'])
+        for task, chunks in iter_chunked_files(tasks, workers, max_pending):
+            out.write("".join(
+                # JSON compacto: é só a entrada do generate_embeddings.py, as consultas leem o chunks.sqlite
+                json.dumps(chunk, ensure_ascii=False, separators=(',', ':')) + "\n" for chunk in chunks
+            ).encode('utf-8'))
+            out.flush()
+            progress['done'].add(task_key(task))
+            progress.update(offset=out.tell(), files=progress['files'] + 1, chunks=progress['chunks'] + len(chunks))
+            # Uma linha por arquivo: o progresso não é reescrito inteiro a cada arquivo
+            journal.write(json.dumps({'file': task_key(task), 'offset': progress['offset'], 'chunks': len(chunks)}) + "\n")
+            journal.flush()
+
+    if os.path.exists(progress_file):
+        os.remove(progress_file)
+    return progress
+
+if __name__ == '__main__':
+    # python chunk_processing.py [--restart]  (--restart ignora o progresso salvo)
+    resultado = write_chunks(resume='--restart' not in sys.argv)
+    print(f"Processamento concluído! {resultado['chunks']} chunks de {resultado['files']} arquivos "
+          f"salvos em: {output_file}")
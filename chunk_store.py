@@ -0,0 +1,628 @@
+import glob
+import json
+import os
+import sqlite3
+import sys
+import threading
+import numpy as np
+
+from config import CHUNK_DB_FILE, VECTORS_FILE, VECTOR_DTYPE, VECTORS_COMPACT_RATIO, PAGE_INDEX
+import keyword_index
+import metrics
+
+# Linhas copiadas por vez na compactação (sem carregar a matriz inteira)
+COMPACT_BATCH_ROWS = 4096
+
+
+def vectors_path(vectors_file, generation):
+    """
+    Arquivo de uma geração dos vetores (vectors.bin -> vectors.3.bin). A geração muda quando o
+    arquivo é reescrito (compactação ou reconstrução); os acréscimos ficam na mesma geração.
+    """
+    root, ext = os.path.splitext(vectors_file)
+    return f"{root}.{generation}{ext}"
+
+
+def write_rows(path, vectors, dtype, start_row=0):
+    """
+    Grava as linhas (sem cabeçalho) a partir de start_row e corta o que houver depois: sobras
+    de uma gravação interrompida, que o banco nunca chegou a registrar. As linhas anteriores
+    não são tocadas, então quem já mapeou o arquivo continua lendo.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=dtype)
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(start_row * vectors.shape[1] * vectors.itemsize)
+        f.write(vectors.tobytes())
+        f.truncate()
+
+
+def map_rows(path, dtype, rows, dimension):
+    """
+    Abre as rows primeiras linhas em modo memory-map: só as linhas consultadas são lidas do disco.
+    """
+    if not rows:
+        return np.zeros((0, dimension), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(rows, dimension))
+
+
+def build_pages(chunks, vectors, start_id=0):
+    """
+    Agrupa os chunks de texto e de imagem por página (doc_id, page). Cada página guarda os
+    IDs dos seus chunks e um embedding médio (normalizado) dos textos e do OCR das imagens.
+    """
+    groups = {}
+    for row, chunk in enumerate(chunks):
+        metadata = chunk.get('metadata', {})
+        chunk_type = metadata.get('type')
+        if chunk_type not in ('text', 'image'):
+            continue
+        page = metadata.get('page')
+        group = groups.setdefault(
+            (metadata.get('doc_id'), None if page is None else str(page)),
+            {'text_ids': [], 'image_ids': [], 'rows': []}
+        )
+        group[f'{chunk_type}_ids'].append(chunk['id'])
+        group['rows'].append(row)
+
+    pages = []
+    for offset, ((doc_id, page), group) in enumerate(groups.items()):
+        page_vectors = np.asarray(vectors[group['rows']], dtype=np.float32)
+        page_vectors = page_vectors / np.maximum(np.linalg.norm(page_vectors, axis=1, keepdims=True), 1e-12)
+        pooled = page_vectors.mean(axis=0)
+        pooled = pooled / max(float(np.linalg.norm(pooled)), 1e-12)
+        pages.append({
+            'id': start_id + offset, 'doc_id': doc_id, 'page': page,
+            'text_ids': group['text_ids'], 'image_ids': group['image_ids'], 'vector': pooled,
+        })
+    return pages
+
+
+class ChunkStore:
+    """
+    Chunks em SQLite (texto e metadados, com índices por tipo, documento e página) e
+    vetores num arquivo binário mapeado em memória, só com acréscimos no fim (o número de
+    linhas, a dimensão e a geração do arquivo ficam na tabela meta). Funciona como um dicionário {id: chunk}
+    somente leitura, mas cada consulta busca só as linhas pedidas. O índice invertido
+    (BM25) e o índice de páginas (página -> chunks, embedding médio) moram no mesmo banco
+    e são atualizados junto com os chunks.
+    """
+
+    def __init__(self, db_file=CHUNK_DB_FILE, vectors_file=VECTORS_FILE, vector_dtype=VECTOR_DTYPE,
+                 compact_ratio=VECTORS_COMPACT_RATIO):
+        self.db_file = db_file
+        self.vectors_file = vectors_file
+        self.vector_dtype = vector_dtype
+        self.compact_ratio = compact_ratio
+        self._local = threading.local()
+        # ((geração, linhas), matriz mapeada): trocado inteiro, sem travar as leituras
+        self._mapped = None
+        self._map_lock = threading.Lock()
+        self._create_tables(self._conn())
+        self._index_missing_keywords()
+        self._index_missing_pages()
+
+    @staticmethod
+    def exists(db_file=CHUNK_DB_FILE):
+        return os.path.exists(db_file)
+
+    def _conn(self):
+        # Uma conexão por thread: as perguntas do Flask leem em paralelo
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file)
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _create_tables(conn):
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS chunks (id INTEGER PRIMARY KEY, doc_id TEXT, type TEXT, page TEXT, "
+            "page_content TEXT, metadata TEXT, row INTEGER);"
+            "CREATE INDEX IF NOT EXISTS chunks_type ON chunks (type);"
+            "CREATE INDEX IF NOT EXISTS chunks_doc ON chunks (doc_id);"
+            "CREATE INDEX IF NOT EXISTS chunks_page ON chunks (doc_id, page);"
+            "CREATE TABLE IF NOT EXISTS documents (doc_id TEXT PRIMARY KEY, filename TEXT);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+            "CREATE TABLE IF NOT EXISTS pages (id INTEGER PRIMARY KEY, doc_id TEXT, page TEXT, "
+            "text_ids TEXT, image_ids TEXT, vector BLOB);"
+            "CREATE INDEX IF NOT EXISTS pages_key ON pages (doc_id, page);"
+        )
+        keyword_index.create_tables(conn)
+        conn.commit()
+
+    def _index_missing_keywords(self):
+        # Bancos criados antes do índice invertido: indexa tudo uma vez
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM doc_lengths LIMIT 1").fetchone() is None and len(self):
+            keyword_index.index_chunks(conn, self.values())
+            conn.commit()
+
+    @staticmethod
+    def _row_to_chunk(row):
+        chunk_id, page_content, metadata = row
+        return {'id': chunk_id, 'page_content': page_content, 'metadata': json.loads(metadata)}
+
+    def _index_missing_pages(self):
+        # Bancos criados antes do índice de páginas: monta as páginas com os vetores já salvos
+        conn = self._conn()
+        matrix = self.matrix
+        if conn.execute("SELECT 1 FROM pages LIMIT 1").fetchone() is not None or matrix is None or not len(self):
+            return
+        chunks = self.values()
+        rows = dict(conn.execute("SELECT id, row FROM chunks").fetchall())
+        self._insert_pages(conn, build_pages(chunks, matrix[[rows[chunk['id']] for chunk in chunks]]))
+        conn.commit()
+
+    # Arquivo de vetores
+
+    @staticmethod
+    def _layout(conn):
+        """
+        {'generation', 'rows', 'dimension', 'dtype'} do arquivo de vetores (None sem vetores).
+        """
+        meta = dict(conn.execute("SELECT key, value FROM meta WHERE key LIKE 'vector_%'").fetchall())
+        if 'vector_generation' not in meta:
+            return None
+        return {
+            'generation': int(meta['vector_generation']), 'rows': int(meta['vector_rows']),
+            'dimension': int(meta['vector_dimension']), 'dtype': meta['vector_dtype'],
+        }
+
+    @staticmethod
+    def _set_layout(conn, layout):
+        conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(f'vector_{key}', str(value)) for key, value in layout.items()]
+        )
+
+    def _matrix(self, layout):
+        """
+        Matriz mapeada com pelo menos as linhas de layout. Só abre o arquivo de novo quando a
+        geração muda ou quando outra escrita acrescentou linhas além das mapeadas.
+        """
+        mapped = self._mapped
+        if mapped is None or mapped[0][0] != layout['generation'] or mapped[0][1] < layout['rows']:
+            with self._map_lock:
+                mapped = self._mapped
+                if mapped is None or mapped[0][0] != layout['generation'] or mapped[0][1] < layout['rows']:
+                    matrix = map_rows(vectors_path(self.vectors_file, layout['generation']), layout['dtype'],
+                                      layout['rows'], layout['dimension'])
+                    mapped = ((layout['generation'], layout['rows']), matrix)
+                    self._mapped = mapped
+        return mapped[1]
+
+    @property
+    def matrix(self):
+        """
+        Matriz com todas as linhas registradas no banco (None sem vetores).
+        """
+        layout = self._layout(self._conn())
+        return None if layout is None else self._matrix(layout)
+
+    def _remove_old_generations(self, generation):
+        # Mantém a geração anterior para quem leu o banco antes da troca e ainda vai abrir o arquivo
+        root, ext = os.path.splitext(self.vectors_file)
+        for path in glob.glob(f"{glob.escape(root)}.*{ext}"):
+            middle = path[len(root) + 1:len(path) - len(ext)]
+            if middle.isdigit() and int(middle) < generation - 1:
+                os.remove(path)
+
+    # Leitura (interface de dicionário)
+
+    def __getitem__(self, chunk_id):
+        row = self._conn().execute(
+            "SELECT id, page_content, metadata FROM chunks WHERE id = ?", (int(chunk_id),)
+        ).fetchone()
+        if row is None:
+            raise KeyError(chunk_id)
+        return self._row_to_chunk(row)
+
+    def get(self, chunk_id, default=None):
+        try:
+            return self[chunk_id]
+        except KeyError:
+            return default
+
+    def get_many(self, chunk_ids):
+        """
+        Chunks dos IDs pedidos, na mesma ordem. IDs que não existem mais são ignorados.
+        """
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        found = {}
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn().execute(
+                f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({placeholders})", batch
+            )
+            found.update((row[0], self._row_to_chunk(row)) for row in rows)
+        return [found[chunk_id] for chunk_id in chunk_ids if chunk_id in found]
+
+    def __contains__(self, chunk_id):
+        return self._conn().execute("SELECT 1 FROM chunks WHERE id = ?", (int(chunk_id),)).fetchone() is not None
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def __iter__(self):
+        return (row[0] for row in self._conn().execute("SELECT id FROM chunks ORDER BY id").fetchall())
+
+    def keys(self):
+        return list(iter(self))
+
+    def items(self):
+        rows = self._conn().execute("SELECT id, page_content, metadata FROM chunks ORDER BY id").fetchall()
+        return [(row[0], self._row_to_chunk(row)) for row in rows]
+
+    def values(self):
+        return [chunk for _, chunk in self.items()]
+
+    def by_type(self, chunk_type):
+        rows = self._conn().execute(
+            "SELECT id, page_content, metadata FROM chunks WHERE type = ? ORDER BY id", (chunk_type,)
+        ).fetchall()
+        return [(row[0], self._row_to_chunk(row)) for row in rows]
+
+    def by_pages(self, chunk_type, page_keys):
+        """
+        Chunks de um tipo que estão nas páginas (doc_id, page) pedidas.
+        """
+        results = []
+        for doc_id, page in page_keys:
+            rows = self._conn().execute(
+                "SELECT id, page_content, metadata FROM chunks WHERE doc_id IS ? AND page IS ? AND type = ? "
+                "ORDER BY id", (doc_id, None if page is None else str(page), chunk_type)
+            )
+            results.extend((row[0], self._row_to_chunk(row)) for row in rows)
+        return sorted(results, key=lambda item: item[0])
+
+    def document_chunk_ids(self, doc_id):
+        return [row[0] for row in self._conn().execute(
+            "SELECT id FROM chunks WHERE doc_id = ? ORDER BY id", (doc_id,)
+        )]
+
+    def document_ids(self):
+        """
+        IDs de todos os documentos com chunks; None representa os chunks sem documento
+        (corpora de antes do doc_id).
+        """
+        return [row[0] for row in self._conn().execute(
+            "SELECT DISTINCT doc_id FROM chunks ORDER BY doc_id IS NOT NULL, doc_id"
+        )]
+
+    def document_vector_ids(self, doc_id):
+        """
+        {tipo: [IDs]} de um documento em cada índice: os chunks por tipo e as páginas em 'page'.
+        """
+        conn = self._conn()
+        ids = {}
+        for chunk_id, chunk_type in conn.execute(
+            "SELECT id, type FROM chunks WHERE doc_id IS ? ORDER BY id", (doc_id,)
+        ):
+            ids.setdefault(chunk_type, []).append(chunk_id)
+        page_ids = [row[0] for row in conn.execute("SELECT id FROM pages WHERE doc_id IS ? ORDER BY id", (doc_id,))]
+        if page_ids:
+            ids[PAGE_INDEX] = page_ids
+        return ids
+
+    def documents(self):
+        """
+        Registro de documentos: {doc_id: {'filename', 'chunk_ids'}}.
+        """
+        conn = self._conn()
+        documents = {
+            doc_id: {'filename': filename, 'chunk_ids': []}
+            for doc_id, filename in conn.execute("SELECT doc_id, filename FROM documents")
+        }
+        for chunk_id, doc_id in conn.execute("SELECT id, doc_id FROM chunks WHERE doc_id IS NOT NULL ORDER BY id"):
+            documents.setdefault(doc_id, {'filename': None, 'chunk_ids': []})['chunk_ids'].append(chunk_id)
+        return documents
+
+    def document_filenames(self, doc_ids):
+        """
+        Nome do PDF de cada doc_id pedido que tem um registrado.
+        """
+        conn = self._conn()
+        filenames = {}
+        for doc_id in set(doc_ids) - {None}:
+            row = conn.execute("SELECT filename FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row and row[0]:
+                filenames[doc_id] = row[0]
+        return filenames
+
+    def has_document(self, doc_id):
+        conn = self._conn()
+        return (conn.execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+                or conn.execute("SELECT 1 FROM chunks WHERE doc_id = ? LIMIT 1", (doc_id,)).fetchone() is not None)
+
+    @property
+    def next_chunk_id(self):
+        conn = self._conn()
+        row = conn.execute("SELECT value FROM meta WHERE key = 'next_chunk_id'").fetchone()
+        max_id = conn.execute("SELECT MAX(id) FROM chunks").fetchone()[0]
+        return max(int(row[0]) if row else 0, max_id + 1 if max_id is not None else 0)
+
+    # Páginas
+
+    @staticmethod
+    def _insert_pages(conn, pages):
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages (id, doc_id, page, text_ids, image_ids, vector) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (page['id'], page['doc_id'], page['page'], json.dumps(page['text_ids']),
+                 json.dumps(page['image_ids']), np.asarray(page['vector'], dtype=np.float32).tobytes())
+                for page in pages
+            ]
+        )
+
+    @property
+    def next_page_id(self):
+        max_id = self._conn().execute("SELECT MAX(id) FROM pages").fetchone()[0]
+        return 0 if max_id is None else max_id + 1
+
+    def pages(self, page_ids):
+        """
+        {page_id: {'doc_id', 'page', 'text_ids', 'image_ids'}} pela chave primária, sem varrer chunks.
+        """
+        page_ids = [int(page_id) for page_id in page_ids]
+        found = {}
+        for start in range(0, len(page_ids), 500):
+            batch = page_ids[start:start + 500]
+            rows = self._conn().execute(
+                f"SELECT id, doc_id, page, text_ids, image_ids FROM pages WHERE id IN ({','.join('?' * len(batch))})",
+                batch
+            )
+            for page_id, doc_id, page, text_ids, image_ids in rows:
+                found[page_id] = {'doc_id': doc_id, 'page': page,
+                                  'text_ids': json.loads(text_ids), 'image_ids': json.loads(image_ids)}
+        return found
+
+    def page_ids_for(self, page_keys):
+        """
+        IDs das páginas (doc_id, page), na ordem pedida.
+        """
+        page_ids = []
+        for doc_id, page in page_keys:
+            row = self._conn().execute(
+                "SELECT MAX(id) FROM pages WHERE doc_id IS ? AND page IS ?", (doc_id, None if page is None else str(page))
+            ).fetchone()
+            if row[0] is not None and row[0] not in page_ids:
+                page_ids.append(row[0])
+        return page_ids
+
+    def all_page_ids(self):
+        return [row[0] for row in self._conn().execute("SELECT id FROM pages ORDER BY id")]
+
+    def document_page_ids(self, doc_id):
+        return [row[0] for row in self._conn().execute("SELECT id FROM pages WHERE doc_id = ? ORDER BY id", (doc_id,))]
+
+    def page_vectors(self, page_ids):
+        page_ids = [int(page_id) for page_id in page_ids]
+        vectors = {}
+        for start in range(0, len(page_ids), 500):
+            batch = page_ids[start:start + 500]
+            vectors.update(
+                (page_id, np.frombuffer(vector, dtype=np.float32))
+                for page_id, vector in self._conn().execute(
+                    f"SELECT id, vector FROM pages WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+            )
+        return np.vstack([vectors[page_id] for page_id in page_ids])
+
+    def keyword_search(self, query, top_k=10, chunk_type=None):
+        """
+        [(chunk_id, score BM25)] dos chunks que contêm os termos da pergunta.
+        """
+        with metrics.span("keyword_search", k=top_k) as span:
+            results = keyword_index.search(self._conn(), query, top_k, chunk_type)
+            span["results"] = len(results)
+        return results
+
+    def _vector_rows(self, chunk_ids):
+        # Linhas e layout lidos na mesma transação: uma compactação não fica pela metade entre os dois
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            layout = self._layout(conn)
+            rows = {}
+            for start in range(0, len(chunk_ids), 500):
+                batch = chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(conn.execute(f"SELECT id, row FROM chunks WHERE id IN ({placeholders})", batch).fetchall())
+        finally:
+            conn.rollback()
+        return rows, layout
+
+    def vectors(self, chunk_ids):
+        """
+        Vetores (float32) dos chunks pedidos, lidos do arquivo mapeado.
+        """
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        for attempt in range(2):
+            rows, layout = self._vector_rows(chunk_ids)
+            missing = [chunk_id for chunk_id in chunk_ids if rows.get(chunk_id) is None]
+            if missing or layout is None:
+                raise KeyError(f"Vetores não encontrados para os chunks {missing[:10]}")
+            try:
+                matrix = self._matrix(layout)
+            except FileNotFoundError:
+                # Outro processo compactou duas vezes entre a leitura do banco e a abertura do arquivo
+                if attempt:
+                    raise
+                continue
+            return np.asarray(matrix[[rows[chunk_id] for chunk_id in chunk_ids]], dtype=np.float32)
+
+    # Escrita
+
+    @staticmethod
+    def _chunk_row(chunk, row):
+        metadata = chunk.get('metadata', {})
+        page = metadata.get('page')
+        return (
+            chunk['id'], metadata.get('doc_id'), metadata.get('type'), None if page is None else str(page),
+            chunk.get('page_content', ''), json.dumps(metadata, ensure_ascii=False), row
+        )
+
+    def add(self, chunks, vectors, doc_id=None, filename=None, pages=()):
+        """
+        Acrescenta chunks (já com 'id'), seus vetores e as páginas. Os vetores vão para o fim
+        do arquivo, sem reescrever as linhas existentes; o banco só registra as linhas novas
+        (e o novo total) depois que elas estão no disco.
+        """
+        conn = self._conn()
+        layout = self._layout(conn)
+        if len(chunks):
+            vectors = np.asarray(vectors).reshape(len(chunks), -1)
+            if layout is None:
+                layout = {'generation': 1, 'rows': 0, 'dimension': vectors.shape[1],
+                          'dtype': np.dtype(self.vector_dtype).name}
+            if vectors.shape[1] != layout['dimension']:
+                raise ValueError(f"Vetores com dimensão {vectors.shape[1]}, o armazenamento usa {layout['dimension']}")
+            write_rows(vectors_path(self.vectors_file, layout['generation']), vectors, layout['dtype'], layout['rows'])
+        start = layout['rows'] if layout else 0
+
+        conn.executemany(
+            "INSERT OR REPLACE INTO chunks (id, doc_id, type, page, page_content, metadata, row) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._chunk_row(chunk, start + offset) for offset, chunk in enumerate(chunks)]
+        )
+        keyword_index.index_chunks(conn, chunks)
+        self._insert_pages(conn, pages)
+        if doc_id is not None and chunks:
+            conn.execute("INSERT OR REPLACE INTO documents (doc_id, filename) VALUES (?, ?)", (doc_id, filename))
+        if chunks:
+            self._set_layout(conn, dict(layout, rows=start + len(chunks)))
+            next_id = max(chunk['id'] for chunk in chunks) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('next_chunk_id', ?)",
+                (str(max(next_id, self.next_chunk_id)),)
+            )
+        conn.commit()
+
+    def delete(self, chunk_ids, doc_id=None, page_ids=()):
+        """
+        Apaga chunks e páginas por ID (e o registro do documento). As linhas dos vetores
+        ficam órfãs no arquivo até passarem de compact_ratio do total; aí ele é compactado.
+        """
+        conn = self._conn()
+        chunk_ids = [int(chunk_id) for chunk_id in chunk_ids]
+        page_ids = [int(page_id) for page_id in page_ids]
+        for start in range(0, len(page_ids), 500):
+            batch = page_ids[start:start + 500]
+            conn.execute(f"DELETE FROM pages WHERE id IN ({','.join('?' * len(batch))})", batch)
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start:start + 500]
+            conn.execute(f"DELETE FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch)
+        keyword_index.delete_chunks(conn, chunk_ids)
+        if doc_id is not None:
+            conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,))
+        conn.commit()
+
+        if self.orphan_rows() > self.compact_ratio * (self._layout(conn) or {}).get('rows', 0):
+            self.compact()
+
+    def orphan_rows(self):
+        """
+        Linhas do arquivo de vetores que não pertencem a nenhum chunk (documentos removidos).
+        """
+        conn = self._conn()
+        layout = self._layout(conn)
+        return 0 if layout is None else layout['rows'] - len(self)
+
+    def compact(self):
+        """
+        Reescreve os vetores numa geração nova só com as linhas dos chunks existentes, na ordem
+        dos IDs, e troca as linhas do banco e a geração numa transação só. Quem já mapeou a
+        geração anterior continua lendo dela. Devolve quantas linhas foram descartadas.
+        """
+        conn = self._conn()
+        layout = self._layout(conn)
+        if layout is None:
+            return 0
+        with metrics.span("vectors_compact", rows=layout['rows']) as span:
+            live = conn.execute("SELECT id, row FROM chunks ORDER BY id").fetchall()
+            old = self._matrix(layout)
+            generation = layout['generation'] + 1
+            with open(vectors_path(self.vectors_file, generation), 'wb') as f:
+                for start in range(0, len(live), COMPACT_BATCH_ROWS):
+                    rows = [row for _, row in live[start:start + COMPACT_BATCH_ROWS]]
+                    f.write(np.ascontiguousarray(old[rows], dtype=layout['dtype']).tobytes())
+
+            conn.executemany(
+                "UPDATE chunks SET row = ? WHERE id = ?",
+                [(new_row, chunk_id) for new_row, (chunk_id, _) in enumerate(live)]
+            )
+            self._set_layout(conn, dict(layout, generation=generation, rows=len(live)))
+            conn.commit()
+            span['removed'] = layout['rows'] - len(live)
+        self._remove_old_generations(generation)
+        print(f"Vetores compactados: {layout['rows']} -> {len(live)} linhas")
+        return layout['rows'] - len(live)
+
+    @classmethod
+    def write(cls, chunks, vectors, filenames=None, db_file=CHUNK_DB_FILE, vectors_file=VECTORS_FILE,
+              vector_dtype=VECTOR_DTYPE, pages=None):
+        """
+        Cria o armazenamento do zero (reconstrução completa), com a linha da matriz igual à
+        posição do chunk. O banco é montado ao lado e trocado por rename no final.
+        """
+        filenames = filenames or {}
+        tmp_db = db_file + '.tmp'
+        if os.path.exists(tmp_db):
+            os.remove(tmp_db)
+
+        # Geração nova: os processos com o banco antigo aberto continuam lendo a geração anterior
+        generation = 1
+        if os.path.exists(db_file):
+            old_conn = sqlite3.connect(db_file)
+            try:
+                cls._create_tables(old_conn)
+                layout = cls._layout(old_conn)
+            finally:
+                old_conn.close()
+            generation = layout['generation'] + 1 if layout else 1
+
+        conn = sqlite3.connect(tmp_db)
+        cls._create_tables(conn)
+        conn.executemany(
+            "INSERT INTO chunks (id, doc_id, type, page, page_content, metadata, row) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [cls._chunk_row(chunk, row) for row, chunk in enumerate(chunks)]
+        )
+        keyword_index.index_chunks(conn, chunks)
+        cls._insert_pages(conn, pages if pages is not None else build_pages(chunks, vectors))
+        doc_ids = {chunk.get('metadata', {}).get('doc_id') for chunk in chunks} - {None}
+        conn.executemany(
+            "INSERT INTO documents (doc_id, filename) VALUES (?, ?)",
+            [(doc_id, filenames.get(doc_id)) for doc_id in sorted(doc_ids)]
+        )
+        next_id = max((chunk['id'] for chunk in chunks), default=-1) + 1
+        conn.execute("INSERT INTO meta (key, value) VALUES ('next_chunk_id', ?)", (str(next_id),))
+        if len(chunks):
+            vectors = np.asarray(vectors).reshape(len(chunks), -1)
+            dtype = np.dtype(vector_dtype).name
+            write_rows(vectors_path(vectors_file, generation), vectors, dtype)
+            cls._set_layout(conn, {'generation': generation, 'rows': len(chunks),
+                                   'dimension': vectors.shape[1], 'dtype': dtype})
+        conn.commit()
+        conn.close()
+
+        os.replace(tmp_db, db_file)
+        store = cls(db_file, vectors_file, vector_dtype)
+        store._remove_old_generations(generation)
+        return store
+
+
+if __name__ == '__main__':
+    # Migra os arquivos JSON antigos para o armazenamento binário: python chunk_store.py migrate
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Uso: python chunk_store.py migrate")
+        sys.exit(1)
+
+    from config import EMBEDDING_MODEL
+    from document_index import DocumentIndex
+    from model_registry import embedding_model
+
+    # Mesmo carregamento do servidor: o backend configurado (torch ou onnx), com a variante real
+    documents = DocumentIndex(lambda: embedding_model(EMBEDDING_MODEL))
+    store = documents.migrate_json()
+    print(f"Migração concluída: {len(store)} chunks em {store.db_file}, vetores em {store.vectors_file}")
@@ -0,0 +1,164 @@
+import os
+
+# Configurações compartilhadas entre a ingestão (generate_embeddings.py) e as consultas
+# (generate_response.py, query_engine.py). Os dois lados precisam concordar no modelo
+# e nos arquivos, senão a busca compara vetores de espaços diferentes.
+
+# Saída do chunk_processing.py: um chunk JSON por linha, gravado à medida que os arquivos ficam prontos
+CHUNKED_DATA_FILE = 'chunked_data.jsonl'
+
+# Tamanho e sobreposição dos chunks por tipo. Texto e OCR das imagens em caracteres; tabelas
+# em linhas. Tamanho 0 mantém a tabela (ou o OCR da imagem) inteira num chunk só
+CHUNK_SETTINGS = {
+    'text': (int(os.environ.get('CHUNK_SIZE_TEXT', 500)), int(os.environ.get('CHUNK_OVERLAP_TEXT', 200))),
+    'table': (int(os.environ.get('CHUNK_SIZE_TABLE', 0)), int(os.environ.get('CHUNK_OVERLAP_TABLE', 0))),
+    'image': (int(os.environ.get('CHUNK_SIZE_IMAGE', 0)), int(os.environ.get('CHUNK_OVERLAP_IMAGE', 0))),
+}
+# Processos do chunking e quantos arquivos podem estar em andamento ou esperando gravação
+CHUNKING_WORKERS = int(os.environ.get('CHUNKING_WORKERS', os.cpu_count() or 1))
+CHUNKING_MAX_PENDING = int(os.environ.get('CHUNKING_MAX_PENDING', 4 * CHUNKING_WORKERS))
+
+# Armazenamento dos chunks consultados: texto e metadados em SQLite, vetores num arquivo binário
+# mapeado em memória (float16 reduz o arquivo pela metade com perda pequena de precisão). Os
+# documentos novos só acrescentam linhas no fim do arquivo; quando as linhas de documentos
+# removidos passam de VECTORS_COMPACT_RATIO do arquivo, ele é reescrito só com as linhas em uso
+CHUNK_DB_FILE = 'chunks.sqlite'
+VECTORS_FILE = 'vectors.bin'
+VECTOR_DTYPE = os.environ.get('VECTOR_DTYPE', 'float32')
+VECTORS_COMPACT_RATIO = float(os.environ.get('VECTORS_COMPACT_RATIO', 0.25))
+
+# Arquivos JSON antigos, lidos apenas na migração (python chunk_store.py migrate)
+LEGACY_CHUNKED_DATA_FILE = 'chunked_data.json'
+DOCUMENTS_FILE = 'documents.json'
+METADATA_FILE = 'embeddings_with_metadata.json'
+
+EMBEDDING_MODEL = 'paraphrase-multilingual-MiniLM-L12-v2'
+EMBEDDING_BATCH_SIZE = 256
+
+# Backend dos embeddings: 'torch' (SentenceTransformer) ou 'onnx' (modelo exportado para o
+# onnxruntime, com o grafo otimizado e, com EMBEDDING_QUANTIZE=1, pesos int8). Sem o optimum
+# e o onnxruntime instalados volta para o SentenceTransformer. EMBEDDING_THREADS: threads de
+# inferência (0 usa o padrão do runtime); EMBEDDING_MAX_BATCH_TOKENS limita linhas x tokens
+# de cada lote do ONNX
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch')
+EMBEDDING_QUANTIZE = os.environ.get('EMBEDDING_QUANTIZE', '0') == '1'
+EMBEDDING_THREADS = int(os.environ.get('EMBEDDING_THREADS', '0'))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.environ.get('EMBEDDING_MAX_BATCH_TOKENS', '8192'))
+ONNX_MODELS_DIR = 'onnx_models'
+
+# Cache de embeddings (chave: hash do modelo + texto) e registro de qual modelo gerou os índices
+EMBEDDING_CACHE_FILE = 'embedding_cache.sqlite'
+INDEX_INFO_FILE = 'index_info.json'
+
+CHUNK_TYPES = ('text', 'table', 'image')
+
+# Um sub-índice por tipo de chunk; os IDs de cada índice são os 'id' dos chunks em chunks.sqlite.
+# O índice 'page' guarda o embedding médio de cada página (IDs da tabela pages), usado nas
+# perguntas sobre imagens
+PAGE_INDEX = 'page'
+FAISS_INDEX_FILES = {
+    kind: f'faiss_index_{kind}.faiss' for kind in CHUNK_TYPES + (PAGE_INDEX,)
+}
+
+# Tabelas dos PDFs em SQLite com colunas tipadas; colunas inteiras com poucos valores
+# distintos (ex.: Ano) também servem de agrupamento
+TABLE_DB_FILE = 'tables.sqlite'
+TABLE_CATEGORY_MAX_DISTINCT = int(os.environ.get('TABLE_CATEGORY_MAX_DISTINCT', 50))
+
+IMAGES_DIR = 'img'
+TEXT_DIR = 'text'
+TABLES_DIR = 'table'
+
+# Extração paralela de páginas no /process (quantidade de processos e páginas por tarefa)
+EXTRACTION_WORKERS = int(os.environ.get('EXTRACTION_WORKERS', os.cpu_count() or 1))
+PAGES_PER_TASK = int(os.environ.get('PAGES_PER_TASK', 8))
+
+# Como os pools de processos (extração, OCR, chunking) criam os workers. O fork do processo do
+# Flask, que já tem threads do OpenMP (FAISS) e do torch, pode travar no filho; 'forkserver'
+# cria os workers a partir de um processo limpo ('spawn' também serve, mais lento para subir)
+PROCESS_START_METHOD = os.environ.get('PROCESS_START_METHOD', 'forkserver')
+
+# Ingestão em memória no /process: com INGESTION_DEBUG=1 o texto, os CSVs e o OCR de cada
+# página também são gravados em text/, table/ e img/ (as imagens são gravadas sempre)
+INGESTION_DEBUG = os.environ.get('INGESTION_DEBUG', '0') == '1'
+
+# Etapa de OCR: pool de processos do easyocr, lotes por tarefa e imagens pequenas ignoradas
+OCR_LANGUAGES = ('pt', 'en')
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', 2))
+OCR_THREADS_PER_WORKER = int(os.environ.get('OCR_THREADS_PER_WORKER', max(1, (os.cpu_count() or 1) // 2)))
+OCR_BATCH_SIZE = int(os.environ.get('OCR_BATCH_SIZE', 8))
+OCR_MIN_BYTES = int(os.environ.get('OCR_MIN_BYTES', 2048))
+OCR_MIN_PIXELS = int(os.environ.get('OCR_MIN_PIXELS', 64 * 64))
+OCR_CACHE_FILE = 'ocr_cache.sqlite'
+
+# Fila de jobs de ingestão (/process e /execute rodam em segundo plano)
+JOBS_FILE = 'jobs.sqlite'
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 20))
+
+# LLM local usado no /ask_llm ('fake' usa um gerador de teste em vez do GPT4All)
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gpt4all-lora-quantized.bin')
+LLM_MAX_TOKENS = int(os.environ.get('LLM_MAX_TOKENS', 1024))
+LLM_PRELOAD = os.environ.get('LLM_PRELOAD', '0') == '1'
+
+# Contexto do prompt do LLM: os LLM_CONTEXT_CHUNKS chunks mais relevantes são candidatos; os
+# repetidos saem, os vizinhos da mesma página são juntados (sem a sobreposição do chunking) e
+# entram por relevância até LLM_CONTEXT_TOKENS tokens. Os tokens são estimados pelo tamanho
+# do texto (LLM_CHARS_PER_TOKEN caracteres por token)
+LLM_CONTEXT_CHUNKS = int(os.environ.get('LLM_CONTEXT_CHUNKS', 8))
+LLM_CONTEXT_TOKENS = int(os.environ.get('LLM_CONTEXT_TOKENS', 768))
+LLM_CHARS_PER_TOKEN = float(os.environ.get('LLM_CHARS_PER_TOKEN', 3.5))
+
+# Modelos carregados já na importação do app.py (lista separada por vírgulas: embedding, ocr, llm).
+# Com gunicorn --preload a carga acontece antes do fork e os workers compartilham a memória dos
+# pesos (copy-on-write). Vazio: cada modelo é carregado no primeiro uso ou pelo POST /warmup
+MODEL_PRELOAD = tuple(name.strip() for name in os.environ.get('MODEL_PRELOAD', '').split(',') if name.strip())
+
+# Índice com shards: com SHARDS > 0 os documentos são divididos entre esse número de processos,
+# cada um com os seus índices FAISS, e cada busca roda em todos ao mesmo tempo e é juntada pela
+# distância. SHARD_THREADS: threads do FAISS por shard (0 divide os núcleos entre os shards)
+SHARDS = int(os.environ.get('SHARDS', 0))
+SHARD_THREADS = int(os.environ.get('SHARD_THREADS', 0))
+
+# Tipo de índice ANN: flat, ivf_flat, hnsw ou ivf_pq (com seus parâmetros de construção e busca)
+INDEX_TYPE = os.environ.get('INDEX_TYPE', 'flat')
+IVF_NLIST = int(os.environ.get('IVF_NLIST', 256))
+PQ_M = int(os.environ.get('PQ_M', 16))
+PQ_NBITS = int(os.environ.get('PQ_NBITS', 8))
+HNSW_M = int(os.environ.get('HNSW_M', 32))
+HNSW_EF_CONSTRUCTION = int(os.environ.get('HNSW_EF_CONSTRUCTION', 80))
+TRAIN_SAMPLE_SIZE = int(os.environ.get('TRAIN_SAMPLE_SIZE', 50000))
+SEARCH_NPROBE = int(os.environ.get('SEARCH_NPROBE', 16))
+SEARCH_EF_SEARCH = int(os.environ.get('SEARCH_EF_SEARCH', 64))
+
+# Busca por palavras-chave (BM25) e modo de recuperação: 'vector', 'bm25' ou 'hybrid'
+# (funde as duas listas por reciprocal rank fusion)
+BM25_K1 = float(os.environ.get('BM25_K1', 1.5))
+BM25_B = float(os.environ.get('BM25_B', 0.75))
+RETRIEVAL_MODE = os.environ.get('RETRIEVAL_MODE', 'hybrid')
+HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', 20))
+HYBRID_RRF_K = int(os.environ.get('HYBRID_RRF_K', 60))
+HYBRID_BM25_WEIGHT = float(os.environ.get('HYBRID_BM25_WEIGHT', 1.0))
+
+# Perguntas sobre imagens: quantas páginas buscar no índice de páginas e quantos
+# textos de cada página entram na resposta (os mais próximos da pergunta)
+IMAGE_TOP_PAGES = int(os.environ.get('IMAGE_TOP_PAGES', 3))
+IMAGE_TEXTS_PER_PAGE = int(os.environ.get('IMAGE_TEXTS_PER_PAGE', 3))
+
+# Limites (em segundos) dos histogramas de latência expostos no /metrics
+METRICS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+# Limite de perguntas por chamada do /ask_batch
+ASK_BATCH_MAX_QUESTIONS = int(os.environ.get('ASK_BATCH_MAX_QUESTIONS', 1000))
+
+# Cache de respostas do /ask: LRU com tempo de vida e limite de memória. O nível semântico
+# reaproveita respostas de perguntas com embedding acima desta similaridade (0 desliga)
+ANSWER_CACHE_ENTRIES = int(os.environ.get('ANSWER_CACHE_ENTRIES', 1000))
+ANSWER_CACHE_MAX_BYTES = int(os.environ.get('ANSWER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 3600))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.95))
+
+# Índices abertos com mmap e somente leitura: vários workers compartilham o cache de páginas
+# do sistema. INDEX_CHECK_SECONDS é o intervalo para conferir se há uma versão nova no disco.
+INDEX_MMAP = os.environ.get('INDEX_MMAP', '1') == '1'
+INDEX_CHECK_SECONDS = float(os.environ.get('INDEX_CHECK_SECONDS', 2))
@@ -0,0 +1,185 @@
+import math
+import re
+
+from config import LLM_CONTEXT_TOKENS, LLM_CHARS_PER_TOKEN
+
+# Tipos cujos chunks vizinhos são trechos contínuos do mesmo texto (as tabelas são JSON)
+MERGEABLE_TYPES = ('text', 'image')
+
+# Sobreposição mínima (em caracteres) para dois vizinhos serem juntados sem repetir o trecho
+MIN_OVERLAP_CHARS = 10
+
+
+def estimate_tokens(text, chars_per_token=LLM_CHARS_PER_TOKEN):
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def normalize(text):
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def overlap_length(left, right, min_length=MIN_OVERLAP_CHARS):
+    """
+    Tamanho do maior final de left que é também o começo de right (a sobreposição que o
+    chunking repete entre dois chunks vizinhos). Só conta com pelo menos min_length caracteres
+    e começando e terminando em fronteira de palavra: "cresceram" + "muito" não se sobrepõem
+    pelo "m".
+    """
+    for size in range(min(len(left), len(right)), max(min_length, 1) - 1, -1):
+        if not left.endswith(right[:size]):
+            continue
+        starts_word = size == len(left) or left[-size - 1].isspace() or right[0].isspace()
+        ends_word = size == len(right) or right[size].isspace() or right[size - 1].isspace()
+        if starts_word and ends_word:
+            return size
+    return 0
+
+
+def join_neighbors(left, right):
+    """
+    Texto de dois chunks vizinhos sem a sobreposição; sem sobreposição, separados por espaço.
+    """
+    size = overlap_length(left, right)
+    if size:
+        return left + right[size:]
+    if not left or not right or left[-1].isspace() or right[0].isspace():
+        return left + right
+    return left + " " + right
+
+
+def source_of(chunk, filenames):
+    metadata = chunk.get('metadata', {})
+    return {
+        'filename': filenames.get(metadata.get('doc_id')) or metadata.get('filename'),
+        'page': metadata.get('page'),
+        'chunk_index': metadata.get('chunk_index'),
+    }
+
+
+def deduplicate(entries):
+    """
+    Remove os chunks repetidos ou contidos em outro candidato; o que fica mantém a maior
+    relevância dos dois. entries: dicionários com 'chunk', 'text' e 'score', do mais relevante
+    para o menos.
+    """
+    kept = []
+    for entry in entries:
+        key = normalize(entry['text'])
+        if not key:
+            continue
+        duplicate = False
+        for other in kept:
+            if key in other['key']:
+                duplicate = True
+                break
+            if other['key'] in key:
+                # O candidato novo contém o antigo: fica o texto maior, com a relevância do antigo
+                other.update(chunk=entry['chunk'], text=entry['text'], key=key)
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(dict(entry, key=key))
+    return kept
+
+
+def merge_neighbors(entries):
+    """
+    Junta chunks consecutivos (chunk_index seguidos) do mesmo arquivo de página num trecho só,
+    sem repetir a sobreposição. Cada grupo fica com a maior relevância dos seus chunks.
+    """
+    groups = {}
+    for entry in entries:
+        metadata = entry['chunk'].get('metadata', {})
+        index = metadata.get('chunk_index')
+        if metadata.get('type') in MERGEABLE_TYPES and index is not None:
+            key = (metadata.get('doc_id'), metadata.get('filename'))
+        else:
+            # Sem posição no texto: fica sozinho
+            key, index = id(entry), 0
+        groups.setdefault(key, []).append((index, entry))
+
+    merged = []
+    for members in groups.values():
+        members.sort(key=lambda member: member[0])
+        run = None
+        for index, entry in members:
+            if run is not None and index == run['last_index'] + 1:
+                run['text'] = join_neighbors(run['text'], entry['text'])
+                run['chunks'].append(entry['chunk'])
+                run['score'] = max(run['score'], entry['score'])
+                run['last_index'] = index
+                continue
+            if run is not None:
+                merged.append(run)
+            run = {'text': entry['text'], 'chunks': [entry['chunk']], 'score': entry['score'], 'last_index': index}
+        merged.append(run)
+    return merged
+
+
+def merge_texts(chunks):
+    """
+    Textos dos chunks sem repetições e com os vizinhos juntados, na ordem recebida (sem limite
+    de tokens).
+    """
+    entries = [{'chunk': chunk, 'text': chunk.get('page_content') or '', 'score': -position}
+               for position, chunk in enumerate(chunks)]
+    groups = merge_neighbors(deduplicate(entries))
+    return [group['text'] for group in sorted(groups, key=lambda group: -group['score'])]
+
+
+def pack_context(chunks, scores=None, budget=LLM_CONTEXT_TOKENS, filenames=None, chars_per_token=LLM_CHARS_PER_TOKEN):
+    """
+    Monta o contexto do LLM a partir dos chunks recuperados (do mais relevante para o menos):
+    tira os repetidos, junta os vizinhos da mesma página e preenche budget tokens pela
+    relevância. Um trecho que não cabe é pulado, e os menores seguintes ainda podem entrar; o
+    primeiro trecho é cortado se sozinho passar do limite, para o contexto nunca ficar vazio.
+
+    scores: relevância de cada chunk (padrão: pela posição na busca). filenames: doc_id ->
+    nome do PDF, usado nas fontes. Devolve o texto, as fontes (filename, page, chunk_index) de
+    cada chunk usado, na ordem do contexto, e as contagens.
+    """
+    filenames = filenames or {}
+    if scores is None:
+        scores = [1.0 / (rank + 1) for rank in range(len(chunks))]
+    entries = sorted(
+        ({'chunk': chunk, 'text': chunk.get('page_content') or '', 'score': score}
+         for chunk, score in zip(chunks, scores)),
+        key=lambda entry: -entry['score']
+    )
+
+    unique = deduplicate(entries)
+    groups = sorted(merge_neighbors(unique), key=lambda group: -group['score'])
+
+    selected, tokens = [], 0
+    for group in groups:
+        size = estimate_tokens(group['text'], chars_per_token)
+        if tokens + size <= budget:
+            selected.append(group)
+            tokens += size
+        elif not selected:
+            selected.append(dict(group, text=group['text'][:int(budget * chars_per_token)]))
+            tokens = estimate_tokens(selected[0]['text'], chars_per_token)
+
+    sources = [source_of(chunk, filenames) for group in selected for chunk in group['chunks']]
+    return {
+        'context': "\n\n".join(group['text'] for group in selected),
+        'sources': sources,
+        'tokens': tokens,
+        'budget': budget,
+        'chunks': len(chunks),
+        'duplicates': len(entries) - len(unique),
+        'merged': len(unique) - len(groups),
+        'dropped': len(groups) - len(selected),
+    }
+
+
+def format_source(source):
+    """
+    Fonte em uma linha: relatorio.pdf, página 3, trecho 2.
+    """
+    parts = [source['filename'] or 'Desconhecido']
+    if source['page'] is not None:
+        parts.append(f"página {source['page']}")
+    if source['chunk_index'] is not None:
+        parts.append(f"trecho {source['chunk_index']}")
+    return ", ".join(parts)
@@ -0,0 +1,553 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from config import (
+    CHUNKED_DATA_FILE, LEGACY_CHUNKED_DATA_FILE, DOCUMENTS_FILE, METADATA_FILE, FAISS_INDEX_FILES, INDEX_INFO_FILE,
+    CHUNK_TYPES, PAGE_INDEX, EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_FILE, CHUNK_DB_FILE, VECTORS_FILE,
+    INDEX_MMAP
+)
+from embedding_cache import EmbeddingCache, encode_with_cache
+from encoder_backend import encoder_variant
+from chunk_store import ChunkStore, build_pages
+import ann_index
+import metrics
+
+
+class SnapshotChunks:
+    """
+    O armazenamento de chunks como um snapshot o enxerga. O banco é um só para todos os
+    snapshots e recebe os chunks de um documento antes da troca; a busca por palavras ignora
+    os IDs que os índices do snapshot ainda não têm (a partir de id_limit) e os que ele já
+    tirou (hidden_ids, apagados do banco logo depois da troca). Assim o BM25 e a busca
+    vetorial da busca híbrida veem o mesmo corpus. O resto vai direto para o armazenamento.
+    """
+
+    def __init__(self, store, id_limit=None, hidden_ids=()):
+        self.store = store
+        self.id_limit = store.next_chunk_id if id_limit is None else id_limit
+        self.hidden_ids = frozenset(hidden_ids)
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def __getitem__(self, chunk_id):
+        return self.store[chunk_id]
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def is_visible(self, chunk_id):
+        return chunk_id < self.id_limit and chunk_id not in self.hidden_ids
+
+    def keyword_search(self, query, top_k=10, chunk_type=None):
+        # Os chunks fora do snapshot podem ocupar vagas do top_k: busca a mais e filtra
+        extra = max(0, self.store.next_chunk_id - self.id_limit) + len(self.hidden_ids)
+        results = self.store.keyword_search(query, top_k + extra, chunk_type)
+        return [(chunk_id, score) for chunk_id, score in results if self.is_visible(chunk_id)][:top_k]
+
+
+class IndexSnapshot:
+    """
+    Estado do corpus indexado: um índice FAISS por tipo e o armazenamento de chunks.
+    Atualizações criam um snapshot novo e trocam a referência, então uma pergunta em
+    andamento nunca enxerga um índice pela metade. Os chunks novos entram no banco antes
+    da troca e os removidos só saem depois, então todo ID dos índices tem o seu chunk;
+    chunks (SnapshotChunks) esconde da busca por palavras o que os índices não têm.
+    """
+
+    def __init__(self, store, indexes, version=0, index_info=None, load_stats=None, id_limit=None, hidden_ids=()):
+        self.store = store
+        self.chunks = SnapshotChunks(store, id_limit, hidden_ids)
+        self.indexes = indexes
+        self.index_info = index_info or {}
+        self.version = version
+        # Tempos do carregamento a frio (só em snapshots lidos do disco)
+        self.load_stats = load_stats
+
+    @property
+    def documents(self):
+        return self.store.documents()
+
+    @property
+    def next_chunk_id(self):
+        return self.store.next_chunk_id
+
+
+def check_index_model(model_name=EMBEDDING_MODEL, path=INDEX_INFO_FILE, variant=None):
+    """
+    Garante que os índices foram gerados com o mesmo modelo e a mesma variante do encoder
+    (backend e quantização) usados nas consultas. Índices de antes do registro da variante
+    contam como 'torch'.
+    """
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+
+    variant = variant or encoder_variant()
+    indexed = (info.get('model'), info.get('variant', 'torch'))
+    if indexed != (model_name, variant):
+        raise ValueError(
+            f"Os índices foram gerados com o modelo '{indexed[0]}' ({indexed[1]}), mas as consultas usam "
+            f"'{model_name}' ({variant}). Execute o processamento novamente (POST /execute)."
+        )
+
+
+def read_index_version(path=INDEX_INFO_FILE):
+    """
+    Versão dos índices gravada por último no disco (None se ainda não há índices).
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('version', 0)
+
+
+def read_index_visibility(path=INDEX_INFO_FILE):
+    """
+    (id_limit, hidden_ids) dos chunks que os índices gravados enxergam; (None, ()) em
+    arquivos de antes desse registro.
+    """
+    if not os.path.exists(path):
+        return None, ()
+    with open(path, 'r', encoding='utf-8') as f:
+        info = json.load(f)
+    return info.get('next_chunk_id'), info.get('hidden_ids', ())
+
+
+def load_chunks(path=CHUNKED_DATA_FILE):
+    """
+    Lê chunked_data.jsonl (ou o chunked_data.json antigo) e devolve a lista de chunks, cada
+    um com 'id'. Arquivos sem o campo 'id' usam a posição do chunk na lista.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            chunked_data = [json.loads(line) for line in f if line.strip()]
+        else:
+            chunked_data = json.load(f)
+    return [dict(chunk, id=chunk.get('id', i)) for i, chunk in enumerate(chunked_data)]
+
+
+class DocumentIndex:
+    """
+    Índice incremental por documento. Cada PDF tem um doc_id estável; adicionar um
+    documento só codifica e insere os chunks dele, e remover apaga apenas os seus IDs.
+    variant: variante do encoder (torch, onnx ou onnx-int8); o padrão vem da configuração e é
+    trocado pela do encoder carregado quando ele sobe.
+    local_indexes: com False (índice com shards) os índices FAISS ficam só nos processos de
+    shard; aqui ficam o armazenamento de chunks, o BM25 e as versões.
+    """
+
+    def __init__(self, get_model, model_name=EMBEDDING_MODEL, index_files=FAISS_INDEX_FILES,
+                 info_file=INDEX_INFO_FILE, cache_file=EMBEDDING_CACHE_FILE, db_file=CHUNK_DB_FILE,
+                 vectors_file=VECTORS_FILE, chunked_data_file=LEGACY_CHUNKED_DATA_FILE,
+                 documents_file=DOCUMENTS_FILE, metadata_file=METADATA_FILE, variant=None, local_indexes=True):
+        self.get_model = get_model
+        self.model_name = model_name
+        self.variant = variant or encoder_variant()
+        self.index_files = index_files
+        self.info_file = info_file
+        self.cache_file = cache_file
+        self.db_file = db_file
+        self.vectors_file = vectors_file
+        self.local_indexes = local_indexes
+        # Arquivos JSON do formato antigo, usados só na migração
+        self.chunked_data_file = chunked_data_file
+        self.documents_file = documents_file
+        self.metadata_file = metadata_file
+
+        self.snapshot = None
+        self._write_lock = threading.Lock()
+        self._info_mtime = None
+
+    def _index_files_exist(self):
+        return all(os.path.exists(self.index_files[chunk_type]) for chunk_type in CHUNK_TYPES)
+
+    def load(self):
+        """
+        Carrega o estado salvo em disco. Um corpus ainda no formato JSON antigo é migrado antes.
+        """
+        if not ChunkStore.exists(self.db_file):
+            if os.path.exists(self.chunked_data_file) and (self._index_files_exist() or not self.local_indexes):
+                self.migrate_json()
+            else:
+                raise FileNotFoundError(f"Arquivo {self.db_file} não encontrado.")
+
+        check_index_model(self.model_name, self.info_file, self.variant)
+        info_mtime = os.stat(self.info_file).st_mtime_ns if os.path.exists(self.info_file) else None
+        version = read_index_version(self.info_file) or 0
+
+        inicio = time.perf_counter()
+        indexes, index_info, load_stats = {}, {}, {'mmap': INDEX_MMAP}
+        store = ChunkStore(self.db_file, self.vectors_file)
+        if self.local_indexes:
+            for chunk_type, path in self.index_files.items():
+                if not os.path.exists(path):
+                    continue
+                inicio_tipo = time.perf_counter()
+                indexes[chunk_type] = ann_index.read_index(path)
+                ann_index.apply_search_params(indexes[chunk_type])
+                index_info[chunk_type] = ann_index.read_index_info(path)
+                load_stats[f'{chunk_type}_seconds'] = round(time.perf_counter() - inicio_tipo, 4)
+
+            # Tipos sem arquivo (índices de antes do índice de páginas, ou corpus mantido com
+            # shards): monta a partir do banco
+            missing = [chunk_type for chunk_type in self.index_files if chunk_type not in indexes]
+            if missing:
+                dimension = self._dimension(store, indexes)
+                for chunk_type in missing:
+                    indexes[chunk_type], index_info[chunk_type] = self._rebuild_type(store, chunk_type, dimension)
+                    ann_index.write_index(indexes[chunk_type], self.index_files[chunk_type])
+                    ann_index.write_index_info(self.index_files[chunk_type], index_info[chunk_type])
+        load_stats['seconds'] = round(time.perf_counter() - inicio, 4)
+        metrics.record("index_load", load_stats['seconds'], chunks=len(store))
+        if self.local_indexes:
+            print(f"Índices (versão {version}) abertos em {load_stats['seconds']:.3f}s "
+                  f"({'mmap somente leitura' if INDEX_MMAP else 'cópia em memória'})")
+
+        id_limit, hidden_ids = read_index_visibility(self.info_file)
+        self.snapshot = IndexSnapshot(store, indexes, version, index_info, load_stats, id_limit, hidden_ids)
+        self._info_mtime = info_mtime
+        return self.snapshot
+
+    def is_stale(self):
+        """
+        Indica se outro processo gravou uma versão dos índices diferente da carregada.
+        Só lê o arquivo de informações quando a data de modificação muda.
+        """
+        if self.snapshot is None or not os.path.exists(self.info_file):
+            return False
+        mtime = os.stat(self.info_file).st_mtime_ns
+        if mtime == self._info_mtime:
+            return False
+        self._info_mtime = mtime
+        return read_index_version(self.info_file) != self.snapshot.version
+
+    def load_or_empty(self):
+        """
+        Como load(), mas sem dados processados começa com índices vazios.
+        """
+        try:
+            return self.load()
+        except FileNotFoundError:
+            dimension = self.get_model().get_sentence_embedding_dimension()
+            indexes, index_info = {}, {}
+            for chunk_type in self.index_files if self.local_indexes else ():
+                indexes[chunk_type], index_info[chunk_type] = self._build_index(
+                    np.zeros((0, dimension), dtype=np.float32), [], dimension
+                )
+            store = ChunkStore(self.db_file, self.vectors_file)
+            self.snapshot = IndexSnapshot(store, indexes, index_info=index_info)
+            return self.snapshot
+
+    def encode(self, chunks, show_progress_bar=False):
+        cache = EmbeddingCache(self.cache_file, self.model_name, self.variant)
+        try:
+            with metrics.span("embedding", chunks=len(chunks)) as span:
+                embeddings, hits, misses = encode_with_cache(
+                    self.get_model, [chunk['page_content'] for chunk in chunks], cache,
+                    batch_size=EMBEDDING_BATCH_SIZE, show_progress_bar=show_progress_bar
+                )
+                span.update(cache_hits=hits, encoded=misses)
+        finally:
+            cache.close()
+        # O encoder carregado pode ser de outra variante que a configurada
+        self.variant = cache.variant
+        print(f"Cache de embeddings: {hits} acertos, {misses} faltas")
+        return embeddings
+
+    def _dimension(self, store, indexes):
+        # Dimensão dos vetores: a dos índices abertos, a do armazenamento ou a do modelo
+        if indexes:
+            return next(iter(indexes.values())).d
+        matrix = store.matrix
+        return matrix.shape[1] if matrix is not None else self.get_model().get_sentence_embedding_dimension()
+
+    def _build_index(self, vectors, ids, dimension):
+        with metrics.span("index_build", vectors=len(ids)):
+            index, info = ann_index.build_index(vectors, ids, dimension)
+        info.update({'ntotal': int(index.ntotal), 'dimension': int(dimension), 'model': self.model_name,
+                     'variant': self.variant})
+        return index, info
+
+    def _rebuild_type(self, store, chunk_type, dimension, exclude=()):
+        """
+        Reconstrói o índice de um tipo a partir dos vetores do armazenamento. Usado quando o
+        tipo de índice não aceita remoção (HNSW) ou quando um índice pequeno já pode sair do Flat.
+        """
+        exclude = set(exclude)
+        if chunk_type == PAGE_INDEX:
+            ids = [page_id for page_id in store.all_page_ids() if page_id not in exclude]
+            vectors = store.page_vectors(ids) if ids else np.zeros((0, dimension), dtype=np.float32)
+        else:
+            ids = [chunk_id for chunk_id, _ in store.by_type(chunk_type) if chunk_id not in exclude]
+            vectors = store.vectors(ids) if ids else np.zeros((0, dimension), dtype=np.float32)
+        return self._build_index(vectors, ids, dimension)
+
+    def _known_filenames(self):
+        if ChunkStore.exists(self.db_file):
+            documents = ChunkStore(self.db_file, self.vectors_file).documents()
+        elif os.path.exists(self.documents_file):
+            with open(self.documents_file, 'r', encoding='utf-8') as f:
+                documents = json.load(f).get('documents', {})
+        else:
+            return {}
+        return {doc_id: info.get('filename') for doc_id, info in documents.items()}
+
+    def _build_indexes(self, chunks, embeddings, pages, dimension):
+        indexes, index_info = {}, {}
+        for chunk_type in CHUNK_TYPES:
+            rows = [row for row, chunk in enumerate(chunks) if chunk.get('metadata', {}).get('type') == chunk_type]
+            ids = np.array([chunks[row]['id'] for row in rows], dtype=np.int64)
+            vectors = embeddings[rows] if rows else np.zeros((0, dimension), dtype=np.float32)
+            indexes[chunk_type], index_info[chunk_type] = self._build_index(vectors, ids, dimension)
+
+        page_vectors = np.vstack([page['vector'] for page in pages]) if pages else np.zeros((0, dimension), dtype=np.float32)
+        indexes[PAGE_INDEX], index_info[PAGE_INDEX] = self._build_index(
+            page_vectors, np.array([page['id'] for page in pages], dtype=np.int64), dimension
+        )
+        return indexes, index_info
+
+    def build(self, chunks, show_progress_bar=False):
+        """
+        Reconstrói tudo a partir de uma lista de chunks (usado pelo generate_embeddings.py).
+        """
+        chunks = [dict(chunk, id=i) for i, chunk in enumerate(chunks)]
+        embeddings = self.encode(chunks, show_progress_bar)
+
+        dimension = embeddings.shape[1] if len(chunks) else self.get_model().get_sentence_embedding_dimension()
+        embeddings = embeddings.reshape(-1, dimension)
+        pages = build_pages(chunks, embeddings)
+        indexes, index_info = {}, {}
+        if self.local_indexes:
+            indexes, index_info = self._build_indexes(chunks, embeddings, pages, dimension)
+
+        with self._write_lock:
+            store = ChunkStore.write(chunks, embeddings, self._known_filenames(),
+                                     self.db_file, self.vectors_file, pages=pages)
+            snapshot = IndexSnapshot(store, indexes, self._next_version(), index_info)
+            self._save(snapshot)
+            self.snapshot = snapshot
+        return snapshot
+
+    def rebuild(self, show_progress_bar=False):
+        """
+        Reconstrói armazenamento e índices a partir dos chunks já indexados (ex.: depois de trocar
+        o tipo de índice), sem depender dos arquivos intermediários da ingestão.
+        """
+        if self.snapshot is None and ChunkStore.exists(self.db_file):
+            # Sem o load(): os índices gravados podem ser de outro modelo ou variante do encoder
+            stored = ChunkStore(self.db_file, self.vectors_file).values()
+        else:
+            stored = (self.snapshot if self.snapshot is not None else self.load()).chunks.values()
+        chunks = [
+            {'page_content': chunk['page_content'], 'metadata': chunk.get('metadata', {})}
+            for chunk in stored
+        ]
+        return self.build(chunks, show_progress_bar)
+
+    def _metadata_vectors(self, chunks):
+        """
+        Vetores do embeddings_with_metadata.json antigo, se foram gerados com o modelo atual.
+        """
+        if not os.path.exists(self.metadata_file) or not os.path.exists(self.info_file):
+            return None
+        with open(self.info_file, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if (info.get('model'), info.get('variant', 'torch')) != (self.model_name, self.variant):
+            return None
+        with open(self.metadata_file, 'r', encoding='utf-8') as f:
+            items = json.load(f)
+        if len(items) != len(chunks):
+            return None
+        return np.array([item['embedding'] for item in items], dtype=np.float32)
+
+    def migrate_json(self):
+        """
+        Converte chunked_data.json, documents.json e embeddings_with_metadata.json para o
+        armazenamento binário. Os índices FAISS continuam valendo, pois os IDs não mudam.
+        """
+        print(f"Migrando {self.chunked_data_file} para {self.db_file}...")
+        chunks = load_chunks(self.chunked_data_file)
+        vectors = self._metadata_vectors(chunks)
+        if vectors is None:
+            vectors = self.encode(chunks)
+        return ChunkStore.write(chunks, vectors, self._known_filenames(), self.db_file, self.vectors_file)
+
+    def add_document(self, doc_id, chunks, filename=None, embeddings=None):
+        """
+        Indexa os chunks de um documento. Se o doc_id já existir, os chunks antigos são
+        substituídos na mesma troca de snapshot. embeddings: vetores já calculados (ex.: pela
+        ingestão em memória, que codifica enquanto extrai), na ordem dos chunks.
+        """
+        chunks = [
+            dict(chunk, metadata=dict(chunk.get('metadata', {}), doc_id=doc_id)) for chunk in chunks
+        ]
+
+        # O encode é a parte lenta e roda fora da trava: as perguntas continuam sendo respondidas
+        if embeddings is None:
+            embeddings = self.encode(chunks) if chunks else None
+
+        with self._write_lock:
+            current = self.snapshot if self.snapshot is not None else self.load_or_empty()
+            store = current.store
+            old_ids = store.document_chunk_ids(doc_id)
+            old_page_ids = store.document_page_ids(doc_id)
+
+            start = store.next_chunk_id
+            for offset, chunk in enumerate(chunks):
+                chunk['id'] = start + offset
+            pages = build_pages(chunks, embeddings, store.next_page_id) if chunks else []
+
+            # Os chunks novos só aparecem nas buscas (vetorial e por palavras) depois da troca
+            # de snapshot, e os antigos somem delas na mesma troca
+            store.add(chunks, embeddings, doc_id, filename, pages)
+            snapshot = self._apply(
+                current, self._removed_by_type(store, old_ids, old_page_ids),
+                self._added_by_type(chunks, embeddings, pages),
+                id_limit=start + len(chunks), hidden_ids=old_ids
+            )
+            self._save(snapshot, current)
+            self.snapshot = snapshot
+            # Um documento que ficou sem chunks sai do registro
+            store.delete(old_ids, None if chunks else doc_id, old_page_ids)
+
+        print(f"Documento {doc_id} indexado: {len(chunks)} chunks, {len(pages)} páginas")
+        return snapshot
+
+    def remove_document(self, doc_id):
+        with self._write_lock:
+            current = self.snapshot if self.snapshot is not None else self.load_or_empty()
+            store = current.store
+            if not store.has_document(doc_id):
+                raise KeyError(doc_id)
+
+            old_ids = store.document_chunk_ids(doc_id)
+            old_page_ids = store.document_page_ids(doc_id)
+            snapshot = self._apply(current, self._removed_by_type(store, old_ids, old_page_ids), {}, hidden_ids=old_ids)
+            self._save(snapshot, current)
+            self.snapshot = snapshot
+            store.delete(old_ids, doc_id, old_page_ids)
+
+        print(f"Documento {doc_id} removido do índice")
+        return snapshot
+
+    @staticmethod
+    def _removed_by_type(store, chunk_ids, page_ids):
+        removed = {}
+        for chunk in store.get_many(chunk_ids):
+            removed.setdefault(chunk.get('metadata', {}).get('type'), []).append(chunk['id'])
+        if page_ids:
+            removed[PAGE_INDEX] = list(page_ids)
+        return removed
+
+    @staticmethod
+    def _added_by_type(chunks, embeddings, pages):
+        rows_by_type = {}
+        for row, chunk in enumerate(chunks):
+            rows_by_type.setdefault(chunk.get('metadata', {}).get('type'), []).append(row)
+        added = {
+            chunk_type: ([chunks[row]['id'] for row in rows], embeddings[rows])
+            for chunk_type, rows in rows_by_type.items()
+        }
+        if pages:
+            added[PAGE_INDEX] = ([page['id'] for page in pages], np.vstack([page['vector'] for page in pages]))
+        return added
+
+    def _apply(self, current, removed_by_type, added_by_type, id_limit=None, hidden_ids=()):
+        """
+        Monta o próximo snapshot: tira dos índices os IDs removidos e adiciona os novos
+        ({tipo: (ids, vetores)}). Só os índices afetados são copiados; os demais são compartilhados.
+        id_limit e hidden_ids: chunks que a busca por palavras do snapshot novo enxerga.
+        """
+        store = current.store
+
+        indexes, index_info = dict(current.indexes), dict(current.index_info)
+        with metrics.span("index_update", added=sum(len(ids) for ids, _ in added_by_type.values()),
+                          removed=sum(len(ids) for ids in removed_by_type.values())):
+            for chunk_type in set(removed_by_type) | set(added_by_type):
+                if chunk_type not in indexes:
+                    continue
+                current_index = indexes[chunk_type]
+                info = index_info.get(chunk_type, {})
+                removed = removed_by_type.get(chunk_type, [])
+                added_ids, added_vectors = added_by_type.get(chunk_type, ([], None))
+                total = current_index.ntotal - len(removed) + len(added_ids)
+
+                # Índice Flat provisório (poucos vetores) que já tem dados para o tipo configurado
+                upgrade = 'fallback_from' in info and total >= ann_index.min_train_size(
+                    info['fallback_from'], ann_index.default_params(info['fallback_from'])
+                )
+                if upgrade or (removed and not ann_index.supports_remove(current_index)):
+                    # O armazenamento já tem os itens novos; só os removidos ficam de fora
+                    indexes[chunk_type], index_info[chunk_type] = self._rebuild_type(
+                        store, chunk_type, current_index.d, exclude=removed
+                    )
+                    continue
+
+                index = ann_index.copy_index(current_index)
+                if removed:
+                    index.remove_ids(np.array(removed, dtype=np.int64))
+                if added_ids:
+                    index.add_with_ids(
+                        np.ascontiguousarray(added_vectors, dtype=np.float32), np.array(added_ids, dtype=np.int64)
+                    )
+                ann_index.apply_search_params(index)
+                indexes[chunk_type] = index
+                index_info[chunk_type] = dict(info, ntotal=int(index.ntotal))
+
+        return IndexSnapshot(
+            store, indexes, self._next_version(), index_info,
+            id_limit=current.chunks.id_limit if id_limit is None else id_limit, hidden_ids=hidden_ids
+        )
+
+    def _next_version(self):
+        versions = [
+            version for version in (self.snapshot.version if self.snapshot else None, read_index_version(self.info_file))
+            if version is not None
+        ]
+        return max(versions) + 1 if versions else 0
+
+    def _save(self, snapshot, previous=None):
+        """
+        Grava os índices que mudaram (cada um trocado por rename) e, por último, o arquivo de
+        informações com a nova versão, que é o sinal para os outros workers recarregarem.
+        """
+        if not self.local_indexes:
+            # Os índices gravados antes dos shards não acompanham mais o banco: o próximo
+            # load() sem shards monta de novo a partir dele
+            for path in self.index_files.values():
+                if os.path.exists(path):
+                    os.remove(path)
+        for chunk_type, index in snapshot.indexes.items():
+            if previous is not None and previous.indexes.get(chunk_type) is index:
+                continue
+            path = self.index_files[chunk_type]
+            ann_index.write_index(index, path)
+            ann_index.write_index_info(path, snapshot.index_info.get(chunk_type, {}))
+            if INDEX_MMAP:
+                # Troca a cópia em memória pelo arquivo mapeado, como nos outros workers
+                snapshot.indexes[chunk_type] = ann_index.read_index(path)
+                ann_index.apply_search_params(snapshot.indexes[chunk_type])
+
+        dimension = self._dimension(snapshot.store, snapshot.indexes)
+        tmp_path = self.info_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'model': self.model_name, 'variant': self.variant, 'dimension': int(dimension),
+                'version': snapshot.version,
+                # Os outros workers carregam os índices com a mesma visão da busca por palavras
+                'next_chunk_id': snapshot.chunks.id_limit, 'hidden_ids': sorted(snapshot.chunks.hidden_ids),
+            }, f)
+        os.replace(tmp_path, self.info_file)
+        self._info_mtime = os.stat(self.info_file).st_mtime_ns
@@ -0,0 +1,90 @@
+import hashlib
+import sqlite3
+import numpy as np
+
+from encoder_backend import loaded_variant
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings em SQLite. A chave é o hash do nome do modelo e da
+    variante do encoder (torch, onnx ou onnx-int8) junto com o texto do chunk, então vetores
+    de modelos ou backends diferentes nunca se misturam.
+    """
+
+    def __init__(self, path, model_name, variant='torch'):
+        self.path = path
+        self.model_name = model_name
+        self.variant = variant
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, model TEXT, dim INTEGER, vector BLOB)"
+        )
+        self.conn.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\n{self.variant}\n{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        unique_keys = list(set(keys))
+        # SQLite limita a quantidade de parâmetros por consulta
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+            [(key, self.model_name, len(vector), np.asarray(vector, dtype=np.float32).tobytes())
+             for key, vector in items]
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def encode_with_cache(get_model, texts, cache, batch_size=256, show_progress_bar=False):
+    """
+    Devolve os embeddings de todos os textos, codificando só os que não estão no cache.
+    get_model só é chamado se houver faltas, assim um corpus sem mudanças nem carrega o modelo.
+    Se o encoder carregado não for da variante do cache (o ONNX indisponível volta para o
+    SentenceTransformer), o cache passa para a variante real e a busca recomeça.
+    Retorna (embeddings, acertos, faltas).
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), 0, 0
+
+    keys = [cache.key(text) for text in texts]
+    cached = cache.get_many(keys)
+
+    # Textos repetidos só são codificados uma vez
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in cached and key not in missing:
+            missing[key] = text
+
+    if missing:
+        model = get_model()
+        if loaded_variant(model) != cache.variant:
+            cache.variant = loaded_variant(model)
+            return encode_with_cache(lambda: model, texts, cache, batch_size, show_progress_bar)
+        new_vectors = model.encode(
+            list(missing.values()), batch_size=batch_size,
+            show_progress_bar=show_progress_bar, convert_to_numpy=True
+        ).astype(np.float32)
+        new_items = list(zip(missing.keys(), new_vectors))
+        cache.put_many(new_items)
+        cached.update(new_items)
+
+    hits = sum(1 for key in keys if key not in missing)
+    misses = len(keys) - hits
+
+    return np.vstack([cached[key] for key in keys]).astype(np.float32), hits, misses
@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import glob
+import time
+import numpy as np
+
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_QUANTIZE, EMBEDDING_THREADS, EMBEDDING_MAX_BATCH_TOKENS,
+    ONNX_MODELS_DIR
+)
+
+ENCODER_CONFIG = 'encoder_config.json'
+
+
+def encoder_variant(backend=EMBEDDING_BACKEND, quantize=EMBEDDING_QUANTIZE):
+    """
+    Como os vetores são gerados além do modelo: 'torch', 'onnx' ou 'onnx-int8'. Os backends
+    não dão vetores idênticos, então a variante entra na chave do cache e no index_info.json.
+    """
+    if backend != 'onnx':
+        return 'torch'
+    return 'onnx-int8' if quantize else 'onnx'
+
+
+def loaded_variant(encoder):
+    """
+    Variante de um encoder já carregado (o ONNX pode ter voltado para o SentenceTransformer).
+    """
+    return getattr(encoder, 'variant', 'torch')
+
+
+def export_dir(model_name, models_dir=ONNX_MODELS_DIR):
+    return os.path.join(models_dir, model_name.replace('/', '__'))
+
+
+def export_onnx(model_name, target_dir):
+    """
+    Exporta o modelo do SentenceTransformer para ONNX com o optimum, otimiza o grafo (fusão
+    de atenção, GELU e LayerNorm) e gera também a versão com pesos int8 (quantização dinâmica).
+    O pooling, a normalização e o tamanho máximo vêm do próprio SentenceTransformer.
+    """
+    from sentence_transformers import SentenceTransformer
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+    from optimum.onnxruntime.configuration import OptimizationConfig, AutoQuantizationConfig
+
+    inicio = time.perf_counter()
+    reference = SentenceTransformer(model_name, device='cpu')
+    transformer = reference[0]
+    hf_dir = os.path.join(target_dir, 'hf')
+    transformer.auto_model.save_pretrained(hf_dir)
+    transformer.tokenizer.save_pretrained(target_dir)
+
+    model = ORTModelForFeatureExtraction.from_pretrained(hf_dir, export=True)
+    model.save_pretrained(target_dir)
+    ORTOptimizer.from_pretrained(model).optimize(
+        save_dir=target_dir, optimization_config=OptimizationConfig(optimization_level=2)
+    )
+    optimized = os.path.basename(sorted(glob.glob(os.path.join(target_dir, '*optimized.onnx')))[0])
+    ORTQuantizer.from_pretrained(target_dir, file_name=optimized).quantize(
+        save_dir=target_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+    )
+    quantized = os.path.basename(sorted(glob.glob(os.path.join(target_dir, '*quantized.onnx')))[0])
+
+    pooling = reference[1].get_pooling_mode_str() if len(reference) > 1 else 'mean'
+    config = {
+        'model_name': model_name,
+        'pooling': pooling,
+        'normalize': any(type(module).__name__ == 'Normalize' for module in reference),
+        'max_seq_length': int(reference.max_seq_length),
+        'dimension': int(reference.get_sentence_embedding_dimension()),
+        'files': {'fp32': optimized, 'int8': quantized},
+    }
+    with open(os.path.join(target_dir, ENCODER_CONFIG), 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    print(f"Modelo {model_name} exportado para ONNX em {time.perf_counter() - inicio:.1f}s: {target_dir}")
+    return config
+
+
+class OnnxEncoder:
+    """
+    Encoder no onnxruntime com a mesma interface usada do SentenceTransformer (encode e
+    get_sentence_embedding_dimension). Os textos são tokenizados uma vez, ordenados pelo
+    tamanho e agrupados em lotes de tamanho parecido, limitados por batch_size e por
+    max_batch_tokens (linhas x maior comprimento): cada lote só é preenchido até o seu maior
+    texto, em vez do maior do corpus. O resultado volta na ordem original.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, quantize=EMBEDDING_QUANTIZE, threads=EMBEDDING_THREADS,
+                 max_batch_tokens=EMBEDDING_MAX_BATCH_TOKENS, models_dir=ONNX_MODELS_DIR):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        target_dir = export_dir(model_name, models_dir)
+        config_path = os.path.join(target_dir, ENCODER_CONFIG)
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                self.config = json.load(f)
+        else:
+            self.config = export_onnx(model_name, target_dir)
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.variant = encoder_variant('onnx', quantize)
+        self.max_batch_tokens = max_batch_tokens
+        self.tokenizer = AutoTokenizer.from_pretrained(target_dir)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        model_file = self.config['files']['int8' if quantize else 'fp32']
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(target_dir, model_file), options, providers=['CPUExecutionProvider']
+        )
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dimension']
+
+    def batches(self, lengths, batch_size):
+        """
+        Lotes de posições ordenadas do texto mais longo para o mais curto (o primeiro lote já
+        mostra o pior caso de memória).
+        """
+        order = sorted(range(len(lengths)), key=lambda position: -lengths[position])
+        batch = []
+        for position in order:
+            # O primeiro do lote é o mais longo: ele define o preenchimento de todos
+            longest = lengths[batch[0]] if batch else lengths[position]
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * longest > self.max_batch_tokens):
+                yield batch
+                batch = []
+            batch.append(position)
+        if batch:
+            yield batch
+
+    def _feeds(self, input_ids, rows):
+        length = max(len(input_ids[row]) for row in rows)
+        ids = np.full((len(rows), length), self.tokenizer.pad_token_id or 0, dtype=np.int64)
+        mask = np.zeros((len(rows), length), dtype=np.int64)
+        for line, row in enumerate(rows):
+            ids[line, :len(input_ids[row])] = input_ids[row]
+            mask[line, :len(input_ids[row])] = 1
+        feeds = {'input_ids': ids, 'attention_mask': mask}
+        if 'token_type_ids' in self.input_names:
+            feeds['token_type_ids'] = np.zeros_like(ids)
+        return feeds
+
+    def _pool(self, hidden, mask):
+        if self.config['pooling'] == 'cls':
+            return hidden[:, 0]
+        if self.config['pooling'] == 'max':
+            return np.where(mask[..., None] > 0, hidden, -np.inf).max(axis=1)
+        summed = (hidden * mask[..., None]).sum(axis=1)
+        return summed / np.maximum(mask.sum(axis=1, keepdims=True), 1)
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        if isinstance(texts, str):
+            return self.encode([texts], batch_size)[0]
+        embeddings = np.zeros((len(texts), self.get_sentence_embedding_dimension()), dtype=np.float32)
+        if not len(texts):
+            return embeddings
+
+        input_ids = self.tokenizer(
+            list(texts), truncation=True, max_length=self.config['max_seq_length']
+        )['input_ids']
+        batches = list(self.batches([len(ids) for ids in input_ids], batch_size))
+        for number, rows in enumerate(batches):
+            feeds = self._feeds(input_ids, rows)
+            hidden = self.session.run(None, feeds)[0]
+            embeddings[rows] = self._pool(hidden, feeds['attention_mask'].astype(np.float32))
+            if show_progress_bar:
+                print(f"\rEmbeddings: lote {number + 1}/{len(batches)}", end="", flush=True)
+        if show_progress_bar:
+            print()
+
+        if self.config['normalize']:
+            embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        return embeddings
+
+
+def load_sentence_transformer(model_name, threads=EMBEDDING_THREADS):
+    from sentence_transformers import SentenceTransformer
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return SentenceTransformer(model_name, device='cpu')
+
+
+def load_encoder(model_name=EMBEDDING_MODEL, backend=EMBEDDING_BACKEND, quantize=EMBEDDING_QUANTIZE,
+                 threads=EMBEDDING_THREADS):
+    """
+    Encoder do backend configurado. Sem optimum/onnxruntime (ou se a exportação falhar),
+    volta para o SentenceTransformer.
+    """
+    if backend == 'onnx':
+        try:
+            encoder = OnnxEncoder(model_name, quantize=quantize, threads=threads)
+            print(f"Encoder ONNX ({'int8' if quantize else 'fp32'}) carregado: {model_name}")
+            return encoder
+        except Exception as e:
+            print(f"Backend ONNX indisponível ({e}), usando o SentenceTransformer")
+    elif backend != 'torch':
+        print(f"Backend de embeddings desconhecido: {backend}, usando o SentenceTransformer")
+    return load_sentence_transformer(model_name, threads)
+
+
+def compare_backends(texts, model_name=EMBEDDING_MODEL, k=10, n_queries=100, batch_size=32, threads=EMBEDDING_THREADS):
+    """
+    Compara o ONNX (fp32 e int8) com o SentenceTransformer de referência: similaridade de
+    cosseno entre os embeddings de cada texto, recall@k da busca exata (os k vizinhos de cada
+    consulta com os vetores do candidato contra os da referência) e textos por segundo.
+    """
+    def throughput(encoder):
+        encoder.encode(texts[:batch_size], batch_size=batch_size)
+        inicio = time.perf_counter()
+        vectors = np.asarray(encoder.encode(texts, batch_size=batch_size), dtype=np.float32)
+        return vectors, len(texts) / (time.perf_counter() - inicio)
+
+    def normalized(vectors):
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    def neighbors(vectors, queries):
+        # Distância L2, como nos índices FAISS
+        distances = (queries ** 2).sum(1)[:, None] - 2 * queries @ vectors.T + (vectors ** 2).sum(1)[None, :]
+        return np.argsort(distances, axis=1)[:, :k]
+
+    rng = np.random.default_rng(0)
+    query_rows = rng.choice(len(texts), min(n_queries, len(texts)), replace=False)
+
+    reference_vectors, reference_speed = throughput(load_sentence_transformer(model_name, threads))
+    truth = neighbors(reference_vectors, reference_vectors[query_rows])
+    results = [{'backend': 'torch', 'texts_per_second': round(reference_speed, 1)}]
+
+    for quantize in (False, True):
+        vectors, speed = throughput(OnnxEncoder(model_name, quantize=quantize, threads=threads))
+        cosine = (normalized(vectors) * normalized(reference_vectors)).sum(axis=1)
+        found = neighbors(vectors, vectors[query_rows])
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(query_rows))])
+        results.append({
+            'backend': 'onnx-int8' if quantize else 'onnx',
+            'texts_per_second': round(speed, 1),
+            'speedup': round(speed / reference_speed, 2),
+            'cosine_mean': round(float(cosine.mean()), 5),
+            'cosine_min': round(float(cosine.min()), 5),
+            f'recall@{k}': round(float(recall), 4),
+        })
+    return results
+
+
+if __name__ == '__main__':
+    # Paridade e velocidade dos backends com os chunks do corpus atual:
+    # python encoder_backend.py [quantidade de textos] [k]
+    from chunk_store import ChunkStore
+
+    limite = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    if not ChunkStore.exists():
+        print("Nenhum chunk processado: envie um PDF antes de comparar os backends.")
+        sys.exit(1)
+    textos = [chunk['page_content'] for chunk in ChunkStore().values()[:limite] if chunk['page_content']]
+
+    print(f"Comparando backends com {len(textos)} textos, k={min(k, len(textos))}")
+    resultados = compare_backends(textos, k=min(k, len(textos)))
+    for resultado in resultados:
+        print(json.dumps(resultado, ensure_ascii=False))
+
+    # Equivalente: mesma vizinhança na busca e embeddings praticamente iguais
+    falhas = [r['backend'] for r in resultados[1:] if r[f'recall@{min(k, len(textos))}'] < 0.9 or r['cosine_mean'] < 0.99]
+    if falhas:
+        print(f"Backends fora da paridade: {', '.join(falhas)}")
+        sys.exit(1)
+    print("Backends ONNX equivalentes à referência.")
@@ -1,84 +1,171 @@
 import sys
-import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-import pandas as pd
 import os
-from sklearn.metrics.pairwise import cosine_similarity
 
-CHUNKED_DATA_FILE = 'chunked_data.json'
-FAISS_INDEX_FILE = 'faiss_index.faiss'
+from config import (
+    EMBEDDING_MODEL, CHUNK_TYPES, PAGE_INDEX, RETRIEVAL_MODE, HYBRID_CANDIDATES, HYBRID_RRF_K, HYBRID_BM25_WEIGHT,
+    IMAGE_TOP_PAGES, IMAGE_TEXTS_PER_PAGE
+)
+from document_index import DocumentIndex
+import ann_index
+from table_store import TableStore
+from keyword_index import reciprocal_rank_fusion, tokenize
+from context_packing import merge_texts
+import metrics
+from model_registry import embedding_model
 
-if len(sys.argv) < 2:
-    print("Erro: Por favor, forneça uma pergunta como argumento.\nExemplo: python generate_response.py \"Qual é o objetivo deste projeto?\")")
-    sys.exit(1)
+MODEL_NAME = EMBEDDING_MODEL
+TOP_K = 5
 
-question = sys.argv[1]
 
-try:
-    with open(CHUNKED_DATA_FILE, 'r', encoding='utf-8') as f:
-        chunked_data = json.load(f)
-except FileNotFoundError:
-    print(f"Erro: Arquivo {CHUNKED_DATA_FILE} não encontrado.")
-    sys.exit(1)
+def page_key(chunk):
+    metadata = chunk.get('metadata', {})
+    return metadata.get('doc_id'), metadata.get('page')
 
-try:
-    index = faiss.read_index(FAISS_INDEX_FILE)
-except Exception as e:
-    print(f"Erro ao carregar o índice FAISS: {e}")
-    sys.exit(1)
 
-try:
-    model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-except Exception as e:
-    print(f"Erro ao carregar o modelo de embeddings: {e}")
-    sys.exit(1)
+def as_matrix(question_embeddings):
+    # Uma linha por pergunta, em float32 contíguo como o FAISS espera
+    return np.ascontiguousarray(np.atleast_2d(np.asarray(question_embeddings, dtype=np.float32)))
 
-question_embedding = model.encode([question], convert_to_numpy=True)
 
-def classify_question(question):
-    keywords_mapping = {
-        "text": ["estratégia", "desempenho", "relatório"],
-        "table": ["dados", "valores", "tabela", "percentual", "total"],
-        "image": ["características", "design", "função", "imagem"]
-    }
+def search_index_batch(index, question_embeddings, top_k=TOP_K, nprobe=None, ef_search=None):
+    """
+    Uma única busca no índice com todas as perguntas (uma linha da matriz por pergunta).
+    Devolve, para cada pergunta, os IDs encontrados do mais próximo ao mais distante.
+    nprobe (IVF) e ef_search (HNSW) ajustam a busca só desta consulta.
+    """
+    queries = as_matrix(question_embeddings)
+    if index is None or index.ntotal == 0:
+        return [[] for _ in range(len(queries))]
+    with metrics.span("search", k=top_k, queries=len(queries)):
+        _, ids = ann_index.search(index, queries, top_k, nprobe, ef_search)
+    return [[int(i) for i in row if i >= 0] for row in ids]
+
+
+def search_index(index, question_embedding, top_k=TOP_K, nprobe=None, ef_search=None):
+    """
+    Busca no índice e devolve os IDs dos chunks encontrados, do mais próximo ao mais distante.
+    """
+    return search_index_batch(index, question_embedding, top_k, nprobe, ef_search)[0]
+
+
+def search_all_batch(indexes, question_embeddings, top_k=TOP_K, nprobe=None, ef_search=None):
+    """
+    Busca em todos os sub-índices de chunks (uma chamada por índice com todas as perguntas)
+    e junta os resultados de cada pergunta pela distância.
+    """
+    queries = as_matrix(question_embeddings)
+    results = [[] for _ in range(len(queries))]
+    for chunk_type in CHUNK_TYPES:
+        index = indexes.get(chunk_type)
+        if index is None or index.ntotal == 0:
+            continue
+        with metrics.span("search", k=top_k, queries=len(queries)):
+            distances, ids = ann_index.search(index, queries, top_k, nprobe, ef_search)
+        for row, (row_distances, row_ids) in enumerate(zip(distances, ids)):
+            results[row].extend((float(d), int(i)) for d, i in zip(row_distances, row_ids) if i >= 0)
+    return [[i for _, i in sorted(found)[:top_k]] for found in results]
+
+
+def search_all(indexes, question_embedding, top_k=TOP_K, nprobe=None, ef_search=None):
+    return search_all_batch(indexes, question_embedding, top_k, nprobe, ef_search)[0]
+
+
+def retrieve_batch(chunks, indexes, questions, question_embeddings, top_k=TOP_K, chunk_type=None, mode=None,
+                   nprobe=None, ef_search=None):
+    """
+    IDs dos chunks mais relevantes de um tipo (ou de todos, com chunk_type=None) para cada
+    pergunta, com uma única busca vetorial para todas. question_embeddings: uma linha por pergunta.
+    mode: 'vector' (FAISS), 'bm25' (índice invertido) ou 'hybrid' (funde as duas listas,
+    assim códigos como "GSR120-LI" são achados pela palavra exata e o resto pelo sentido).
+    """
+    mode = mode or RETRIEVAL_MODE
+    candidates = max(top_k, HYBRID_CANDIDATES) if mode == 'hybrid' else top_k
+
+    vector_ids = [[] for _ in questions]
+    if mode != 'bm25' and question_embeddings is not None:
+        if chunk_type is None:
+            vector_ids = search_all_batch(indexes, question_embeddings, candidates, nprobe, ef_search)
+        else:
+            vector_ids = search_index_batch(indexes.get(chunk_type), question_embeddings, candidates, nprobe, ef_search)
+
+    results = []
+    for question, ids in zip(questions, vector_ids):
+        if mode == 'vector' or not question:
+            results.append(ids[:top_k])
+            continue
+        keyword_ids = [chunk_id for chunk_id, _ in chunks.keyword_search(question, candidates, chunk_type)]
+        if mode == 'bm25':
+            results.append(keyword_ids[:top_k])
+        else:
+            results.append(
+                reciprocal_rank_fusion([ids, keyword_ids], [1.0, HYBRID_BM25_WEIGHT], HYBRID_RRF_K)[:top_k]
+            )
+    return results
 
-    for question_type, keywords in keywords_mapping.items():
-        if any(word in question.lower() for word in keywords):
-            return question_type
-    return "text"  
 
-question_type = classify_question(question)
+def retrieve(chunks, indexes, question, question_embedding, top_k=TOP_K, chunk_type=None, mode=None,
+             nprobe=None, ef_search=None):
+    """
+    retrieve_batch para uma pergunta só.
+    """
+    embeddings = None if question_embedding is None else as_matrix(question_embedding)
+    return retrieve_batch(chunks, indexes, [question], embeddings, top_k, chunk_type, mode, nprobe, ef_search)[0]
 
-def evaluate_chunks(question_embedding, retrieved_chunks):
+
+# Palavra da pergunta (sem acento) -> tipo; a ordem dos tipos decide os empates
+QUESTION_KEYWORDS = {
+    "text": ["estratégia", "desempenho", "relatório"],
+    "table": ["dados", "valores", "tabela", "percentual", "total"],
+    "image": ["características", "design", "função", "imagem"]
+}
+KEYWORD_TYPES = {
+    token: question_type
+    for question_type, keywords in QUESTION_KEYWORDS.items() for keyword in keywords for token in tokenize(keyword)
+}
+TYPE_PRIORITY = {question_type: position for position, question_type in enumerate(QUESTION_KEYWORDS)}
+
+
+def classify_question(question):
+    found = set()
+    for token in tokenize(question):
+        # Plural simples: "tabelas" -> "tabela"
+        question_type = KEYWORD_TYPES.get(token) or KEYWORD_TYPES.get(token[:-1] if token.endswith('s') else None)
+        if question_type:
+            found.add(question_type)
+    return min(found, key=TYPE_PRIORITY.get) if found else "text"
+
+def cosine_similarities(vector, matrix):
+    # Mesmo resultado do cosine_similarity do sklearn, sem carregar o sklearn no servidor
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(vector)
+    return (matrix @ vector) / np.where(norms == 0, 1, norms)
+
+def evaluate_chunks(question_embedding, chunk_ids, chunk_embeddings, chunks):
     """
     Avalia a qualidade dos chunks retornados dinamicamente com base na similaridade.
+    Usa os vetores já armazenados no índice em vez de codificar os chunks de novo.
     """
-    if not retrieved_chunks:
+    if not chunk_ids:
         return {
             "cosine_similarity": 0,
             "coverage": 0,
             "precision": 0
         }
 
-    chunk_embeddings = [
-        model.encode([chunk['page_content']], convert_to_numpy=True)[0]
-        for chunk in retrieved_chunks if 'page_content' in chunk
-    ]
-
-    similarities = cosine_similarity(question_embedding, np.array(chunk_embeddings))
-    avg_similarity = np.mean(similarities)
+    similarities = cosine_similarities(question_embedding, chunk_embeddings)
+    avg_similarity = float(np.mean(similarities))
 
     # Define um limite de similaridade para considerar um chunk como relevante
     threshold = 0.7
     relevant_chunks = [
-        chunk for idx, chunk in enumerate(retrieved_chunks)
-        if similarities[0][idx] > threshold
+        chunk_id for idx, chunk_id in enumerate(chunk_ids)
+        if similarities[idx] > threshold
     ]
 
-    precision = len(relevant_chunks) / len(retrieved_chunks) if retrieved_chunks else 0
-    coverage = len(relevant_chunks) / len(chunked_data) if chunked_data else 0
+    precision = len(relevant_chunks) / len(chunk_ids) if chunk_ids else 0
+    coverage = len(relevant_chunks) / len(chunks) if chunks else 0
 
     return {
         "cosine_similarity": avg_similarity,
@@ -86,28 +173,19 @@ def evaluate_chunks(question_embedding, retrieved_chunks):
         "precision": precision
     }
 
-def process_text_question(question_embedding, chunked_data, model):
-    filtered_chunks = [
-        (i, chunk) for i, chunk in enumerate(chunked_data)
-        if chunk.get('metadata', {}).get('type') == 'text'
-    ]
+def process_text_question(question_embedding, chunks, indexes, question=None, chunk_ids=None, **search_options):
+    """
+    chunk_ids: resultado já calculado da busca (ex.: pela busca em lote do /ask_batch).
+    """
+    if chunk_ids is None:
+        chunk_ids = retrieve(chunks, indexes, question, question_embedding, TOP_K, 'text', **search_options)
 
-    if not filtered_chunks:
+    if not chunk_ids:
         return "Nenhum dado textual relevante encontrado.", {}
 
-    filtered_embeddings = [
-        model.encode([chunk['page_content']], convert_to_numpy=True)[0]
-        for _, chunk in filtered_chunks
-    ]
-    filtered_index = faiss.IndexFlatL2(len(filtered_embeddings[0]))
-    filtered_index.add(np.array(filtered_embeddings))
-
-    top_k = 5
-    _, indices = filtered_index.search(np.array(question_embedding, dtype=np.float32), top_k)
-
-    relevant_chunks = [
-        filtered_chunks[idx][1] for idx in indices[0] if idx < len(filtered_chunks)
-    ]
+    # Só as linhas do top-k são lidas do armazenamento
+    relevant_chunks = chunks.get_many(chunk_ids)
+    chunk_ids = [chunk['id'] for chunk in relevant_chunks]
 
     response = "\n".join([
         chunk.get('page_content', 'Conteúdo não encontrado')
@@ -115,55 +193,28 @@ def process_text_question(question_embedding, chunked_data, model):
         if isinstance(chunk, dict)
     ])
 
-    metrics = evaluate_chunks(question_embedding, relevant_chunks)
+    metrics = evaluate_chunks(question_embedding, chunk_ids, chunks.vectors(chunk_ids), chunks)
 
     return response or "Nenhum conteúdo relevante encontrado.", metrics
 
-def process_table_question(question, chunked_data, model):
-    table_path = './table'
-    all_files = [f for f in os.listdir(table_path) if f.endswith('.csv')]
-
-    if not all_files:
-        return "Nenhuma tabela encontrada na pasta /table."
-
-    dataframes = []
-    for file in all_files:
-        df = pd.read_csv(os.path.join(table_path, file))
-        dataframes.append(df)
-
-    if not dataframes:
-        return "As tabelas estão vazias ou não foram carregadas corretamente."
-
-    combined_df = pd.concat(dataframes, ignore_index=True)
-
-    if "total de vendas por produto" in question.lower():
-        result = combined_df.groupby('Produto')['Venda'].sum()
-        return result.to_string()
-
-    elif "ano com maior venda total" in question.lower():
-        result = combined_df.groupby('Ano')['Venda'].sum().idxmax()
-        return f"O ano com maior venda total foi: {result}"
+def process_table_question(question, chunks, tables=None, result=None):
+    """
+    result: resposta do armazenamento de tabelas já calculada (ex.: por TableStore.answer_many).
+    """
+    if tables is None:
+        tables = TableStore()
 
-    elif "vendas por mes" in question.lower():
-        result = combined_df.groupby('Mês')['Venda'].sum()
-        return result.to_string()
+    # Agregações (total, média, maior/menor, contagem) respondidas pelos dados pré-calculados
+    if result is None:
+        result = tables.answer(question)
+    if result is not None:
+        return result
 
     else:
-        filtered_chunks = [
-            chunk for chunk in chunked_data
-            if chunk.get('metadata', {}).get('type') == 'table'
-        ]
+        # Busca pelo índice invertido, só nas tabelas, em vez de varrer todos os chunks
+        table_ids = [chunk_id for chunk_id, _ in chunks.keyword_search(question, TOP_K, 'table')]
 
-        if not filtered_chunks:
-            return "Desculpe, não encontrei nenhuma tabela relevante para sua pergunta."
-
-        keywords = [word for word in question.lower().split() if word.isalnum()]
-
-        relevant_tables = [
-            chunk.get('page_content', '')
-            for chunk in filtered_chunks
-            if any(keyword in chunk.get('page_content', '').lower() for keyword in keywords)
-        ]
+        relevant_tables = [chunk.get('page_content', '') for chunk in chunks.get_many(table_ids)]
 
         if relevant_tables:
             response = "Aqui está o que encontrei relacionado à sua pergunta:\n\n"
@@ -173,51 +224,88 @@ def process_table_question(question, chunked_data, model):
 
         return response
 
-def process_image_question(question, chunked_data, model):
-    image_chunks = [
-        (i, chunk) for i, chunk in enumerate(chunked_data)
-        if chunk.get('metadata', {}).get('type') == 'image'
-    ]
+def retrieve_pages_batch(chunks, indexes, questions, question_embeddings, top_k=IMAGE_TOP_PAGES, mode=None,
+                         nprobe=None, ef_search=None):
+    """
+    IDs das páginas mais relevantes para cada pergunta: uma busca no índice de páginas (embedding
+    médio de cada página) e, nos modos bm25/hybrid, as páginas dos chunks achados pelas palavras.
+    """
+    mode = mode or RETRIEVAL_MODE
+    page_ids = [[] for _ in questions]
+    if mode != 'bm25' and question_embeddings is not None:
+        queries = as_matrix(question_embeddings)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        page_ids = search_index_batch(indexes.get(PAGE_INDEX), queries, top_k, nprobe, ef_search)
+
+    results = []
+    for question, ids in zip(questions, page_ids):
+        if mode == 'vector' or not question:
+            results.append(ids[:top_k])
+            continue
+        keyword_ids = [chunk_id for chunk_id, _ in chunks.keyword_search(question, HYBRID_CANDIDATES)]
+        keyword_pages = chunks.page_ids_for(
+            page_key(chunk) for chunk in chunks.get_many(keyword_ids)
+            if chunk.get('metadata', {}).get('type') in ('text', 'image')
+        )
+        if mode == 'bm25':
+            results.append(keyword_pages[:top_k])
+        else:
+            results.append(
+                reciprocal_rank_fusion([ids, keyword_pages], [1.0, HYBRID_BM25_WEIGHT], HYBRID_RRF_K)[:top_k]
+            )
+    return results
 
-    if not image_chunks:
-        return "Nenhuma imagem relevante encontrada."
 
-    text_chunks = [
-        (i, chunk) for i, chunk in enumerate(chunked_data)
-        if chunk.get('metadata', {}).get('type') == 'text'
-    ]
+def retrieve_pages(chunks, indexes, question, question_embedding, top_k=IMAGE_TOP_PAGES, mode=None,
+                   nprobe=None, ef_search=None):
+    embeddings = None if question_embedding is None else as_matrix(question_embedding)
+    return retrieve_pages_batch(chunks, indexes, [question], embeddings, top_k, mode, nprobe, ef_search)[0]
 
-    text_embeddings = [
-        model.encode([chunk['page_content']], convert_to_numpy=True)[0]
-        for _, chunk in text_chunks
-    ]
 
-    text_index = faiss.IndexFlatL2(len(text_embeddings[0]))
-    text_index.add(np.array(text_embeddings))
-
-    question_embedding = model.encode([question], convert_to_numpy=True)[0]
-    top_k = 5
-    _, indices = text_index.search(np.array([question_embedding], dtype=np.float32), top_k)
+def closest_ids(chunks, chunk_ids, question_embedding, top_k):
+    """
+    Os top_k chunks de chunk_ids mais próximos da pergunta (cosseno), na ordem original da página.
+    """
+    if len(chunk_ids) <= top_k:
+        return chunk_ids
+    if question_embedding is None:
+        return chunk_ids[:top_k]
+    vectors = chunks.vectors(chunk_ids)
+    query = np.array(question_embedding, dtype=np.float32).reshape(-1)
+    scores = (vectors @ query) / np.maximum(np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query) or 1.0), 1e-12)
+    keep = set(np.argsort(-scores)[:top_k].tolist())
+    return [chunk_id for position, chunk_id in enumerate(chunk_ids) if position in keep]
+
+
+def process_image_question(question_embedding, chunks, indexes, question=None, page_ids=None, **search_options):
+    """
+    page_ids: páginas já encontradas (ex.: pela busca em lote do /ask_batch).
+    """
+    image_index = indexes.get('image')
+    if image_index is None or image_index.ntotal == 0:
+        return "Nenhuma imagem relevante encontrada."
 
-    relevant_text_pages = {
-        text_chunks[idx][1].get('metadata', {}).get('page') for idx in indices[0] if idx < len(text_chunks)
-    }
+    # Uma busca só, no índice de páginas, em vez de achar textos e depois varrer as páginas
+    if page_ids is None:
+        page_ids = retrieve_pages(chunks, indexes, question, question_embedding, **search_options)
+    pages = chunks.pages(page_ids)
 
-    relevant_texts = [
-        chunk for i, chunk in text_chunks if chunk.get('metadata', {}).get('page') in relevant_text_pages
-    ]
+    text_ids, image_ids = [], []
+    for page_id in page_ids:
+        page = pages.get(page_id)
+        if page is None:
+            continue
+        text_ids.extend(closest_ids(chunks, page['text_ids'], question_embedding, IMAGE_TEXTS_PER_PAGE))
+        image_ids.extend(page['image_ids'])
 
-    relevant_images = [
-        chunk for i, chunk in image_chunks if chunk.get('metadata', {}).get('page') in relevant_text_pages
-    ]
+    relevant_texts = chunks.get_many(text_ids)
+    relevant_images = chunks.get_many(image_ids)
 
     if not relevant_texts and not relevant_images:
         return "Nenhum texto ou imagem correspondente encontrado para as páginas relevantes."
 
-    response_texts = "\n".join([
-        chunk.get('page_content', 'Conteúdo do texto não encontrado')
-        for chunk in relevant_texts
-    ])
+    # Os trechos vizinhos de uma página se sobrepõem: juntados, cada parte aparece uma vez
+    response_texts = "\n".join(merge_texts(relevant_texts))
 
     response_images = "\n".join([
         chunk.get('metadata', {}).get('path', 'URL da imagem não encontrada')
@@ -232,25 +320,62 @@ def process_image_question(question, chunked_data, model):
     response = response.replace("●", "*")  # Exemplo de substituição
     return response
 
-if question_type == "text":
-    response, metrics = process_text_question(question_embedding, chunked_data, model)
-    print("Resposta gerada com base nos dados mais relevantes:\n")
-    print(response)
-    print("\nMétricas de Avaliação:")
-    print(f"- Similaridade de Coseno Média: {metrics['cosine_similarity']:.4f}")
-    print(f"- Cobertura de Chunks Relevantes: {metrics['coverage']:.4f}")
-    print(f"- Precisão (Precision): {metrics['precision']:.4f}")
-
-elif question_type == "table":
-    response = process_table_question(question, chunked_data, model)
-    print("Resposta gerada com base nos dados mais relevantes:\n")
-    print(response)
-
-elif question_type == "image":
-    response = process_image_question(question, chunked_data, model)
-    print("Resposta gerada com base nos dados mais relevantes:\n")
-    print(response)
-
-else:
-    response = f"Tipo de pergunta '{question_type}' não suportado no momento."
-    print(response)
+
+def format_response(question_type, response, metrics=None):
+    """
+    Monta a saída no mesmo formato que o script sempre imprimiu.
+    """
+    if question_type not in ("text", "table", "image"):
+        return f"Tipo de pergunta '{question_type}' não suportado no momento."
+
+    lines = ["Resposta gerada com base nos dados mais relevantes:\n", response]
+
+    if question_type == "text" and metrics:
+        lines.append("\nMétricas de Avaliação:")
+        lines.append(f"- Similaridade de Coseno Média: {metrics['cosine_similarity']:.4f}")
+        lines.append(f"- Cobertura de Chunks Relevantes: {metrics['coverage']:.4f}")
+        lines.append(f"- Precisão (Precision): {metrics['precision']:.4f}")
+
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Erro: Por favor, forneça uma pergunta como argumento.\nExemplo: python generate_response.py \"Qual é o objetivo deste projeto?\")")
+        sys.exit(1)
+
+    question = sys.argv[1]
+
+    try:
+        model = embedding_model(MODEL_NAME)
+    except Exception as e:
+        print(f"Erro ao carregar o modelo de embeddings: {e}")
+        sys.exit(1)
+
+    try:
+        snapshot = DocumentIndex(lambda: model).load()
+    except FileNotFoundError as e:
+        print(f"Erro: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"Erro ao carregar o índice FAISS: {e}")
+        sys.exit(1)
+
+    question_embedding = model.encode([question], convert_to_numpy=True)
+    question_type = classify_question(question)
+
+    metrics = None
+    if question_type == "text":
+        response, metrics = process_text_question(question_embedding, snapshot.chunks, snapshot.indexes, question)
+    elif question_type == "table":
+        response = process_table_question(question, snapshot.chunks)
+    elif question_type == "image":
+        response = process_image_question(question_embedding, snapshot.chunks, snapshot.indexes, question)
+    else:
+        response = None
+
+    print(format_response(question_type, response, metrics))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,38 @@
 import sys
-import json
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
-from gpt4all import GPT4All  # Biblioteca para LLM local
 
-# Caminhos
-CHUNKED_DATA_FILE = 'chunked_data.json'
-FAISS_INDEX_FILE = 'faiss_index.faiss'
+from config import EMBEDDING_MODEL, LLM_CONTEXT_CHUNKS
+from llm_server import LLMServer, build_prompt
+from document_index import DocumentIndex
+from generate_response import retrieve
+from context_packing import pack_context, format_source
+from model_registry import embedding_model
 
 question = sys.argv[1]
-with open(CHUNKED_DATA_FILE, 'r', encoding='utf-8') as f:
-    chunked_data = json.load(f)
-
-index = faiss.read_index(FAISS_INDEX_FILE)
-model = SentenceTransformer('all-MiniLM-L6-v2')
+model = embedding_model(EMBEDDING_MODEL)
+snapshot = DocumentIndex(lambda: model).load()
 
 question_embedding = model.encode([question])
-k = 3  # Número de chunks relevantes
+k = LLM_CONTEXT_CHUNKS  # Número de chunks relevantes
 question_embedding = np.array(question_embedding, dtype=np.float32)
-distances, indices = index.search(question_embedding, k)
-
-relevant_chunks = []
-sources = []
-for idx in indices[0]:
-    chunk = chunked_data[idx]
-    relevant_chunks.append(chunk['page_content'])
-    # sources.append(chunk.get('source', 'Desconhecido'))  
+indices = retrieve(snapshot.chunks, snapshot.indexes, question, question_embedding, k)
 
-context = "\n".join(relevant_chunks)
-model = GPT4All("gpt4all-lora-quantized.bin")
+# Sem chunks repetidos, vizinhos juntados e limitado ao orçamento de tokens do prompt
+relevant_chunks = snapshot.chunks.get_many(indices)
+filenames = snapshot.chunks.document_filenames(chunk.get('metadata', {}).get('doc_id') for chunk in relevant_chunks)
+packed = pack_context(relevant_chunks, filenames=filenames)
+context = packed['context']
+sources = [format_source(source) for source in packed['sources']]
 
-with model.chat_session():
-    prompt = f"Contexto:\n{context}\n\nPergunta: {question}\nResposta:"
-    response = model.generate(prompt, max_tokens=1024)
+llm = LLMServer()
 
+# Imprime os tokens conforme são gerados
 print("Resposta:")
-print(response)
+for token in llm.stream(build_prompt(context, question)):
+    print(token, end="", flush=True)
+print()
+print(f"\nTempo até o primeiro token: {llm.last_stats['ttft_seconds']}s")
+print(f"Contexto: {packed['tokens']}/{packed['budget']} tokens, {packed['duplicates']} chunks repetidos e {packed['dropped']} trechos fora do limite")
 print("\nFontes:")
 for source in sources:
     print(f"- {source}")
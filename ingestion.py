@@ -0,0 +1,183 @@
+import os
+import csv
+import time
+from contextlib import nullcontext
+import numpy as np
+
+from config import TEXT_DIR, TABLES_DIR, IMAGES_DIR, CHUNK_SETTINGS, EMBEDDING_BATCH_SIZE, INGESTION_DEBUG
+from chunk_processing import text_chunks, table_chunks, image_chunks
+import metrics
+
+
+def table_filename(page, index):
+    sufixo = f"_{index + 1}" if index else ""
+    return f"page_{page}_table{sufixo}.csv"
+
+
+def image_filename(page, imagem):
+    return f"page_{page}_image_{imagem['index']}.{imagem['ext']}"
+
+
+def table_rows(tabela):
+    # Mesmo conteúdo que sairia de um CSV: células vazias viram "" e todo valor vira texto
+    return [["" if cell is None else str(cell) for cell in row] for row in tabela]
+
+
+def page_chunks(pagina, images_dir, chunk_settings=CHUNK_SETTINGS):
+    """
+    Chunks de uma página extraída, com os mesmos nomes e metadados que o chunk_processing.py
+    gera a partir dos arquivos em text/, table/ e img/.
+    """
+    page = pagina["page"]
+    chunks = []
+    if pagina["text"]:
+        chunks.extend(text_chunks(pagina["text"], f"page_{page}.txt", *chunk_settings['text']))
+
+    for indice, tabela in enumerate(pagina["tables"]):
+        rows = table_rows(tabela)
+        chunks.extend(table_chunks(
+            rows[0] if rows else [], rows[1:], table_filename(page, indice), *chunk_settings['table']
+        ))
+
+    for imagem in pagina["images"]:
+        filename = image_filename(page, imagem)
+        chunks.extend(image_chunks(
+            "\n".join(imagem.get("ocr_text", [])), filename, os.path.join(images_dir, filename),
+            *chunk_settings['image']
+        ))
+    return chunks
+
+
+def write_images(pagina, images_dir):
+    paths = []
+    for imagem in pagina["images"]:
+        path = os.path.join(images_dir, image_filename(pagina["page"], imagem))
+        with open(path, "wb") as image_file:
+            image_file.write(imagem["bytes"])
+        paths.append(path)
+    return paths
+
+
+def write_artifacts(pagina, text_dir, tables_dir, images_dir):
+    """
+    Arquivos intermediários de uma página (modo debug): texto, um CSV por tabela e o OCR das imagens.
+    """
+    page = pagina["page"]
+    paths = []
+    if pagina["text"]:
+        path = os.path.join(text_dir, f"page_{page}.txt")
+        with open(path, "w", encoding="utf-8") as text_file:
+            text_file.write(pagina["text"])
+        paths.append(path)
+
+    for indice, tabela in enumerate(pagina["tables"]):
+        path = os.path.join(tables_dir, table_filename(page, indice))
+        with open(path, "w", encoding="utf-8", newline="") as table_file:
+            csv.writer(table_file).writerows(tabela)
+        paths.append(path)
+
+    for imagem in pagina["images"]:
+        path = os.path.join(images_dir, image_filename(page, imagem).rsplit('.', 1)[0] + "_ocr.txt")
+        with open(path, "w", encoding="utf-8") as ocr_file:
+            ocr_file.write("\n".join(imagem.get("ocr_text", [])))
+        paths.append(path)
+    return paths
+
+
+class PdfIngestion:
+    """
+    Ingestão de um PDF em uma passada, direto dos bytes enviados: as faixas de páginas saem
+    do pool de extração em ordem, passam pelo OCR e pelo chunking em memória, e os chunks são
+    codificados em lotes enquanto as faixas seguintes ainda estão sendo extraídas. No fim o
+    documento entra no índice com os vetores já prontos, numa única troca de snapshot.
+
+    Só as imagens vão para o disco (as respostas de imagem apontam para elas); texto, CSVs
+    e OCR são gravados apenas com debug.
+    """
+
+    def __init__(self, engine, ocr_stage, debug=INGESTION_DEBUG, batch_size=EMBEDDING_BATCH_SIZE,
+                 chunk_settings=CHUNK_SETTINGS, text_dir=TEXT_DIR, tables_dir=TABLES_DIR, images_dir=IMAGES_DIR):
+        self.engine = engine
+        self.ocr_stage = ocr_stage
+        self.debug = debug
+        self.batch_size = batch_size
+        self.chunk_settings = chunk_settings
+        self.dirs = (text_dir, tables_dir, images_dir)
+
+    def document_dirs(self, doc_id):
+        return [os.path.join(directory, doc_id) for directory in self.dirs]
+
+    def run(self, doc_id, pdf_bytes, filename=None, job=None, received_at=None):
+        """
+        Extrai, codifica e indexa o documento. received_at (time.perf_counter() do upload)
+        entra na medida do tempo até o documento responder perguntas.
+        """
+        inicio = received_at if received_at is not None else time.perf_counter()
+        # fitz e pdfplumber só são importados no primeiro upload, não na subida do servidor
+        from pdf_extraction import count_pages, iter_page_batches
+        text_dir, tables_dir, images_dir = self.document_dirs(doc_id)
+        os.makedirs(images_dir, exist_ok=True)
+        if self.debug:
+            os.makedirs(text_dir, exist_ok=True)
+            os.makedirs(tables_dir, exist_ok=True)
+
+        numero_paginas = count_pages(pdf_bytes)
+        chunks, vectors, pending, tabelas = [], [], [], []
+        relatorio = {"numero_paginas": numero_paginas, "imagens_paginas": {}, "arquivos_debug": []}
+        tempos = {"ocr": 0.0, "embeddings": 0.0}
+
+        def encode_pending():
+            etapa_inicio = time.perf_counter()
+            vectors.append(self.engine.documents.encode(pending))
+            tempos["embeddings"] += time.perf_counter() - etapa_inicio
+            chunks.extend(pending)
+            pending.clear()
+
+        with self._stage(job, "ingestao", pages=numero_paginas) as etapa:
+            for paginas in iter_page_batches(pdf_bytes, numero_paginas=numero_paginas):
+                # OCR de uma faixa de páginas por vez, direto dos bytes
+                imagens = [imagem for pagina in paginas for imagem in pagina["images"]]
+                etapa_inicio = time.perf_counter()
+                for imagem, ocr_text in zip(imagens, self.ocr_stage.run(imagens) if imagens else []):
+                    imagem["ocr_text"] = ocr_text
+                tempos["ocr"] += time.perf_counter() - etapa_inicio
+
+                for pagina in paginas:
+                    caminhos = write_images(pagina, images_dir)
+                    if caminhos:
+                        relatorio["imagens_paginas"][f"pagina_{pagina['page']}"] = caminhos
+                    if self.debug:
+                        relatorio["arquivos_debug"].extend(write_artifacts(pagina, text_dir, tables_dir, images_dir))
+
+                    tabelas.extend((pagina["page"], indice, tabela) for indice, tabela in enumerate(pagina["tables"]))
+                    with metrics.span("chunking", pages=1) as span:
+                        novos = page_chunks(pagina, images_dir, self.chunk_settings)
+                        span["chunks"] = len(novos)
+                    pending.extend(novos)
+
+                if len(pending) >= self.batch_size:
+                    encode_pending()
+                etapa["pages_done"] = paginas[-1]["page"] if paginas else 0
+
+            if pending:
+                encode_pending()
+            etapa.update(chunks=len(chunks), ocr_seconds=round(tempos["ocr"], 3),
+                         embedding_seconds=round(tempos["embeddings"], 3))
+
+        embeddings = np.vstack(vectors) if vectors else None
+        # Indexa só os chunks deste documento, sem reconstruir o corpus
+        with self._stage(job, "indexacao", chunks=len(chunks), tables=len(tabelas)):
+            self.engine.add_document(doc_id, chunks, filename=filename, tables=tabelas, embeddings=embeddings)
+
+        relatorio["chunks_indexados"] = len(chunks)
+        relatorio["tabelas"] = len(tabelas)
+        relatorio["segundos_ate_consulta"] = round(time.perf_counter() - inicio, 3)
+        if not self.debug:
+            del relatorio["arquivos_debug"]
+        print(f"Documento {doc_id} pronto para consulta em {relatorio['segundos_ate_consulta']:.2f}s "
+              f"({numero_paginas} páginas, {len(chunks)} chunks)")
+        return relatorio
+
+    @staticmethod
+    def _stage(job, name, **info):
+        return job.stage(name, **info) if job is not None else nullcontext(dict(info))
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from config import JOBS_FILE, JOB_WORKERS, JOB_MAX_PENDING
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """
+    Guarda o estado dos jobs em SQLite local, para o status sobreviver a reinícios do servidor.
+    """
+
+    def __init__(self, path=JOBS_FILE):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT, status TEXT, "
+                "created_at REAL, started_at REAL, finished_at REAL, stage TEXT, stages TEXT, "
+                "result TEXT, error TEXT)"
+            )
+            # Jobs que estavam rodando quando o servidor caiu não vão terminar
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Interrompido pelo reinício do servidor' "
+                "WHERE status IN ('queued', 'running')"
+            )
+            self.conn.commit()
+
+    def create(self, job_id, kind):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO jobs (id, kind, status, created_at, stages) VALUES (?, ?, 'queued', ?, '[]')",
+                (job_id, kind, time.time())
+            )
+            self.conn.commit()
+
+    def update(self, job_id, **fields):
+        for key in ('stages', 'result'):
+            if key in fields:
+                fields[key] = json.dumps(fields[key], ensure_ascii=False, default=str)
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.lock:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self.conn.commit()
+
+    def get(self, job_id):
+        with self.lock:
+            self.conn.row_factory = sqlite3.Row
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self.conn.row_factory = None
+        if row is None:
+            return None
+        job = dict(row)
+        job['stages'] = json.loads(job['stages'] or '[]')
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def recent(self, limit=20):
+        with self.lock:
+            ids = [row[0] for row in self.conn.execute(
+                "SELECT id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            )]
+        return [self.get(job_id) for job_id in ids]
+
+
+class Job:
+    """
+    Contexto passado para a função do job: registra as etapas e o tempo de cada uma.
+    """
+
+    def __init__(self, job_id, store):
+        self.id = job_id
+        self.store = store
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **info):
+        etapa = {"name": name, "status": "running", **info}
+        self.stages.append(etapa)
+        self.store.update(self.id, stage=name, stages=self.stages)
+        inicio = time.perf_counter()
+        try:
+            yield etapa
+            etapa["status"] = "done"
+        except Exception:
+            etapa["status"] = "failed"
+            raise
+        finally:
+            etapa["seconds"] = round(time.perf_counter() - inicio, 3)
+            self.store.update(self.id, stages=self.stages)
+
+
+class JobQueue:
+    """
+    Fila local de jobs de ingestão, com concorrência limitada por um pool de threads.
+    O trabalho pesado (extração, OCR) já roda em pools de processos, então as threads
+    do Flask continuam livres para responder o /ask.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING, store=None):
+        self.store = store or JobStore()
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, func, *args, **kwargs):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(f"Fila de processamento cheia ({self.max_pending} jobs pendentes)")
+            self._pending += 1
+
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id, kind)
+        self.executor.submit(self._run, Job(job_id, self.store), func, args, kwargs)
+        return job_id
+
+    def _run(self, job, func, args, kwargs):
+        self.store.update(job.id, status='running', started_at=time.time())
+        try:
+            result = func(job, *args, **kwargs)
+            self.store.update(job.id, status='done', stage=None, result=result, finished_at=time.time())
+        except Exception as e:
+            traceback.print_exc()
+            self.store.update(job.id, status='failed', error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        return self.store.get(job_id)
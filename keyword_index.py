@@ -0,0 +1,135 @@
+import math
+import re
+from collections import Counter
+
+from config import BM25_K1, BM25_B
+from text_normalization import fold
+
+# Palavras muito comuns em português e inglês, que não ajudam a separar os chunks
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das no na nos nas em por para com sem sobre entre
+e ou que se ao aos qual quais quando onde como foi foram ser sao esta este isso isto essa esse
+mais menos muito ja nao sim seu sua seus suas me te lhe the an of to in on for with and or is are
+was were be by at from this that these those it its what which how
+""".split())
+
+# Códigos de produto: letras e números ligados por hífen, ponto, barra ou sublinhado
+TOKEN_RE = re.compile(r'[a-z0-9]+(?:[-_./][a-z0-9]+)*')
+SEPARATOR_RE = re.compile(r'[-_./]')
+
+
+def tokenize(text):
+    """
+    Tokens sem acentos e sem stopwords. Um código como "GSR120-LI" gera as partes
+    ("gsr120", "li") e a forma junta ("gsr120li"), para casar com qualquer grafia.
+    """
+    tokens = []
+    for match in TOKEN_RE.findall(fold(text)):
+        parts = SEPARATOR_RE.split(match)
+        if len(parts) > 1:
+            tokens.append("".join(parts))
+        tokens.extend(part for part in parts if part not in STOPWORDS)
+    return tokens
+
+
+def create_tables(conn):
+    conn.executescript(
+        "CREATE TABLE IF NOT EXISTS postings (term TEXT, chunk_id INTEGER, tf INTEGER);"
+        "CREATE INDEX IF NOT EXISTS postings_term ON postings (term);"
+        "CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);"
+        "CREATE TABLE IF NOT EXISTS doc_lengths (chunk_id INTEGER PRIMARY KEY, type TEXT, length INTEGER);"
+        "CREATE TABLE IF NOT EXISTS keyword_stats (type TEXT PRIMARY KEY, docs INTEGER, total_length INTEGER);"
+    )
+
+
+def _update_stats(conn, deltas):
+    for chunk_type, (docs, length) in deltas.items():
+        conn.execute(
+            "INSERT INTO keyword_stats (type, docs, total_length) VALUES (?, ?, ?) "
+            "ON CONFLICT(type) DO UPDATE SET docs = docs + excluded.docs, total_length = total_length + excluded.total_length",
+            (chunk_type, docs, length)
+        )
+
+
+def index_chunks(conn, chunks):
+    """
+    Acrescenta os chunks (com 'id') ao índice invertido. Não faz commit.
+    """
+    postings, lengths, deltas = [], [], {}
+    for chunk in chunks:
+        chunk_type = chunk.get('metadata', {}).get('type')
+        counts = Counter(tokenize(chunk.get('page_content', '')))
+        length = sum(counts.values())
+        postings.extend((term, chunk['id'], tf) for term, tf in counts.items())
+        lengths.append((chunk['id'], chunk_type, length))
+        docs, total = deltas.get(chunk_type, (0, 0))
+        deltas[chunk_type] = (docs + 1, total + length)
+
+    conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", postings)
+    conn.executemany("INSERT OR REPLACE INTO doc_lengths (chunk_id, type, length) VALUES (?, ?, ?)", lengths)
+    _update_stats(conn, deltas)
+
+
+def delete_chunks(conn, chunk_ids):
+    deltas = {}
+    for start in range(0, len(chunk_ids), 500):
+        batch = chunk_ids[start:start + 500]
+        placeholders = ",".join("?" * len(batch))
+        for chunk_type, docs, length in conn.execute(
+                f"SELECT type, COUNT(*), SUM(length) FROM doc_lengths WHERE chunk_id IN ({placeholders}) GROUP BY type",
+                batch):
+            previous = deltas.get(chunk_type, (0, 0))
+            deltas[chunk_type] = (previous[0] - docs, previous[1] - (length or 0))
+        conn.execute(f"DELETE FROM postings WHERE chunk_id IN ({placeholders})", batch)
+        conn.execute(f"DELETE FROM doc_lengths WHERE chunk_id IN ({placeholders})", batch)
+    _update_stats(conn, deltas)
+
+
+def search(conn, query, top_k=10, chunk_type=None, k1=BM25_K1, b=BM25_B):
+    """
+    BM25 sobre o índice invertido: cada termo da pergunta é uma consulta pelo índice
+    da tabela postings, sem percorrer os chunks. Devolve [(chunk_id, score)].
+    """
+    terms = Counter(tokenize(query))
+    if not terms:
+        return []
+
+    if chunk_type is None:
+        docs, total_length = conn.execute("SELECT SUM(docs), SUM(total_length) FROM keyword_stats").fetchone()
+    else:
+        docs, total_length = conn.execute(
+            "SELECT docs, total_length FROM keyword_stats WHERE type = ?", (chunk_type,)
+        ).fetchone() or (0, 0)
+    if not docs:
+        return []
+    average_length = (total_length or 0) / docs or 1.0
+
+    scores = {}
+    for term, query_tf in terms.items():
+        sql = ("SELECT p.chunk_id, p.tf, d.length FROM postings p JOIN doc_lengths d ON d.chunk_id = p.chunk_id "
+               "WHERE p.term = ?")
+        params = [term]
+        if chunk_type is not None:
+            sql += " AND d.type = ?"
+            params.append(chunk_type)
+        rows = conn.execute(sql, params).fetchall()
+        if not rows:
+            continue
+        idf = math.log(1 + (docs - len(rows) + 0.5) / (len(rows) + 0.5))
+        for chunk_id, tf, length in rows:
+            score = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + score * query_tf
+
+    return sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k=60):
+    """
+    Junta listas de IDs ordenadas (vetorial, BM25...) somando peso / (k + posição).
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank + 1)
+    return [chunk_id for chunk_id, _ in sorted(scores.items(), key=lambda item: -item[1])]
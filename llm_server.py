@@ -0,0 +1,108 @@
+import threading
+import time
+from contextlib import nullcontext
+
+from config import LLM_MODEL, LLM_MAX_TOKENS
+import metrics
+from model_registry import REGISTRY
+
+
+class FakeGenerator:
+    """
+    Substituto do GPT4All para testes e desenvolvimento: devolve tokens fixos
+    (ou ecoa o prompt) com o mesmo formato de generate(..., streaming=True).
+    """
+
+    def __init__(self, tokens=None, delay=0.0):
+        self.tokens = tokens
+        self.delay = delay
+
+    def generate(self, prompt, max_tokens=LLM_MAX_TOKENS, streaming=False):
+        tokens = self.tokens or [f"{word} " for word in prompt.split()[-20:]]
+        tokens = tokens[:max_tokens]
+
+        def stream():
+            for token in tokens:
+                if self.delay:
+                    time.sleep(self.delay)
+                yield token
+
+        return stream() if streaming else "".join(tokens)
+
+
+def load_gpt4all(model_name=LLM_MODEL):
+    from gpt4all import GPT4All  # Biblioteca para LLM local
+    return GPT4All(model_name)
+
+
+def build_prompt(context, question):
+    return f"Contexto:\n{context}\n\nPergunta: {question}\nResposta:"
+
+
+class LLMServer:
+    """
+    Mantém o LLM local carregado no processo e gera a resposta token a token.
+    A métrica principal é o tempo até o primeiro token (TTFT).
+    """
+
+    def __init__(self, model_name=LLM_MODEL, max_tokens=LLM_MAX_TOKENS, factory=None):
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+        if factory is None:
+            factory = FakeGenerator if model_name == 'fake' else (lambda: load_gpt4all(model_name))
+        self.factory = factory
+
+        self.model = None
+        self.load_seconds = None
+        self.last_stats = None
+        self._load_lock = threading.Lock()
+        # O modelo do GPT4All não é thread-safe: uma geração por vez
+        self._generate_lock = threading.Lock()
+
+    def get_model(self):
+        with self._load_lock:
+            if self.model is None:
+                inicio = time.perf_counter()
+                self.model = REGISTRY.load(f"llm:{self.model_name}", self.factory, "llm_load")
+                self.load_seconds = time.perf_counter() - inicio
+        return self.model
+
+    def stream(self, prompt, max_tokens=None, stats=None):
+        """
+        Gera tokens conforme saem do modelo. Ao final, stats (e last_stats) recebe
+        TTFT, tempo total e tokens/s desta geração.
+        """
+        stats = {} if stats is None else stats
+        model = self.get_model()
+        max_tokens = max_tokens or self.max_tokens
+
+        with self._generate_lock:
+            inicio = time.perf_counter()
+            ttft = None
+            tokens = 0
+
+            # Cada pergunta é uma sessão nova, sem histórico das anteriores
+            session = model.chat_session() if hasattr(model, 'chat_session') else nullcontext()
+            with session:
+                for token in model.generate(prompt, max_tokens=max_tokens, streaming=True):
+                    if ttft is None:
+                        ttft = time.perf_counter() - inicio
+                        print(f"LLM: primeiro token em {ttft:.3f}s")
+                    tokens += 1
+                    yield token
+
+            total = time.perf_counter() - inicio
+            stats.update({
+                "ttft_seconds": round(ttft, 4) if ttft is not None else None,
+                "total_seconds": round(total, 4),
+                "tokens": tokens,
+                "tokens_per_second": round(tokens / total, 2) if total else 0,
+            })
+            self.last_stats = stats
+            metrics.record("llm_generation", total, tokens=tokens)
+            if ttft is not None:
+                metrics.record("llm_first_token", ttft)
+            print(f"LLM: {tokens} tokens em {total:.2f}s (TTFT {stats['ttft_seconds']}s)")
+
+    def generate(self, prompt, max_tokens=None):
+        return "".join(self.stream(prompt, max_tokens))
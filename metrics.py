@@ -0,0 +1,163 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import METRICS_BUCKETS
+
+HELP = {
+    'rag_stage_seconds': 'Duração de cada etapa (extração, OCR, chunking, embeddings, busca, LLM...)',
+    'rag_stage_items_total': 'Itens processados por etapa (páginas, imagens, chunks, k...)',
+    'rag_stage_errors_total': 'Etapas que terminaram com exceção',
+    'rag_request_seconds': 'Duração das requisições HTTP por rota',
+    'rag_requests_total': 'Requisições HTTP por rota e status',
+    'rag_answer_cache_hits_total': 'Acertos do cache de respostas do /ask, por nível (exact, semantic)',
+    'rag_answer_cache_misses_total': 'Perguntas do /ask que não estavam no cache de respostas',
+    'rag_answer_cache_saved_seconds_total': 'Tempo de resposta economizado pelos acertos do cache',
+    'rag_answer_cache_evictions_total': 'Respostas tiradas do cache por LRU ou limite de memória',
+    'rag_answer_cache_invalidations_total': 'Descartes do cache inteiro por troca de versão do índice',
+    'rag_answer_cache_entries': 'Respostas no cache',
+    'rag_answer_cache_bytes': 'Memória estimada das respostas no cache',
+    'rag_answer_cache_hit_rate': 'Acertos / consultas do cache de respostas desde a subida',
+}
+
+# Spans da requisição atual, quando alguém pediu o detalhamento (ver trace())
+_current_trace = ContextVar('current_trace', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    Histogramas, contadores e gauges em memória, no formato texto do Prometheus. Sem
+    dependência externa: o /metrics só precisa de render().
+    """
+
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            # Contagens já acumuladas: cada bucket conta as observações <= limite
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][position] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+
+        for name in sorted({name for (name, _), _ in histograms}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), histogram in histograms:
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram['buckets']):
+                    lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:.6f}")
+                lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+
+        for name in sorted({name for (name, _), _ in counters}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in counters:
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+
+        for name in sorted({name for (name, _), _ in gauges}):
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} gauge")
+            for (metric, labels), value in gauges:
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def record(stage, seconds, error=False, **counts):
+    """
+    Registra uma etapa já medida (ex.: tempos que voltam dos processos de extração).
+    """
+    REGISTRY.observe('rag_stage_seconds', seconds, stage=stage)
+    for item, value in counts.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            REGISTRY.inc('rag_stage_items_total', value, stage=stage, item=item)
+    if error:
+        REGISTRY.inc('rag_stage_errors_total', stage=stage)
+
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append(dict(counts, stage=stage, seconds=round(seconds, 6)))
+
+
+@contextmanager
+def span(stage, **counts):
+    """
+    Mede o bloco como uma etapa. As contagens (pages, images, chunks, k...) podem ser
+    completadas dentro do bloco pelo dicionário devolvido.
+    """
+    info = dict(counts)
+    inicio = time.perf_counter()
+    error = False
+    try:
+        yield info
+    except Exception:
+        error = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - inicio, error, **info)
+
+
+@contextmanager
+def trace():
+    """
+    Coleta os spans registrados nesta thread enquanto o bloco roda, para devolver o
+    detalhamento de tempos junto com a resposta.
+    """
+    spans = []
+    token = _current_trace.set(spans)
+    try:
+        yield spans
+    finally:
+        _current_trace.reset(token)
+
+
+def observe_request(endpoint, status, seconds):
+    REGISTRY.observe('rag_request_seconds', seconds, endpoint=endpoint)
+    REGISTRY.inc('rag_requests_total', endpoint=endpoint, status=status)
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import metrics
+
+
+def current_rss():
+    """
+    Memória residente do processo em bytes (0 quando não dá para medir).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # Pico de memória (KB no Linux): só uma aproximação fora do /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def parameter_bytes(model):
+    """
+    Bytes dos pesos de modelos torch: o próprio objeto ou os módulos guardados nos atributos
+    (o Reader do easyocr guarda detector e recognizer). None quando não há pesos à vista.
+    """
+    if hasattr(model, 'parameters'):
+        modules = [model]
+    else:
+        modules = [value for value in getattr(model, '__dict__', {}).values() if hasattr(value, 'parameters')]
+    total = None
+    for module in modules:
+        try:
+            size = sum(parameter.numel() * parameter.element_size() for parameter in module.parameters())
+        except Exception:
+            continue
+        total = (total or 0) + size
+    return total
+
+
+class ModelRegistry:
+    """
+    Modelos do processo (embeddings, OCR, LLM) carregados uma única vez, no primeiro uso ou
+    no aquecimento, e compartilhados pela ingestão e pelas consultas. Guarda o tempo de carga
+    e a memória de cada um: o aumento da memória residente durante a carga (aproximado quando
+    duas cargas se sobrepõem) e, para modelos torch, o tamanho dos pesos.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._info = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        # Nome curto (embedding, ocr, llm) -> função que carrega o modelo, para o aquecimento
+        self._warmups = {}
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def load(self, key, factory, stage=None):
+        """
+        Devolve o modelo de key, chamando factory só na primeira vez. stage registra o
+        tempo de carga no /metrics.
+        """
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._key_lock(key):
+            model = self._models.get(key)
+            if model is None:
+                print(f"Carregando modelo: {key}")
+                rss_inicio = current_rss()
+                inicio = time.perf_counter()
+                with metrics.span(stage) if stage else nullcontext():
+                    model = factory()
+                seconds = time.perf_counter() - inicio
+                self._info[key] = {
+                    'load_seconds': round(seconds, 3),
+                    'rss_delta_mb': round(max(0, current_rss() - rss_inicio) / 2 ** 20, 1),
+                    'parameters_mb': None,
+                    'loaded_at': time.time(),
+                    'pid': os.getpid(),
+                }
+                weights = parameter_bytes(model)
+                if weights is not None:
+                    self._info[key]['parameters_mb'] = round(weights / 2 ** 20, 1)
+                self._models[key] = model
+                print(f"Modelo {key} carregado em {seconds:.2f}s (+{self._info[key]['rss_delta_mb']} MB)")
+        return model
+
+    def is_loaded(self, key):
+        return key in self._models
+
+    def register_warmup(self, name, loader):
+        self._warmups[name] = loader
+
+    def warmup(self, names=None):
+        """
+        Carrega os modelos pedidos (todos os registrados quando names é None). Devolve o
+        tempo de cada nome e os erros, sem interromper os outros carregamentos.
+        """
+        names = list(self._warmups) if names is None else list(names)
+        unknown = [name for name in names if name not in self._warmups]
+        if unknown:
+            raise KeyError(f"Modelos desconhecidos: {', '.join(unknown)}. Use {', '.join(self._warmups)}")
+
+        resultado = {}
+        for name in names:
+            inicio = time.perf_counter()
+            try:
+                self._warmups[name]()
+                resultado[name] = {'seconds': round(time.perf_counter() - inicio, 3)}
+            except Exception as e:
+                print(f"Erro ao aquecer o modelo {name}: {e}")
+                resultado[name] = {'error': str(e)}
+        return resultado
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'rss_mb': round(current_rss() / 2 ** 20, 1),
+            'warmup': sorted(self._warmups),
+            # inherited: carregado no processo pai antes do fork (páginas compartilhadas)
+            'models': {key: dict(info, inherited=info['pid'] != os.getpid()) for key, info in self._info.items()},
+        }
+
+
+REGISTRY = ModelRegistry()
+
+
+def embedding_model(model_name):
+    # Backend (torch ou onnx) conforme EMBEDDING_BACKEND, com volta para o SentenceTransformer
+    from encoder_backend import load_encoder
+    return REGISTRY.load(f"embedding:{model_name}", lambda: load_encoder(model_name), "model_load")
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import multiprocessing
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    OCR_LANGUAGES, OCR_WORKERS, OCR_BATCH_SIZE, OCR_MIN_BYTES, OCR_MIN_PIXELS,
+    OCR_THREADS_PER_WORKER, OCR_CACHE_FILE, PROCESS_START_METHOD
+)
+import metrics
+from model_registry import REGISTRY
+
+# Reader do easyocr de cada processo do pool (criado uma vez pelo initializer)
+_worker_reader = None
+
+
+def _load_easyocr(languages):
+    import easyocr
+    return easyocr.Reader(list(languages), gpu=False)
+
+
+def _create_reader(languages):
+    # Um Reader por processo: cada worker do pool carrega o seu no initializer
+    return REGISTRY.load(f"ocr:{','.join(languages)}", lambda: _load_easyocr(languages), "ocr_model_load")
+
+
+def _init_worker(languages, threads):
+    global _worker_reader
+    import torch
+    torch.set_num_threads(threads)
+    _worker_reader = _create_reader(languages)
+
+
+def _ocr_batch(batch):
+    """
+    Roda o OCR de um lote de imagens (bytes) dentro do worker.
+    """
+    return [_worker_reader.readtext(image_bytes, detail=0) for image_bytes in batch]
+
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class OcrCache:
+    """
+    Resultados de OCR persistidos em SQLite, indexados pelo hash da imagem. A conexão é
+    compartilhada pelas threads dos uploads, então cada leitura e gravação segura o lock.
+    """
+
+    def __init__(self, path=OCR_CACHE_FILE, languages=OCR_LANGUAGES):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, lines TEXT)")
+        self.conn.commit()
+        self.languages = ",".join(languages)
+
+    def key(self, digest):
+        return f"{self.languages}:{digest}"
+
+    def get_many(self, digests):
+        found = {}
+        digests = list(digests)
+        with self._lock:
+            for start in range(0, len(digests), 500):
+                batch = [self.key(digest) for digest in digests[start:start + 500]]
+                placeholders = ",".join("?" * len(batch))
+                for key, lines in self.conn.execute(f"SELECT key, lines FROM ocr WHERE key IN ({placeholders})", batch):
+                    found[key.split(":", 1)[1]] = json.loads(lines)
+        return found
+
+    def put_many(self, items):
+        rows = [(self.key(digest), json.dumps(lines, ensure_ascii=False)) for digest, lines in items]
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO ocr (key, lines) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+
+class OcrStage:
+    """
+    Etapa de OCR das imagens extraídas: trabalha direto nos bytes, deduplica por hash,
+    ignora imagens pequenas demais, consulta o cache e só manda as faltas para o pool.
+    """
+
+    def __init__(self, workers=OCR_WORKERS, batch_size=OCR_BATCH_SIZE, languages=OCR_LANGUAGES,
+                 min_bytes=OCR_MIN_BYTES, min_pixels=OCR_MIN_PIXELS, cache_file=OCR_CACHE_FILE):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.languages = languages
+        self.min_bytes = min_bytes
+        self.min_pixels = min_pixels
+        self.cache = OcrCache(cache_file, languages)
+
+        self._pool = None
+        self._reader = None
+
+    def _get_pool(self):
+        # O pool fica vivo entre uploads para não recarregar o modelo do easyocr em cada um
+        if self._pool is None:
+            # Sem fork: o processo do servidor já tem threads do torch e do OpenMP
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.languages, OCR_THREADS_PER_WORKER),
+                mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
+            )
+        return self._pool
+
+    def get_reader(self):
+        if self._reader is None:
+            self._reader = _create_reader(self.languages)
+        return self._reader
+
+    def _ocr_inline(self, images):
+        self.get_reader()
+        return [self._reader.readtext(image_bytes, detail=0) for image_bytes in images]
+
+    def is_too_small(self, image):
+        if len(image["bytes"]) < self.min_bytes:
+            return True
+        width, height = image.get("width"), image.get("height")
+        return bool(width and height and width * height < self.min_pixels)
+
+    def run(self, images):
+        """
+        Recebe imagens no formato do pdf_extraction ({"bytes", "xref", "width", "height", ...})
+        e devolve a lista de linhas de OCR de cada uma, na mesma ordem.
+        """
+        inicio = time.perf_counter()
+
+        # Mesmo xref dentro do PDF é a mesma imagem: evita até calcular o hash de novo
+        digest_by_xref = {}
+        digests = []
+        for image in images:
+            xref = image.get("xref")
+            if xref is not None and xref in digest_by_xref:
+                digests.append(digest_by_xref[xref])
+                continue
+            digest = None if self.is_too_small(image) else image_hash(image["bytes"])
+            if xref is not None:
+                digest_by_xref[xref] = digest
+            digests.append(digest)
+
+        unique = {digest: image["bytes"] for digest, image in zip(digests, images) if digest is not None}
+        results = self.cache.get_many(unique)
+        missing = [digest for digest in unique if digest not in results]
+
+        if missing:
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            if self.workers <= 1:
+                texts = self._ocr_inline([unique[digest] for digest in missing])
+            else:
+                pool = self._get_pool()
+                texts = [
+                    lines for batch_lines in pool.map(_ocr_batch, [[unique[d] for d in batch] for batch in batches])
+                    for lines in batch_lines
+                ]
+            new_items = list(zip(missing, texts))
+            self.cache.put_many(new_items)
+            results.update(new_items)
+
+        elapsed = time.perf_counter() - inicio
+        metrics.record("ocr", elapsed, images=len(images), unique=len(unique), processed=len(missing))
+        print(f"OCR: {len(images)} imagens, {len(unique)} únicas, {len(unique) - len(missing)} no cache, "
+              f"{len(missing)} processadas, {digests.count(None)} ignoradas em {elapsed:.2f}s")
+
+        return [results.get(digest, []) if digest is not None else [] for digest in digests]
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+import pdfplumber
+import fitz
+
+from config import EXTRACTION_WORKERS, PAGES_PER_TASK, PROCESS_START_METHOD
+import metrics
+
+# Pools de extração por número de workers: ficam vivos entre uploads, como o do OCR
+_pools = {}
+_pools_lock = threading.Lock()
+
+# PDF lido por último em cada worker do pool: (caminho, bytes)
+_worker_pdf = (None, None)
+
+
+def outside_bboxes(bboxes):
+    """
+    Filtro do pdfplumber que descarta os caracteres cujo centro cai dentro de alguma tabela.
+    """
+    def keep(obj):
+        if obj.get("object_type") != "char":
+            return True
+        x = (obj["x0"] + obj["x1"]) / 2
+        y = (obj["top"] + obj["bottom"]) / 2
+        return not any(x0 <= x <= x1 and top <= y <= bottom for x0, top, x1, bottom in bboxes)
+    return keep
+
+
+def extract_page_range(pdf_bytes, start, end, timings=None):
+    """
+    Extrai texto, tabelas e imagens das páginas [start, end) num único worker.
+    Cada página vira um dicionário com o número da página (começando em 1).
+    timings recebe os segundos gastos em abrir o PDF, em texto/tabelas e em imagens.
+    """
+    timings = {} if timings is None else timings
+    timings.update(pdf_open=0.0, text_tables=0.0, images=0.0)
+    pages = []
+    inicio = time.perf_counter()
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+
+    with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+        timings["pdf_open"] += time.perf_counter() - inicio
+        for i in range(start, end):
+            inicio = time.perf_counter()
+            pagina = pdf.pages[i]
+            encontradas = pagina.find_tables()
+            tabelas = [tabela.extract() for tabela in encontradas]
+
+            # O texto fora das áreas das tabelas sai numa única passada pelos caracteres
+            bboxes = [tabela.bbox for tabela in encontradas]
+            if bboxes:
+                pagina = pagina.filter(outside_bboxes(bboxes))
+            texto_exclusivo = pagina.extract_text() or ""
+            timings["text_tables"] += time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            imagens = []
+            for img_index, img in enumerate(doc[i].get_images(full=True)):
+                xref = img[0]
+                base_image = doc.extract_image(xref)
+                imagens.append({
+                    "index": img_index + 1,
+                    "xref": xref,
+                    "bytes": base_image["image"],
+                    "ext": base_image["ext"],
+                    "width": base_image.get("width"),
+                    "height": base_image.get("height"),
+                })
+            timings["images"] += time.perf_counter() - inicio
+
+            pages.append({
+                "page": i + 1,
+                "text": texto_exclusivo.strip(),
+                "tables": tabelas,
+                "images": imagens,
+            })
+
+    doc.close()
+    return pages
+
+
+def _extract_task(args):
+    # Os tempos voltam junto com as páginas: os spans são registrados no processo principal
+    timings = {}
+    return extract_page_range(*args, timings=timings), timings
+
+
+def _worker_bytes(path):
+    # Cada worker lê o arquivo temporário uma vez por PDF, não uma vez por faixa de páginas
+    global _worker_pdf
+    if _worker_pdf[0] != path:
+        with open(path, 'rb') as f:
+            _worker_pdf = (path, f.read())
+    return _worker_pdf[1]
+
+
+def _extract_file_task(args):
+    path, start, end = args
+    return _extract_task((_worker_bytes(path), start, end))
+
+
+def _get_pool(workers):
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # Sem fork: o processo do servidor já tem threads do torch e do OpenMP
+            pool = _pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context(PROCESS_START_METHOD)
+            )
+        return pool
+
+
+def _discard_pool(workers, pool):
+    # Um worker que morreu quebra o pool inteiro: o próximo PDF cria outro
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False)
+
+
+def _record_timings(pages, timings):
+    metrics.record("pdf_open", timings["pdf_open"])
+    metrics.record("extract_text_tables", timings["text_tables"], pages=len(pages),
+                   tables=sum(len(page["tables"]) for page in pages))
+    metrics.record("extract_images", timings["images"], pages=len(pages),
+                   images=sum(len(page["images"]) for page in pages))
+
+
+def count_pages(pdf_bytes):
+    with metrics.span("pdf_open") as span:
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            span["pages"] = len(doc)
+            return len(doc)
+
+
+def iter_page_batches(pdf_bytes, workers=EXTRACTION_WORKERS, pages_per_task=PAGES_PER_TASK, numero_paginas=None):
+    """
+    Divide o PDF em faixas de páginas, extrai cada faixa num processo do pool e entrega as
+    faixas em ordem assim que ficam prontas, para o consumidor trabalhar enquanto as
+    próximas ainda estão sendo extraídas.
+
+    O PDF vai para um arquivo temporário uma única vez: as tarefas levam só o caminho e a
+    faixa, em vez de cada uma serializar o PDF inteiro para o worker.
+    """
+    numero_paginas = count_pages(pdf_bytes) if numero_paginas is None else numero_paginas
+    ranges = [
+        (start, min(start + pages_per_task, numero_paginas))
+        for start in range(0, numero_paginas, pages_per_task)
+    ]
+
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            pages, timings = _extract_task((pdf_bytes, start, end))
+            _record_timings(pages, timings)
+            yield pages
+        return
+
+    fd, path = tempfile.mkstemp(prefix='extracao_', suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_bytes)
+        pool = _get_pool(workers)
+        try:
+            for pages, timings in pool.map(_extract_file_task, [(path, start, end) for start, end in ranges]):
+                _record_timings(pages, timings)
+                yield pages
+        except BrokenProcessPool:
+            _discard_pool(workers, pool)
+            raise
+    finally:
+        os.remove(path)
+
+
+def extract_pdf(pdf_bytes, workers=EXTRACTION_WORKERS, pages_per_task=PAGES_PER_TASK):
+    """
+    Extrai o PDF inteiro. O resultado é sempre ordenado pelo número da página,
+    independente da ordem de conclusão.
+    """
+    numero_paginas = count_pages(pdf_bytes)
+    inicio = time.perf_counter()
+    results = list(iter_page_batches(pdf_bytes, workers, pages_per_task, numero_paginas))
+
+    pages = sorted((page for result in results for page in result), key=lambda page: page["page"])
+    elapsed = time.perf_counter() - inicio
+    print(f"Extração: {numero_paginas} páginas em {elapsed:.2f}s "
+          f"({numero_paginas / elapsed if elapsed else 0:.1f} páginas/s, {workers} workers)")
+    return numero_paginas, pages
+
+
+if __name__ == '__main__':
+    # Mede o ganho do pool: python pdf_extraction.py relatorio.pdf
+    if len(sys.argv) < 2:
+        print("Uso: python pdf_extraction.py arquivo.pdf")
+        sys.exit(1)
+
+    with open(sys.argv[1], 'rb') as f:
+        conteudo = f.read()
+
+    tempos = {}
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        inicio = time.perf_counter()
+        extract_pdf(conteudo, workers=workers)
+        tempos[workers] = time.perf_counter() - inicio
+
+    for workers, tempo in tempos.items():
+        print(f"{workers} workers: {tempo:.2f}s (speedup {tempos[1] / tempo:.2f}x)")
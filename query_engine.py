@@ -0,0 +1,320 @@
+import threading
+import time
+import numpy as np
+
+import generate_response as gr
+from config import TABLES_DIR, EMBEDDING_MODEL, INDEX_CHECK_SECONDS, SHARDS, LLM_CONTEXT_CHUNKS, LLM_CONTEXT_TOKENS
+from context_packing import pack_context
+from document_index import DocumentIndex
+from encoder_backend import loaded_variant
+from table_store import TableStore
+from answer_cache import AnswerCache
+from shard_index import ShardCoordinator
+import metrics
+from model_registry import embedding_model
+
+
+class QueryEngine:
+    """
+    Mantém o modelo de embeddings, os índices FAISS, os chunks e as tabelas
+    carregados no processo do Flask, para que cada pergunta custe apenas
+    o encode da pergunta e a busca.
+    """
+
+    def __init__(self, model_name=EMBEDDING_MODEL, table_path=TABLES_DIR, nprobe=None, ef_search=None, shards=SHARDS,
+                 **index_files):
+        self.model_name = model_name
+        self.table_path = table_path
+        # Ajustes de busca para índices IVF (nprobe) e HNSW (ef_search); None usa o padrão do índice
+        self.search_options = {'nprobe': nprobe, 'ef_search': ef_search}
+
+        self.model = None
+        self.tables = TableStore()
+        self.cache = AnswerCache()
+        # Com shards, os índices FAISS e as buscas vetoriais ficam nos processos de shard; este
+        # processo só mantém o armazenamento de chunks e o BM25
+        self.documents = DocumentIndex(self._get_model, model_name=model_name, local_indexes=not shards,
+                                       **index_files)
+        self.shards = ShardCoordinator(shards) if shards else None
+
+        self._model_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._loaded = False
+        self._last_check = 0.0
+        self.cold_start = None
+
+    def _get_model(self):
+        with self._model_lock:
+            if self.model is None:
+                # O mesmo modelo é compartilhado com a ingestão e os outros motores do processo
+                self.model = embedding_model(self.model_name)
+            # Os índices só carregam se foram gerados com a variante do encoder que responde às perguntas
+            self.documents.variant = loaded_variant(self.model)
+        return self.model
+
+    def reload(self):
+        """
+        Relê índices, chunks e tabelas do disco. Chamado pelo /execute após reconstruir os dados
+        e quando outro processo grava uma versão nova. O snapshot anterior continua atendendo
+        as perguntas até a troca.
+        """
+        inicio = time.perf_counter()
+        self._get_model()
+        model_seconds = time.perf_counter() - inicio
+        snapshot = self.documents.load()
+        if self.shards is not None:
+            self.shards.load_store(snapshot.chunks)
+        # Respostas calculadas com o índice anterior não valem mais
+        self.cache.clear()
+        if self.tables.is_empty():
+            # Corpus de antes do armazenamento de tabelas: importa os CSVs uma vez
+            self.tables.rebuild_from_csv(self.table_path)
+        self._loaded = True
+
+        if self.cold_start is None:
+            self.cold_start = {
+                'model_seconds': round(model_seconds, 4),
+                'index': snapshot.load_stats,
+                'total_seconds': round(time.perf_counter() - inicio, 4),
+            }
+            print(f"Partida a frio: {self.cold_start['total_seconds']:.3f}s "
+                  f"(modelo {model_seconds:.3f}s, índices {snapshot.load_stats['seconds']:.3f}s)")
+
+        sizes = ", ".join(f"{chunk_type}: {index.ntotal}" for chunk_type, index in self.indexes(snapshot).items())
+        print(f"Motor de consulta carregado: {len(snapshot.chunks)} chunks ({sizes}), versão {snapshot.version}")
+
+    def _reload_if_stale(self):
+        now = time.monotonic()
+        if now - self._last_check < INDEX_CHECK_SECONDS:
+            return
+        self._last_check = now
+        # Só uma thread recarrega; as outras seguem com o snapshot atual
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            if self.documents.is_stale():
+                self.reload()
+        except Exception as e:
+            print(f"Erro ao recarregar os índices, mantendo a versão atual: {e}")
+        finally:
+            self._reload_lock.release()
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            with self._reload_lock:
+                if not self._loaded:
+                    self.reload()
+        else:
+            self._reload_if_stale()
+        # Cada pergunta usa um único snapshot, mesmo que um documento seja indexado no meio
+        return self.documents.snapshot
+
+    def add_document(self, doc_id, chunks, filename=None, tables=None, embeddings=None):
+        """
+        Indexa (ou substitui) um documento sem reconstruir o corpus inteiro.
+        tables: lista de (página, índice, linhas) das tabelas do documento.
+        embeddings: vetores dos chunks, quando já foram calculados.
+        """
+        if not self._loaded:
+            current = self.documents.load_or_empty()
+            if self.shards is not None:
+                self.shards.load_store(current.chunks)
+            self._loaded = True
+        snapshot = self.documents.add_document(doc_id, chunks, filename, embeddings)
+        if self.shards is not None:
+            self.shards.add_from_store(snapshot.chunks, doc_id)
+        if tables is not None:
+            self.tables.add_document(doc_id, tables)
+        return snapshot
+
+    def remove_document(self, doc_id):
+        self.ensure_loaded()
+        snapshot = self.documents.remove_document(doc_id)
+        if self.shards is not None:
+            self.shards.remove_document(doc_id)
+        self.tables.remove_document(doc_id)
+        return snapshot
+
+    def indexes(self, snapshot):
+        # Índices usados nas buscas: os do snapshot ou as visões dos shards
+        return self.shards.indexes() if self.shards is not None else snapshot.indexes
+
+    def encode(self, question):
+        model = self._get_model()
+        with metrics.span("question_embedding", questions=1):
+            return model.encode([question], convert_to_numpy=True)
+
+    def _search_options(self, overrides):
+        options = dict(self.search_options)
+        options.update((key, value) for key, value in overrides.items() if value is not None)
+        return options
+
+    def process_text_question(self, question, question_embedding=None, **search_options):
+        snapshot = self.ensure_loaded()
+        if question_embedding is None:
+            question_embedding = self.encode(question)
+        return gr.process_text_question(
+            question_embedding, snapshot.chunks, self.indexes(snapshot), question, **self._search_options(search_options)
+        )
+
+    def process_table_question(self, question):
+        snapshot = self.ensure_loaded()
+        return gr.process_table_question(question, snapshot.chunks, self.tables)
+
+    def process_image_question(self, question, question_embedding=None, **search_options):
+        snapshot = self.ensure_loaded()
+        if question_embedding is None:
+            question_embedding = self.encode(question)
+        return gr.process_image_question(
+            question_embedding, snapshot.chunks, self.indexes(snapshot), question, **self._search_options(search_options)
+        )
+
+    def context_chunks(self, question, k, **search_options):
+        """
+        Os k chunks mais próximos da pergunta, de qualquer tipo, para montar o contexto do LLM.
+        """
+        snapshot = self.ensure_loaded()
+        chunk_ids = gr.retrieve(
+            snapshot.chunks, self.indexes(snapshot), question, self.encode(question), k, **self._search_options(search_options)
+        )
+        return snapshot.chunks.get_many(chunk_ids)
+
+    def llm_context(self, question, k=LLM_CONTEXT_CHUNKS, budget=LLM_CONTEXT_TOKENS, **search_options):
+        """
+        Contexto do prompt do LLM com os k chunks mais próximos, sem repetições e limitado a
+        budget tokens, com as fontes de cada trecho (ver context_packing.pack_context).
+        """
+        chunks = self.context_chunks(question, k, **search_options)
+        snapshot = self.ensure_loaded()
+        with metrics.span("context_packing", chunks=len(chunks)) as info:
+            filenames = snapshot.chunks.document_filenames(
+                chunk.get('metadata', {}).get('doc_id') for chunk in chunks
+            )
+            packed = pack_context(chunks, budget=budget, filenames=filenames)
+            info['tokens'] = packed['tokens']
+        return packed
+
+    def answer(self, question, use_cache=True, **search_options):
+        """
+        Responde uma pergunta (é o /ask_batch com uma pergunta só).
+        """
+        return self.answer_batch([question], use_cache, **search_options)[0]
+
+    def answer_batch(self, questions, use_cache=True, **search_options):
+        """
+        Responde uma lista de perguntas, na mesma ordem. Passa antes pelo cache: pergunta igual
+        (normalizada) e, para texto e imagem, pergunta parecida. A versão inclui o índice e as
+        tabelas, então qualquer documento novo invalida as respostas antigas.
+
+        As perguntas de texto e imagem são codificadas num único encode e buscadas com uma
+        consulta FAISS por índice para todas (uma linha da matriz por pergunta); as de tabela
+        dividem as agregações iguais no armazenamento de tabelas.
+        """
+        snapshot = self.ensure_loaded()
+        inicio = time.perf_counter()
+        options = self._search_options(search_options)
+        version = (snapshot.version, self.tables.version())
+        types = [gr.classify_question(question) for question in questions]
+        contexts = [(question_type, tuple(sorted(options.items()))) for question_type in types]
+        results = [None] * len(questions)
+
+        pending = []
+        for position, question in enumerate(questions):
+            cached = self.cache.get(question, version, contexts[position]) if use_cache else None
+            if cached is not None:
+                results[position] = cached
+            else:
+                pending.append(position)
+
+        # Perguntas de tabela não passam pelo nível semântico: "vendas por mês" e
+        # "vendas por produto" têm embeddings quase iguais e respostas diferentes
+        encode_positions = [position for position in pending if types[position] in ("text", "image")]
+        embeddings = {}
+        if encode_positions:
+            model = self._get_model()
+            with metrics.span("question_embedding", questions=len(encode_positions)):
+                matrix = model.encode([questions[p] for p in encode_positions], convert_to_numpy=True)
+            embeddings = dict(zip(encode_positions, matrix))
+
+        if use_cache:
+            misses = []
+            for position in pending:
+                cached = None
+                if position in embeddings:
+                    cached = self.cache.get_similar(embeddings[position], version, contexts[position])
+                if cached is not None:
+                    results[position] = cached
+                    continue
+                self.cache.miss()
+                misses.append(position)
+            pending = misses
+
+        chunks, indexes = snapshot.chunks, self.indexes(snapshot)
+        by_type = {
+            question_type: [position for position in pending if types[position] == question_type]
+            for question_type in ("text", "table", "image")
+        }
+        answered = {}
+
+        positions = by_type["text"]
+        if positions:
+            ids = gr.retrieve_batch(
+                chunks, indexes, [questions[p] for p in positions], np.vstack([embeddings[p] for p in positions]),
+                gr.TOP_K, 'text', **options
+            )
+            for position, chunk_ids in zip(positions, ids):
+                answered[position] = gr.process_text_question(
+                    embeddings[position].reshape(1, -1), chunks, indexes, questions[position], chunk_ids=chunk_ids
+                )
+
+        positions = by_type["table"]
+        if positions:
+            table_answers = self.tables.answer_many([questions[p] for p in positions])
+            for position, result in zip(positions, table_answers):
+                answered[position] = (
+                    gr.process_table_question(questions[position], chunks, self.tables, result=result), None
+                )
+
+        positions = by_type["image"]
+        if positions:
+            page_ids = gr.retrieve_pages_batch(
+                chunks, indexes, [questions[p] for p in positions], np.vstack([embeddings[p] for p in positions]),
+                **options
+            )
+            for position, ids in zip(positions, page_ids):
+                answered[position] = (gr.process_image_question(
+                    embeddings[position].reshape(1, -1), chunks, indexes, questions[position], page_ids=ids
+                ), None)
+
+        # O tempo do lote dividido entre as respostas calculadas é o que cada acerto economiza
+        seconds = (time.perf_counter() - inicio) / len(pending) if pending else 0.0
+        for position in pending:
+            response, response_metrics = answered.get(position, (None, None))
+            results[position] = gr.format_response(types[position], response, response_metrics)
+            if use_cache:
+                self.cache.put(questions[position], version, results[position], contexts[position],
+                               embeddings.get(position), seconds)
+        return results
+
+    def throughput(self, questions, **search_options):
+        """
+        Perguntas por segundo do lote contra uma chamada por pergunta, as duas sem cache.
+        """
+        self.ensure_loaded()
+        inicio = time.perf_counter()
+        self.answer_batch(questions, use_cache=False, **search_options)
+        batch_seconds = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        for question in questions:
+            self.answer(question, use_cache=False, **search_options)
+        single_seconds = time.perf_counter() - inicio
+
+        return {
+            'questions': len(questions),
+            'batch': {'seconds': round(batch_seconds, 4),
+                      'qps': round(len(questions) / batch_seconds, 2) if batch_seconds else None},
+            'single': {'seconds': round(single_seconds, 4),
+                       'qps': round(len(questions) / single_seconds, 2) if single_seconds else None},
+            'speedup': round(single_seconds / batch_seconds, 2) if batch_seconds else None,
+        }
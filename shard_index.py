@@ -0,0 +1,530 @@
+import os
+import sys
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+import ann_index
+from config import CHUNK_TYPES, PAGE_INDEX, SHARDS, SHARD_THREADS
+import metrics
+
+INDEX_TYPES = CHUNK_TYPES + (PAGE_INDEX,)
+
+
+def merge_results(results, k):
+    """
+    Junta os (distâncias, IDs) de cada shard nos k mais próximos de cada pergunta.
+    IDs -1 (shard com menos de k vetores) ficam no fim.
+    """
+    distances = np.hstack([result[0] for result in results]).astype(np.float32)
+    ids = np.hstack([result[1] for result in results]).astype(np.int64)
+    distances[ids < 0] = np.inf
+    if distances.shape[1] < k:
+        pad = k - distances.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class Shard:
+    """
+    Índices FAISS (um por tipo) dos documentos de um shard. Roda dentro do processo do
+    shard; guarda os IDs de cada documento para removê-lo ou entregá-lo a outro shard.
+    """
+
+    def __init__(self):
+        self.indexes = {}
+        self.documents = {}
+
+    def sizes(self):
+        return {index_type: int(index.ntotal) for index_type, index in self.indexes.items()}
+
+    def add(self, documents):
+        """
+        documents: {doc_id: {tipo: (IDs, vetores)}}. Tipos ainda vazios são construídos de uma
+        vez com todos os vetores (o treino do IVF vê o lote inteiro); os outros só recebem add.
+        """
+        for doc_id in documents:
+            if doc_id in self.documents:
+                self.remove(doc_id)
+
+        for index_type in INDEX_TYPES:
+            parts = [vectors_by_type[index_type] for vectors_by_type in documents.values()
+                     if len(vectors_by_type.get(index_type, ((), ()))[0])]
+            if not parts:
+                continue
+            ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids, _ in parts])
+            vectors = np.ascontiguousarray(np.vstack([vectors for _, vectors in parts]), dtype=np.float32)
+            index = self.indexes.get(index_type)
+            if index is None or index.ntotal == 0:
+                self.indexes[index_type], _ = ann_index.build_index(vectors, ids, vectors.shape[1])
+            else:
+                index.add_with_ids(vectors, ids)
+
+        for doc_id, vectors_by_type in documents.items():
+            self.documents[doc_id] = {
+                index_type: [int(i) for i in ids] for index_type, (ids, _) in vectors_by_type.items() if len(ids)
+            }
+        return self.sizes()
+
+    def remove(self, doc_id):
+        for index_type, ids in self.documents.pop(doc_id, {}).items():
+            index = self.indexes.get(index_type)
+            if index is None:
+                continue
+            if ann_index.supports_remove(index):
+                index.remove_ids(np.asarray(ids, dtype=np.int64))
+                continue
+            # HNSW não remove: reconstrói o tipo com os vetores dos documentos que ficam
+            keep = [i for vector_ids in self.documents.values() for i in vector_ids.get(index_type, ())]
+            if keep:
+                vectors = np.vstack([index.reconstruct(i) for i in keep])
+                self.indexes[index_type], _ = ann_index.build_index(vectors, keep, vectors.shape[1])
+            else:
+                del self.indexes[index_type]
+        return self.sizes()
+
+    def take(self, doc_id):
+        """
+        Tira o documento deste shard e devolve os seus vetores, para outro shard receber.
+        """
+        vectors_by_type = {
+            index_type: (ids, np.vstack([self.indexes[index_type].reconstruct(i) for i in ids]))
+            for index_type, ids in self.documents.get(doc_id, {}).items()
+        }
+        return vectors_by_type, self.remove(doc_id)
+
+    def reset(self):
+        self.indexes, self.documents = {}, {}
+        return self.sizes()
+
+    def search(self, index_type, queries, k, nprobe=None, ef_search=None):
+        index = self.indexes.get(index_type)
+        if index is None or index.ntotal == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        return ann_index.search(index, queries, k, nprobe, ef_search)
+
+
+def _shard_worker(address, threads, authkey):
+    """
+    Laço do processo do shard: recebe (comando, argumentos) e responde ('ok', resultado)
+    ou ('error', mensagem).
+    """
+    if threads:
+        import faiss
+        faiss.omp_set_num_threads(threads)
+    with Listener(address, family='AF_UNIX', authkey=authkey) as listener:
+        connection = listener.accept()
+    shard = Shard()
+    while True:
+        try:
+            command, args = connection.recv()
+        except EOFError:
+            break
+        if command == 'stop':
+            connection.send(('ok', None))
+            break
+        try:
+            connection.send(('ok', getattr(shard, command)(*args)))
+        except Exception as e:
+            connection.send(('error', f"{type(e).__name__}: {e}"))
+
+
+class ShardProcess:
+    """
+    Um processo de shard visto pelo coordenador: canal, trava (uma conversa por vez) e o
+    tamanho atual de cada índice.
+
+    O processo é um interpretador novo (python shard_index.py worker ...), não um fork nem
+    um spawn do multiprocessing: o spawn reexecutaria o app.py inteiro em cada shard, e o
+    fork de um processo que já usou o OpenMP do FAISS pode travar no filho.
+    """
+
+    def __init__(self, shard_id, threads, socket_dir, start_timeout=60):
+        self.shard_id = shard_id
+        address = os.path.join(socket_dir, f"shard-{shard_id}.sock")
+        authkey = os.urandom(16)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), 'worker', address, str(threads)],
+            env=dict(os.environ, SHARD_AUTHKEY=authkey.hex())
+        )
+        self.connection = self._connect(address, authkey, start_timeout)
+        self.lock = threading.Lock()
+        self.sizes = {}
+
+    def _connect(self, address, authkey, timeout):
+        limite = time.monotonic() + timeout
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Shard {self.shard_id} terminou ao iniciar (código {self.process.returncode})")
+            try:
+                return Client(address, family='AF_UNIX', authkey=authkey)
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > limite:
+                    self.process.kill()
+                    raise RuntimeError(f"Shard {self.shard_id} não respondeu em {timeout}s")
+                time.sleep(0.05)
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def send(self, command, *args):
+        self.connection.send((command, args))
+
+    def receive(self):
+        status, result = self.connection.recv()
+        if status != 'ok':
+            raise RuntimeError(f"Shard {self.shard_id}: {result}")
+        return result
+
+    def call(self, command, *args):
+        with self.lock:
+            self.send(command, *args)
+            return self.receive()
+
+    def stop(self):
+        with self.lock:
+            try:
+                self.send('stop')
+                self.receive()
+            except (EOFError, OSError):
+                pass
+            self.connection.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class ShardedIndex:
+    """
+    Visão de um tipo de índice espalhado pelos shards, com ntotal e search como um índice
+    FAISS (a busca passa por ann_index.search, que repassa nprobe e ef_search).
+    """
+    is_sharded = True
+
+    def __init__(self, coordinator, index_type):
+        self.coordinator = coordinator
+        self.index_type = index_type
+
+    @property
+    def ntotal(self):
+        return self.coordinator.ntotal(self.index_type)
+
+    def search(self, queries, k, nprobe=None, ef_search=None):
+        return self.coordinator.search(self.index_type, queries, k, nprobe, ef_search)
+
+
+class ShardCoordinator:
+    """
+    Divide os documentos entre processos de shard, cada um com os seus índices FAISS, e faz
+    a busca em todos ao mesmo tempo (scatter-gather): a mesma matriz de perguntas vai para
+    cada shard e os top-k voltam juntados pela distância. Um documento inteiro fica num
+    shard só, escolhido pela menor carga, então remover ou substituir mexe em um processo.
+    Shards podem ser adicionados (recebem documentos dos mais cheios) ou removidos (os
+    documentos vão para os outros) com o serviço no ar.
+    """
+
+    def __init__(self, shards=SHARDS, threads=SHARD_THREADS):
+        self.initial_shards = max(1, shards)
+        self.threads = threads
+        self._shards = {}
+        self._next_shard_id = 0
+        self._socket_dir = None
+        # doc_id -> shard e doc_id -> vetores (a carga de cada shard)
+        self.assignment = {}
+        self.document_sizes = {}
+        self._lock = threading.RLock()
+
+    def _start_shard(self, total_shards):
+        threads = self.threads or max(1, (os.cpu_count() or 1) // total_shards)
+        shard = ShardProcess(self._next_shard_id, threads, self._socket_dir)
+        self._shards[shard.shard_id] = shard
+        self._next_shard_id += 1
+        return shard
+
+    def start(self):
+        """
+        Sobe os processos na primeira carga, não na criação: importar o app continua rápido.
+        """
+        with self._lock:
+            if self._socket_dir is None:
+                self._socket_dir = tempfile.mkdtemp(prefix='shards_')
+                atexit.register(self.close)
+                for _ in range(self.initial_shards):
+                    self._start_shard(self.initial_shards)
+                print(f"{self.initial_shards} shards iniciados")
+
+    def shard_ids(self):
+        return sorted(self._shards)
+
+    def load(self, shard_id):
+        return sum(self.document_sizes[doc_id] for doc_id, shard in self.assignment.items() if shard == shard_id)
+
+    def _least_loaded(self, exclude=()):
+        loads = {shard_id: self.load(shard_id) for shard_id in self._shards if shard_id not in exclude}
+        return min(loads, key=lambda shard_id: (loads[shard_id], shard_id))
+
+    def ntotal(self, index_type):
+        return sum(shard.sizes.get(index_type, 0) for shard in list(self._shards.values()))
+
+    def indexes(self):
+        return {index_type: ShardedIndex(self, index_type) for index_type in INDEX_TYPES}
+
+    @staticmethod
+    def document_vectors(store, doc_id):
+        """
+        {tipo: (IDs, vetores)} de um documento, lidos do armazenamento de chunks.
+        """
+        vectors_by_type = {}
+        for index_type, ids in store.document_vector_ids(doc_id).items():
+            vectors = store.page_vectors(ids) if index_type == PAGE_INDEX else store.vectors(ids)
+            vectors_by_type[index_type] = (ids, vectors)
+        return vectors_by_type
+
+    def load_store(self, store):
+        """
+        Redistribui todo o corpus do armazenamento de chunks entre os shards.
+        """
+        return self.load_documents({doc_id: self.document_vectors(store, doc_id) for doc_id in store.document_ids()})
+
+    def load_documents(self, documents):
+        """
+        Substitui o conteúdo dos shards por documents ({doc_id: {tipo: (IDs, vetores)}}): do
+        maior documento para o menor, cada um vai para o shard com menos vetores. Os shards
+        constroem os índices em paralelo.
+        """
+        inicio = time.perf_counter()
+        self.start()
+        with self._lock:
+            sizes = {doc_id: sum(len(ids) for ids, _ in vectors.values()) for doc_id, vectors in documents.items()}
+            self.assignment, self.document_sizes = {}, {}
+            por_shard = {shard_id: {} for shard_id in self._shards}
+            for doc_id in sorted(documents, key=lambda doc_id: -sizes[doc_id]):
+                shard_id = self._least_loaded()
+                self.assignment[doc_id], self.document_sizes[doc_id] = shard_id, sizes[doc_id]
+                por_shard[shard_id][doc_id] = documents[doc_id]
+
+            shards = [self._shards[shard_id] for shard_id in sorted(por_shard)]
+            for shard in shards:
+                shard.lock.acquire()
+            try:
+                replies = self._scatter(shards, 'reset')
+                if all(status == 'ok' for status, _ in replies):
+                    replies = self._scatter(shards, 'add', lambda shard: (por_shard[shard.shard_id],))
+                for shard, (status, result) in zip(shards, replies):
+                    if status == 'ok':
+                        shard.sizes = result
+                self._check(replies)
+            finally:
+                for shard in shards:
+                    shard.lock.release()
+        print(f"Shards carregados: {len(documents)} documentos em {len(shards)} shards "
+              f"({time.perf_counter() - inicio:.2f}s)")
+
+    def add_document(self, doc_id, vectors_by_type):
+        """
+        Indexa (ou substitui) um documento. Um documento já conhecido fica no mesmo shard.
+        """
+        self.start()
+        with self._lock:
+            shard_id = self.assignment.get(doc_id)
+            if shard_id is None:
+                shard_id = self._least_loaded()
+            shard = self._shards[shard_id]
+            shard.sizes = shard.call('add', {doc_id: vectors_by_type})
+            self.assignment[doc_id] = shard_id
+            self.document_sizes[doc_id] = sum(len(ids) for ids, _ in vectors_by_type.values())
+            return shard_id
+
+    def add_from_store(self, store, doc_id):
+        return self.add_document(doc_id, self.document_vectors(store, doc_id))
+
+    def remove_document(self, doc_id):
+        with self._lock:
+            shard_id = self.assignment.pop(doc_id, None)
+            self.document_sizes.pop(doc_id, None)
+            if shard_id is not None:
+                shard = self._shards[shard_id]
+                shard.sizes = shard.call('remove', doc_id)
+            return shard_id
+
+    def _move(self, doc_id, target_id):
+        source = self._shards[self.assignment[doc_id]]
+        vectors_by_type, source.sizes = source.call('take', doc_id)
+        target = self._shards[target_id]
+        target.sizes = target.call('add', {doc_id: vectors_by_type})
+        self.assignment[doc_id] = target_id
+
+    def add_shard(self):
+        """
+        Sobe um shard novo e move documentos dos shards mais cheios para ele até ficar
+        perto da média (ou até nenhum documento caber sem passar da média).
+        """
+        self.start()
+        with self._lock:
+            shard = self._start_shard(len(self._shards) + 1)
+            target = sum(self.document_sizes.values()) / len(self._shards)
+            moved = 0
+            while True:
+                source_id = max((shard_id for shard_id in self._shards if shard_id != shard.shard_id),
+                                key=self.load, default=None)
+                falta = target - self.load(shard.shard_id)
+                candidates = [doc_id for doc_id, shard_id in self.assignment.items()
+                              if shard_id == source_id and self.document_sizes[doc_id] <= falta]
+                if source_id is None or falta <= 0 or not candidates:
+                    break
+                self._move(max(candidates, key=self.document_sizes.get), shard.shard_id)
+                moved += 1
+            print(f"Shard {shard.shard_id} adicionado, {moved} documentos movidos para ele")
+            return shard.shard_id
+
+    def remove_shard(self, shard_id):
+        """
+        Move os documentos do shard para os outros (o de menor carga primeiro) e encerra o processo.
+        """
+        with self._lock:
+            if shard_id not in self._shards:
+                raise KeyError(shard_id)
+            if len(self._shards) == 1:
+                raise ValueError("Não é possível remover o único shard")
+            documents = [doc_id for doc_id, owner in self.assignment.items() if owner == shard_id]
+            for doc_id in sorted(documents, key=lambda doc_id: -self.document_sizes[doc_id]):
+                self._move(doc_id, self._least_loaded(exclude=(shard_id,)))
+            self._shards.pop(shard_id).stop()
+            print(f"Shard {shard_id} removido, {len(documents)} documentos redistribuídos")
+            return len(documents)
+
+    @staticmethod
+    def _scatter(shards, command, args=lambda shard: ()):
+        """
+        Manda o comando a cada shard (com as travas já seguras) e lê a resposta de todos os que
+        o receberam, mesmo depois de um erro: uma resposta deixada no canal seria lida como a
+        do próximo comando daquele shard. Devolve um (status, resultado) por shard.
+        """
+        replies = {}
+        for shard in shards:
+            try:
+                shard.send(command, *args(shard))
+            except Exception as e:
+                replies[shard.shard_id] = ('error', f"Shard {shard.shard_id}: {type(e).__name__}: {e}")
+        for shard in shards:
+            if shard.shard_id in replies:
+                continue
+            try:
+                replies[shard.shard_id] = ('ok', shard.receive())
+            except RuntimeError as e:
+                replies[shard.shard_id] = ('error', str(e))
+            except Exception as e:
+                replies[shard.shard_id] = ('error', f"Shard {shard.shard_id}: {type(e).__name__}: {e}")
+        return [replies[shard.shard_id] for shard in shards]
+
+    @staticmethod
+    def _check(replies):
+        """
+        Resultados das respostas, ou RuntimeError com os erros de todos os shards que falharam.
+        """
+        errors = [result for status, result in replies if status != 'ok']
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return [result for _, result in replies]
+
+    def search(self, index_type, queries, k, nprobe=None, ef_search=None):
+        """
+        Manda as perguntas a todos os shards com vetores desse tipo e junta os k mais próximos.
+        """
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        shards = [shard for _, shard in sorted(self._shards.items()) if shard.sizes.get(index_type)]
+        if not shards:
+            return (np.full((len(queries), k), np.inf, dtype=np.float32),
+                    np.full((len(queries), k), -1, dtype=np.int64))
+
+        with metrics.span("shard_search", shards=len(shards), queries=len(queries), k=k):
+            # Travas sempre na ordem dos IDs, para duas buscas simultâneas não se bloquearem
+            for shard in shards:
+                shard.lock.acquire()
+            try:
+                replies = self._scatter(shards, 'search', lambda shard: (index_type, queries, k, nprobe, ef_search))
+            finally:
+                for shard in shards:
+                    shard.lock.release()
+        return merge_results(self._check(replies), k)
+
+    def stats(self):
+        return {
+            'shards': {
+                shard_id: {
+                    'pid': shard.pid,
+                    'alive': shard.is_alive(),
+                    'documents': sum(1 for owner in self.assignment.values() if owner == shard_id),
+                    'vectors': shard.sizes,
+                }
+                for shard_id, shard in sorted(self._shards.items())
+            },
+            'documents': len(self.assignment),
+        }
+
+    def close(self):
+        with self._lock:
+            for shard in self._shards.values():
+                shard.stop()
+            self._shards = {}
+            if self._socket_dir is not None:
+                shutil.rmtree(self._socket_dir, ignore_errors=True)
+                self._socket_dir = None
+
+
+def benchmark(vectors=200000, dimension=384, documents=400, queries=256, k=10, shard_counts=None, repeat=3):
+    """
+    Buscas por segundo com 1, 2, 4... shards (uma thread do FAISS por shard, então o número de
+    shards é também o de núcleos usados), em lote e em perguntas isoladas de várias threads.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((vectors, dimension)).astype(np.float32)
+    perguntas = rng.standard_normal((queries, dimension)).astype(np.float32)
+    docs = np.array_split(np.arange(vectors, dtype=np.int64), documents)
+    shard_counts = shard_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+
+    resultados = {}
+    for shards in shard_counts:
+        coordinator = ShardCoordinator(shards, threads=1)
+        coordinator.load_documents({f"doc{number}": {'text': (ids, matrix[ids])} for number, ids in enumerate(docs)})
+        coordinator.search('text', perguntas[:1], k)
+
+        inicio = time.perf_counter()
+        for _ in range(repeat):
+            coordinator.search('text', perguntas, k)
+        batch_qps = queries * repeat / (time.perf_counter() - inicio)
+
+        with ThreadPoolExecutor(max_workers=shards * 2) as pool:
+            inicio = time.perf_counter()
+            list(pool.map(lambda row: coordinator.search('text', perguntas[row:row + 1], k), range(queries)))
+            single_qps = queries / (time.perf_counter() - inicio)
+
+        coordinator.close()
+        resultados[shards] = {'batch_qps': round(batch_qps, 1), 'single_qps': round(single_qps, 1)}
+        print(f"{shards} shards: lote {batch_qps:.1f} perguntas/s, isoladas {single_qps:.1f} perguntas/s "
+              f"(speedup {batch_qps / resultados[shard_counts[0]]['batch_qps']:.2f}x)")
+    return resultados
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'worker':
+        # Processo de shard, iniciado pelo ShardProcess: python shard_index.py worker <socket> <threads>
+        _shard_worker(sys.argv[2], int(sys.argv[3]), bytes.fromhex(os.environ['SHARD_AUTHKEY']))
+    else:
+        # Escalabilidade com o número de shards e núcleos: python shard_index.py [vetores] [shards...]
+        total = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+        benchmark(total, shard_counts=[int(value) for value in sys.argv[2:]] or None)
@@ -0,0 +1,450 @@
+import csv
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+from config import TABLE_DB_FILE, TABLES_DIR, TABLE_CATEGORY_MAX_DISTINCT
+from text_normalization import fold, words
+import metrics
+
+# Palavras da pergunta que escolhem a operação (já sem acentos)
+OPERATIONS = {
+    'max': ('maior', 'maximo', 'mais'),
+    'min': ('menor', 'minimo', 'menos'),
+    'avg': ('media', 'medio'),
+    'count': ('quantos', 'quantas', 'quantidade'),
+}
+GROUP_MARKERS = ('por', 'cada')
+
+
+def parse_number(value):
+    """
+    Converte células como "1.234,56", "R$ 10", "15%" ou "2023". Devolve None se não for número.
+    """
+    text = str(value).strip().replace('R$', '').replace('%', '').replace(' ', '')
+    if not text or not re.fullmatch(r'[-+]?[\d.,]+', text):
+        return None
+    if ',' in text and '.' in text:
+        if text.rfind(',') > text.rfind('.'):
+            text = text.replace('.', '').replace(',', '.')
+        else:
+            text = text.replace(',', '')
+    elif ',' in text:
+        text = text.replace(',', '.')
+    try:
+        number = float(text)
+    except ValueError:
+        return None
+    return int(number) if number.is_integer() and '.' not in text else number
+
+
+def column_dtype(values):
+    filled = [value for value in values if str(value).strip()]
+    if not filled:
+        return 'text'
+    numbers = [parse_number(value) for value in filled]
+    if any(number is None for number in numbers):
+        return 'text'
+    return 'integer' if all(isinstance(number, int) for number in numbers) else 'real'
+
+
+def format_number(value):
+    if value is None:
+        return "-"
+    if float(value).is_integer():
+        return f"{int(value)}"
+    return f"{value:.2f}"
+
+
+class TableStore:
+    """
+    Tabelas dos PDFs num SQLite local: cada tabela vira uma tabela SQL com colunas tipadas,
+    com o documento e a página de origem no catálogo. Soma e contagem de cada coluna
+    numérica por cada coluna categórica são calculadas na ingestão, então as perguntas
+    comuns são respondidas sem reler CSVs.
+    """
+
+    def __init__(self, path=TABLE_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._catalog = None
+        self._catalog_version = None
+        self._write_lock = threading.Lock()
+        self._conn().executescript(
+            "CREATE TABLE IF NOT EXISTS tables (id INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT, page INTEGER, "
+            "table_index INTEGER, name TEXT, n_rows INTEGER);"
+            "CREATE TABLE IF NOT EXISTS columns (table_id INTEGER, position INTEGER, name TEXT, key TEXT, "
+            "sql_name TEXT, dtype TEXT, distinct_count INTEGER, category INTEGER);"
+            "CREATE TABLE IF NOT EXISTS aggregates (table_id INTEGER, measure TEXT, group_column TEXT, "
+            "group_value TEXT, total REAL, count INTEGER);"
+            "CREATE INDEX IF NOT EXISTS aggregates_key ON aggregates (measure, group_column);"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_version(self, conn):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(self.version() + 1),)
+        )
+
+    def is_empty(self):
+        return self._conn().execute("SELECT COUNT(*) FROM tables").fetchone()[0] == 0
+
+    # Ingestão
+
+    def _insert_table(self, conn, doc_id, page, table_index, rows):
+        rows = [[("" if cell is None else str(cell)).strip() for cell in row] for row in rows if row]
+        if len(rows) < 2:
+            return
+
+        header, data = rows[0], rows[1:]
+        width = max(len(row) for row in rows)
+        names, keys = [], []
+        for position in range(width):
+            name = header[position] if position < len(header) and header[position] else f"coluna_{position + 1}"
+            key = fold(name) or f"coluna_{position + 1}"
+            # Cabeçalhos repetidos ganham sufixo para continuarem distinguíveis
+            while key in keys:
+                key += '_'
+            names.append(name)
+            keys.append(key)
+        data = [row + [""] * (width - len(row)) for row in data]
+
+        cursor = conn.execute(
+            "INSERT INTO tables (doc_id, page, table_index, n_rows) VALUES (?, ?, ?, ?)",
+            (doc_id, page, table_index, len(data))
+        )
+        table_id = cursor.lastrowid
+        table_name = f"t_{table_id}"
+
+        columns = []
+        for position, (name, key) in enumerate(zip(names, keys)):
+            values = [row[position] for row in data]
+            dtype = column_dtype(values)
+            distinct = len({value for value in values if value})
+            category = dtype == 'text' or (dtype == 'integer' and distinct <= TABLE_CATEGORY_MAX_DISTINCT)
+            columns.append((table_id, position, name, key, f"c{position}", dtype, distinct, int(category)))
+
+        sql_types = {'text': 'TEXT', 'integer': 'INTEGER', 'real': 'REAL'}
+        conn.execute(f"CREATE TABLE {table_name} ({', '.join(f'{c[4]} {sql_types[c[5]]}' for c in columns)})")
+        conn.executemany(
+            f"INSERT INTO {table_name} VALUES ({','.join('?' * width)})",
+            [
+                [parse_number(row[c[1]]) if c[5] != 'text' else (row[c[1]] or None) for c in columns]
+                for row in data
+            ]
+        )
+        conn.execute("UPDATE tables SET name = ? WHERE id = ?", (table_name, table_id))
+        conn.executemany("INSERT INTO columns VALUES (?, ?, ?, ?, ?, ?, ?, ?)", columns)
+
+        # Agregados pré-calculados: total geral e por cada coluna categórica
+        for measure in columns:
+            if measure[5] == 'text':
+                continue
+            conn.execute(
+                f"INSERT INTO aggregates SELECT ?, ?, '', '', SUM({measure[4]}), COUNT({measure[4]}) FROM {table_name}",
+                (table_id, measure[3])
+            )
+            for group in columns:
+                if group is measure or not group[7]:
+                    continue
+                conn.execute(
+                    f"INSERT INTO aggregates SELECT ?, ?, ?, CAST({group[4]} AS TEXT), SUM({measure[4]}), "
+                    f"COUNT({measure[4]}) FROM {table_name} WHERE {group[4]} IS NOT NULL GROUP BY {group[4]}",
+                    (table_id, measure[3], group[3])
+                )
+
+    def _delete_tables(self, conn, where, params=()):
+        for table_id, name in conn.execute(f"SELECT id, name FROM tables WHERE {where}", params).fetchall():
+            if name:
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+            conn.execute("DELETE FROM columns WHERE table_id = ?", (table_id,))
+            conn.execute("DELETE FROM aggregates WHERE table_id = ?", (table_id,))
+            conn.execute("DELETE FROM tables WHERE id = ?", (table_id,))
+
+    def add_document(self, doc_id, tables):
+        """
+        Grava (ou substitui) as tabelas de um documento. tables é uma lista de
+        (página, índice da tabela na página, linhas), com o cabeçalho na primeira linha.
+        """
+        with self._write_lock:
+            conn = self._conn()
+            self._delete_tables(conn, "doc_id IS ?", (doc_id,))
+            for page, table_index, rows in tables:
+                self._insert_table(conn, doc_id, page, table_index, rows)
+            self._bump_version(conn)
+            conn.commit()
+
+    def remove_document(self, doc_id):
+        with self._write_lock:
+            conn = self._conn()
+            self._delete_tables(conn, "doc_id IS ?", (doc_id,))
+            self._bump_version(conn)
+            conn.commit()
+
+    def rebuild_from_csv(self, table_path=TABLES_DIR):
+        """
+        Recria o armazenamento a partir dos CSVs (uma subpasta por documento). Usado pelo
+        /execute e para migrar corpora antigos.
+        """
+        tables = {}
+        if os.path.isdir(table_path):
+            for root, _, files in os.walk(table_path):
+                doc_id = os.path.relpath(root, table_path)
+                doc_id = None if doc_id == '.' else doc_id
+                for file in sorted(files):
+                    if not file.endswith('.csv'):
+                        continue
+                    match = re.search(r'page_(\d+)', file)
+                    with open(os.path.join(root, file), 'r', encoding='utf-8', newline='') as f:
+                        rows = list(csv.reader(f))
+                    tables.setdefault(doc_id, []).append((int(match.group(1)) if match else None, 0, rows))
+
+        with self._write_lock:
+            conn = self._conn()
+            self._delete_tables(conn, "1 = 1")
+            for doc_id, doc_tables in tables.items():
+                for page, table_index, rows in doc_tables:
+                    self._insert_table(conn, doc_id, page, table_index, rows)
+            self._bump_version(conn)
+            conn.commit()
+        print(f"Tabelas carregadas: {sum(len(doc_tables) for doc_tables in tables.values())} arquivos CSV")
+
+    # Consulta
+
+    def _load_catalog(self):
+        """
+        Colunas e valores categóricos em memória, relidos só quando o armazenamento muda.
+        """
+        version = self.version()
+        if self._catalog is not None and self._catalog_version == version:
+            return self._catalog
+
+        conn = self._conn()
+        columns, values = {}, {}
+        rows = conn.execute(
+            "SELECT c.table_id, c.name, c.key, c.sql_name, c.dtype, c.category, t.name, t.doc_id, t.page "
+            "FROM columns c JOIN tables t ON t.id = c.table_id"
+        ).fetchall()
+        for table_id, name, key, sql_name, dtype, category, table_name, doc_id, page in rows:
+            column = columns.setdefault(key, {
+                'key': key, 'name': name, 'numeric': False, 'category': False, 'tables': {}
+            })
+            column['numeric'] |= dtype != 'text'
+            column['category'] |= bool(category)
+            column['tables'][table_id] = {'table': table_name, 'column': sql_name, 'doc_id': doc_id, 'page': page}
+            if category:
+                for (value,) in conn.execute(f"SELECT DISTINCT CAST({sql_name} AS TEXT) FROM {table_name} WHERE {sql_name} IS NOT NULL"):
+                    folded = fold(value)
+                    if folded:
+                        values.setdefault(folded, set()).add((key, value))
+
+        self._catalog = {'columns': columns, 'values': values}
+        self._catalog_version = version
+        return self._catalog
+
+    @staticmethod
+    def _matches(term, key):
+        key_words = key.split()
+        if len(key_words) > 1:
+            return False
+        return term == key or (len(term) >= 3 and len(key) >= 3 and (term.startswith(key) or key.startswith(term)))
+
+    def _route(self, question):
+        """
+        Descobre medida, agrupamento, filtros e operação a partir dos termos da pergunta.
+        """
+        catalog = self._load_catalog()
+        terms = words(question)
+        folded_question = " ".join(terms)
+
+        matched = []
+        for position, term in enumerate(terms):
+            for key, column in catalog['columns'].items():
+                if key not in [m[1]['key'] for m in matched] and (
+                        self._matches(term, key) or (' ' in key and f" {key} " in f" {folded_question} ")):
+                    matched.append((position, column))
+        if not matched:
+            return None
+
+        after_marker = {position + 1 for position, term in enumerate(terms) if term in GROUP_MARKERS}
+        groups = [column for position, column in matched if column['category']]
+        group = next((column for position, column in matched if column['category'] and position in after_marker), None)
+        explicit_group = group is not None
+
+        measures = [column for _, column in matched if column['numeric'] and column is not group]
+        # Uma coluna numérica categórica (ex.: Ano) só é medida se não houver outra
+        measure = next((column for column in measures if not column['category']), measures[0] if measures else None)
+        if group is None:
+            group = next((column for column in groups if column is not measure), None)
+        if measure is None:
+            numeric = [column for column in catalog['columns'].values() if column['numeric'] and not column['category']]
+            measure = numeric[0] if len(numeric) == 1 else None
+
+        filters = {}
+        for value_key, targets in catalog['values'].items():
+            for column_key, value in targets:
+                # Valores curtos ("A", "B") só valem junto do nome da coluna, senão "a" vira filtro
+                needle = value_key if len(value_key) >= 3 else f"{column_key} {value_key}"
+                if f" {needle} " in f" {folded_question} ":
+                    filters.setdefault(column_key, set()).add(value)
+        # "média de vendas do Produto A": o valor citado filtra, e o agrupamento implícito pela
+        # mesma coluna sai (com "por"/"cada" ele fica e só mostra os valores citados)
+        if group is not None and group['key'] in filters and not explicit_group:
+            group = None
+
+        operation = 'sum'
+        for name, markers in OPERATIONS.items():
+            if any(marker in terms for marker in markers):
+                operation = name
+                break
+        if operation == 'count' and measure is None:
+            measure = group
+        if measure is None:
+            return None
+        return {'measure': measure, 'group': group, 'filters': filters, 'operation': operation}
+
+    def _aggregate(self, route):
+        """
+        Devolve ({valor do grupo: (soma, contagem)}, tabelas usadas).
+        """
+        with metrics.span("table_aggregation", filters=len(route['filters'])) as span:
+            results, used = self._aggregate_rows(route)
+            span.update(tables=len(used), groups=len(results))
+        return results, used
+
+    def _aggregate_rows(self, route):
+        measure, group, filters = route['measure'], route['group'], route['filters']
+        catalog = self._load_catalog()['columns']
+        conn = self._conn()
+        results, used = {}, []
+
+        if not filters and measure['numeric']:
+            # Caminho rápido: agregados calculados na ingestão
+            rows = conn.execute(
+                "SELECT table_id, group_value, SUM(total), SUM(count) FROM aggregates WHERE measure = ? AND group_column = ? "
+                "GROUP BY table_id, group_value",
+                (measure['key'], group['key'] if group else '')
+            ).fetchall()
+            for table_id, value, total, count in rows:
+                previous = results.get(value, (0, 0))
+                results[value] = (previous[0] + (total or 0), previous[1] + count)
+                used.append(measure['tables'][table_id])
+            return results, used
+
+        for table_id, location in measure['tables'].items():
+            columns = [key for key in filters] + ([group['key']] if group else [])
+            if any(table_id not in catalog[key]['tables'] for key in columns):
+                continue
+            where, params = [], []
+            for key, values in filters.items():
+                sql_name = catalog[key]['tables'][table_id]['column']
+                where.append(f"{sql_name} IN ({','.join('?' * len(values))})")
+                params.extend(sorted(values))
+            group_sql = f"CAST({catalog[group['key']]['tables'][table_id]['column']} AS TEXT)" if group else "''"
+            total_sql = f"SUM({location['column']})" if measure['numeric'] else "0"
+            rows = conn.execute(
+                f"SELECT {group_sql}, {total_sql}, COUNT({location['column']}) FROM {location['table']} "
+                f"{'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY 1",
+                params
+            ).fetchall()
+            for value, total, count in rows:
+                if value is None:
+                    continue
+                previous = results.get(value, (0, 0))
+                results[value] = (previous[0] + (total or 0), previous[1] + count)
+            if rows:
+                used.append(location)
+        return results, used
+
+    def answer(self, question):
+        """
+        Responde perguntas de agregação sobre as tabelas. Devolve None quando a pergunta
+        não cita nenhuma coluna conhecida (o chamador usa outra estratégia).
+        """
+        return self.answer_many([question])[0]
+
+    @staticmethod
+    def _aggregate_key(route):
+        # A operação não entra: soma e contagem saem da mesma consulta
+        filters = tuple(sorted((key, tuple(sorted(values))) for key, values in route['filters'].items()))
+        return route['measure']['key'], route['group']['key'] if route['group'] else None, filters
+
+    def answer_many(self, questions):
+        """
+        Várias perguntas de uma vez, na mesma ordem. Perguntas com a mesma medida, agrupamento
+        e filtros (ex.: total e média de vendas por mês) compartilham uma única agregação.
+        """
+        aggregates = {}
+        answers = []
+        for question in questions:
+            route = self._route(question)
+            if route is None:
+                answers.append(None)
+                continue
+            key = self._aggregate_key(route)
+            if key not in aggregates:
+                aggregates[key] = self._aggregate(route)
+            answers.append(self._format(route, *aggregates[key]))
+        return answers
+
+    def _format(self, route, results, used):
+        if not results:
+            return None
+
+        measure, group, operation = route['measure'], route['group'], route['operation']
+
+        def value_of(item):
+            total, count = item
+            if operation == 'avg':
+                return total / count if count else None
+            if operation == 'count':
+                return count
+            return total
+
+        label = {'avg': 'Média', 'count': 'Quantidade'}.get(operation, 'Total')
+        filters = "".join(f" ({', '.join(sorted(values))})" for values in route['filters'].values())
+
+        if group is None:
+            total = (sum(item[0] for item in results.values()), sum(item[1] for item in results.values()))
+            lines = [f"{label} de {measure['name']}{filters}: {format_number(value_of(total))}"]
+        elif operation in ('max', 'min'):
+            choose = max if operation == 'max' else min
+            best = choose(results, key=lambda value: results[value][0])
+            word = 'maior' if operation == 'max' else 'menor'
+            lines = [
+                f"{group['name']} com {word} total de {measure['name']}{filters}: {best} "
+                f"({format_number(results[best][0])})"
+            ]
+        else:
+            lines = [f"{label} de {measure['name']} por {group['name']}{filters}:"]
+            for value in sorted(results, key=lambda v: (parse_number(v) is None, parse_number(v) or 0, v)):
+                lines.append(f"{value}: {format_number(value_of(results[value]))}")
+
+        pages = sorted({(location['doc_id'] or '', location['page'] or 0) for location in used})
+        if pages:
+            lines.append("\nFontes: " + ", ".join(
+                f"{doc_id} p. {page}" if doc_id else f"p. {page}" for doc_id, page in pages
+            ))
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    # Reimporta os CSVs da pasta de tabelas: python table_store.py [pergunta]
+    store = TableStore()
+    if store.is_empty() or len(sys.argv) < 2:
+        store.rebuild_from_csv()
+    if len(sys.argv) > 1:
+        print(store.answer(sys.argv[1]) or "Nenhuma coluna da pergunta foi encontrada nas tabelas.")
@@ -0,0 +1,103 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+faiss = pytest.importorskip('faiss')
+
+import ann_index
+
+HNSW_PARAMS = {'M': 8, 'efConstruction': 40}
+
+
+def random_vectors(count, dimension=8, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+@pytest.mark.parametrize('index_type, params', [('flat', {}), ('hnsw', HNSW_PARAMS)])
+def test_copy_of_mmap_index_accepts_new_vectors(tmp_path, index_type, params):
+    index, _ = ann_index.build_index(random_vectors(5), np.arange(5), 8, index_type, params)
+    path = str(tmp_path / 'index.faiss')
+    ann_index.write_index(index, path)
+    mapped = ann_index.read_index(path, mmap=True)
+
+    copy = ann_index.copy_index(mapped)
+    copy.add_with_ids(random_vectors(2, seed=1), np.arange(5, 7))
+
+    assert copy.ntotal == 7 and mapped.ntotal == 5
+
+
+def test_small_corpus_falls_back_to_flat():
+    params = {'nlist': 4}
+    assert ann_index.min_train_size('ivf_flat', params) == 16
+
+    index, info = ann_index.build_index(random_vectors(15), np.arange(15), 8, 'ivf_flat', params)
+    assert info == {'type': 'flat', 'params': {}, 'fallback_from': 'ivf_flat'}
+    assert isinstance(ann_index.inner_index(index), faiss.IndexFlat)
+
+    index, info = ann_index.build_index(random_vectors(16), np.arange(16), 8, 'ivf_flat', params)
+    assert info['type'] == 'ivf_flat' and info['train_size'] == 16
+    assert faiss.try_extract_index_ivf(ann_index.inner_index(index)) is not None
+
+
+def test_search_parameters_apply_only_to_the_query():
+    vectors = random_vectors(200)
+    ivf, _ = ann_index.build_index(vectors, np.arange(200), 8, 'ivf_flat', {'nlist': 8})
+    hnsw, _ = ann_index.build_index(vectors, np.arange(200), 8, 'hnsw', HNSW_PARAMS)
+    flat, _ = ann_index.build_index(vectors, np.arange(200), 8, 'flat')
+
+    assert ann_index.search_parameters(ivf, nprobe=8).nprobe == 8
+    assert ann_index.search_parameters(hnsw, ef_search=64).efSearch == 64
+    # Ajuste que não se aplica ao tipo do índice é ignorado
+    assert ann_index.search_parameters(ivf, ef_search=64) is None
+    assert ann_index.search_parameters(flat, nprobe=8) is None
+
+    # Com nprobe igual a nlist a busca IVF é exata, e o nprobe do índice não muda
+    ivf_inner = faiss.try_extract_index_ivf(ann_index.inner_index(ivf))
+    ivf_inner.nprobe = 1
+    _, exact = flat.search(vectors[:20], 5)
+    _, found = ann_index.search(ivf, vectors[:20], 5, nprobe=8)
+    np.testing.assert_array_equal(found, exact)
+    assert ivf_inner.nprobe == 1
+
+
+class FakeEncoder:
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+
+def text_chunks(count):
+    return [{'page_content': f'trecho {number}', 'metadata': {'type': 'text', 'page': '1'}}
+            for number in range(count)]
+
+
+def test_hnsw_removal_rebuilds_the_index(tmp_path, monkeypatch):
+    from config import FAISS_INDEX_FILES
+    from document_index import DocumentIndex
+
+    build_index = ann_index.build_index
+    monkeypatch.setattr(ann_index, 'build_index',
+                        lambda vectors, ids, dimension: build_index(vectors, ids, dimension, 'hnsw', HNSW_PARAMS))
+    rebuilt = []
+    rebuild_type = DocumentIndex._rebuild_type
+    monkeypatch.setattr(DocumentIndex, '_rebuild_type',
+                        lambda self, store, chunk_type, *args, **kwargs:
+                        rebuilt.append(chunk_type) or rebuild_type(self, store, chunk_type, *args, **kwargs))
+
+    encoder = FakeEncoder()
+    documents = DocumentIndex(
+        lambda: encoder, model_name='m', variant='torch',
+        index_files={kind: str(tmp_path / f'{kind}.faiss') for kind in FAISS_INDEX_FILES},
+        info_file=str(tmp_path / 'index_info.json'), cache_file=str(tmp_path / 'cache.sqlite'),
+        db_file=str(tmp_path / 'chunks.sqlite'), vectors_file=str(tmp_path / 'vectors.bin')
+    )
+    documents.add_document('a', text_chunks(6), embeddings=random_vectors(6))
+    documents.add_document('b', text_chunks(4), embeddings=random_vectors(4, seed=1))
+    assert rebuilt == []
+
+    snapshot = documents.remove_document('a')
+
+    assert 'text' in rebuilt
+    index = snapshot.indexes['text']
+    assert isinstance(ann_index.inner_index(index), faiss.IndexHNSW)
+    assert index.ntotal == 4
+    _, ids = index.search(random_vectors(4, seed=1), 1)
+    assert sorted(ids[:, 0].tolist()) == [6, 7, 8, 9]
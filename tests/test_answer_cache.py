@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import metrics
+from answer_cache import AnswerCache
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.MetricsRegistry()
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+def test_cache_metrics_are_exported(registry):
+    cache = AnswerCache(max_entries=1, similarity=0)
+    assert cache.get("Qual o total de vendas?", 1) is None
+    cache.miss()
+    cache.put("Qual o total de vendas?", 1, "100", seconds=1.5)
+    assert cache.get("qual o total de vendas", 1) == "100"
+    cache.put("Quais são as vendas por mês?", 1, "...")
+
+    text = registry.render()
+    assert 'rag_answer_cache_hits_total{tier="exact"} 1' in text
+    assert 'rag_answer_cache_misses_total 1' in text
+    assert 'rag_answer_cache_saved_seconds_total 1.5' in text
+    assert 'rag_answer_cache_evictions_total 1' in text
+    assert '# TYPE rag_answer_cache_hit_rate gauge' in text
+    assert 'rag_answer_cache_hit_rate 0.5' in text
+    assert 'rag_answer_cache_entries 1' in text
+
+
+def test_invalidation_resets_entries_gauge(registry):
+    cache = AnswerCache(similarity=0)
+    cache.put("Qual o total de vendas?", 1, "100")
+    cache.clear()
+
+    text = registry.render()
+    assert 'rag_answer_cache_invalidations_total 1' in text
+    assert 'rag_answer_cache_entries 0' in text
+    assert 'rag_answer_cache_bytes 0' in text
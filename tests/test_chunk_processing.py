@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import chunk_processing
+
+
+def write_table(tmp_path, doc_id, name, value):
+    folder = tmp_path / 'table' / doc_id
+    folder.mkdir(parents=True, exist_ok=True)
+    (folder / name).write_text(f"Produto,Vendas\nProduto A,{value}\n", encoding='utf-8')
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(chunk_processing, 'directory_text', str(tmp_path / 'text'))
+    monkeypatch.setattr(chunk_processing, 'directory_table', str(tmp_path / 'table'))
+    monkeypatch.setattr(chunk_processing, 'directory_img', str(tmp_path / 'img'))
+    monkeypatch.setattr(chunk_processing, 'FILE_TYPES', (('table', str(tmp_path / 'table'), '.csv'),))
+    for doc_id in ('doc_b', 'doc_c'):
+        write_table(tmp_path, doc_id, 'page_1_table_1.csv', 1)
+    return tmp_path
+
+
+def run(tmp_path, **kwargs):
+    output = tmp_path / 'chunks.jsonl'
+    return chunk_processing.write_chunks(str(output), str(tmp_path / 'progress'), workers=1, **kwargs), output
+
+
+def interrupt_after(monkeypatch, files):
+    # Simula uma interrupção: o iterador para depois de alguns arquivos
+    original = chunk_processing.iter_chunked_files
+
+    def limited(tasks, *args):
+        for number, item in enumerate(original(tasks, *args)):
+            if number == files:
+                raise KeyboardInterrupt
+            yield item
+    monkeypatch.setattr(chunk_processing, 'iter_chunked_files', limited)
+    return original
+
+
+def chunk_files(output):
+    return sorted((json.loads(line)['metadata']['doc_id'], json.loads(line)['metadata']['filename'])
+                  for line in output.read_text(encoding='utf-8').splitlines())
+
+
+def test_resume_processes_files_added_before_the_last_completed_one(corpus, monkeypatch):
+    original = interrupt_after(monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        run(corpus)
+
+    # Documento novo que fica antes do último arquivo concluído na ordem de gravação
+    write_table(corpus, 'doc_a', 'page_1_table_1.csv', 2)
+    monkeypatch.setattr(chunk_processing, 'iter_chunked_files', original)
+    progress, output = run(corpus)
+
+    assert progress['files'] == 3
+    assert chunk_files(output) == [('doc_a', 'page_1_table_1.csv'), ('doc_b', 'page_1_table_1.csv'),
+                                   ('doc_c', 'page_1_table_1.csv')]
+
+
+def test_resume_restarts_when_a_completed_file_is_gone(corpus, monkeypatch):
+    original = interrupt_after(monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        run(corpus)
+
+    (corpus / 'table' / 'doc_b' / 'page_1_table_1.csv').unlink()
+    monkeypatch.setattr(chunk_processing, 'iter_chunked_files', original)
+    progress, output = run(corpus)
+
+    assert progress['files'] == 1
+    assert chunk_files(output) == [('doc_c', 'page_1_table_1.csv')]
+
+
+def test_truncated_progress_line_is_ignored(corpus, monkeypatch):
+    original = interrupt_after(monkeypatch, 1)
+    with pytest.raises(KeyboardInterrupt):
+        run(corpus)
+    with open(corpus / 'progress', 'a', encoding='utf-8') as f:
+        f.write('{"file": ["doc_c"')
+
+    monkeypatch.setattr(chunk_processing, 'iter_chunked_files', original)
+    progress, output = run(corpus)
+    assert progress['files'] == 2
+    assert len(chunk_files(output)) == 2
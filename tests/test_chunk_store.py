@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from chunk_store import ChunkStore, build_pages
+
+
+def make_chunks(ids, doc_id):
+    return [{'id': chunk_id, 'page_content': f'vendas do trecho {chunk_id}',
+             'metadata': {'type': 'text', 'doc_id': doc_id, 'page': '1'}} for chunk_id in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkStore(str(tmp_path / 'chunks.sqlite'), str(tmp_path / 'vectors.bin'),
+                      compact_ratio=0.25)
+
+
+def test_add_appends_rows_without_rewriting(store, tmp_path):
+    first = np.arange(20, dtype=np.float32).reshape(5, 4)
+    second = -np.arange(12, dtype=np.float32).reshape(3, 4)
+    store.add(make_chunks(range(5), 'a'), first, 'a')
+    path = tmp_path / 'vectors.1.bin'
+    inode = os.stat(path).st_ino
+    store.add(make_chunks(range(5, 8), 'b'), second, 'b')
+
+    assert os.stat(path).st_ino == inode
+    assert os.path.getsize(path) == 8 * 4 * 4
+    np.testing.assert_array_equal(store.vectors([6, 1]), np.vstack([second[1], first[1]]))
+
+
+def test_delete_compacts_orphan_rows(store, tmp_path):
+    vectors = np.arange(32, dtype=np.float32).reshape(8, 4)
+    store.add(make_chunks(range(8), 'a'), vectors, 'a')
+
+    store.delete([0, 1])
+    assert store.orphan_rows() == 2
+    store.delete([2])
+    assert store.orphan_rows() == 0
+    assert os.path.getsize(tmp_path / 'vectors.2.bin') == 5 * 4 * 4
+    np.testing.assert_array_equal(store.vectors([7, 3]), vectors[[7, 3]])
+
+    # Outra instância (outro worker) lê a geração nova pelo banco
+    other = ChunkStore(store.db_file, store.vectors_file)
+    np.testing.assert_array_equal(other.vectors([5]), vectors[[5]])
+
+
+def test_write_starts_new_generation(store, tmp_path):
+    store.add(make_chunks(range(3), 'a'), np.ones((3, 4), dtype=np.float32), 'a')
+    rebuilt = ChunkStore.write(make_chunks(range(2), 'b'), np.zeros((2, 4), dtype=np.float32),
+                               db_file=store.db_file, vectors_file=store.vectors_file)
+    np.testing.assert_array_equal(rebuilt.vectors([1]), np.zeros((1, 4), dtype=np.float32))
+    assert os.path.exists(tmp_path / 'vectors.2.bin')
+
+
+def test_build_pages_groups_text_and_image_chunks_by_page():
+    chunks = [
+        {'id': 4, 'metadata': {'type': 'text', 'doc_id': 'a', 'page': 1}},
+        {'id': 5, 'metadata': {'type': 'table', 'doc_id': 'a', 'page': '1'}},
+        {'id': 6, 'metadata': {'type': 'image', 'doc_id': 'a', 'page': '1'}},
+        {'id': 7, 'metadata': {'type': 'text', 'doc_id': 'a', 'page': '2'}},
+    ]
+    vectors = np.array([[3, 0, 0, 0], [0, 0, 9, 0], [0, 2, 0, 0], [0, 0, 0, 5]], dtype=np.float32)
+
+    first, second = build_pages(chunks, vectors, start_id=10)
+
+    # Tabelas ficam de fora e o número da página é comparado como texto
+    assert (first['id'], first['page'], first['text_ids'], first['image_ids']) == (10, '1', [4], [6])
+    assert (second['id'], second['page'], second['text_ids'], second['image_ids']) == (11, '2', [7], [])
+    # Média dos vetores já normalizados, normalizada de novo
+    np.testing.assert_allclose(first['vector'], [2 ** -0.5, 2 ** -0.5, 0, 0], rtol=1e-6)
+    np.testing.assert_allclose(second['vector'], [0, 0, 0, 1])
@@ -0,0 +1,105 @@
+from context_packing import overlap_length, join_neighbors, deduplicate, merge_neighbors, merge_texts, pack_context
+
+
+def chunk(text, chunk_index=None, chunk_type='text', doc_id='d1', filename='page_1.txt', page='1'):
+    metadata = {'type': chunk_type, 'doc_id': doc_id, 'filename': filename, 'page': page}
+    if chunk_index is not None:
+        metadata['chunk_index'] = chunk_index
+    return {'page_content': text, 'metadata': metadata}
+
+
+def entry(text, score, **metadata):
+    return {'chunk': chunk(text, **metadata), 'text': text, 'score': score}
+
+
+def test_overlap_length_finds_word_aligned_overlap():
+    left = "O faturamento do trimestre cresceu doze por cento"
+    right = "cresceu doze por cento no mercado interno"
+    assert overlap_length(left, right) == len("cresceu doze por cento")
+
+
+def test_overlap_length_ignores_short_or_partial_word_overlap():
+    assert overlap_length("As vendas cresceram", "muito no trimestre") == 0
+    # Sobreposição longa, mas começando no meio de uma palavra
+    assert overlap_length("texto de exemplo com vendasmensais altas", "mensais altas no ano", min_length=5) == 0
+    assert overlap_length("curto fim", "fim curto", min_length=10) == 0
+
+
+def test_join_neighbors_keeps_words_apart_without_overlap():
+    assert join_neighbors("As vendas cresceram", "muito no trimestre") == "As vendas cresceram muito no trimestre"
+    assert join_neighbors("linha um\n", "linha dois") == "linha um\nlinha dois"
+
+
+def test_merge_texts_does_not_glue_words():
+    chunks = [chunk('As vendas cresceram', 1), chunk('muito no trimestre', 2)]
+    assert merge_texts(chunks) == ['As vendas cresceram muito no trimestre']
+
+
+def test_merge_neighbors_removes_splitter_overlap():
+    text = " ".join(f"palavra{i}" for i in range(100))
+    first, second = text[:400], text[text.index("palavra30 "):]
+    merged = merge_neighbors([entry(second, 0.9, chunk_index=2), entry(first, 0.5, chunk_index=1)])
+    assert len(merged) == 1
+    assert merged[0]['text'] == text
+    assert merged[0]['score'] == 0.9
+    assert [c['metadata']['chunk_index'] for c in merged[0]['chunks']] == [1, 2]
+
+
+def test_merge_neighbors_keeps_gaps_pages_and_tables_apart():
+    entries = [
+        entry('primeiro trecho', 1.0, chunk_index=1),
+        entry('terceiro trecho', 0.8, chunk_index=3),
+        entry('outra página', 0.7, chunk_index=2, filename='page_2.txt'),
+        entry('{"headers": ["a"]}', 0.6, chunk_type='table'),
+        entry('{"headers": ["b"]}', 0.5, chunk_type='table'),
+    ]
+    assert sorted(group['text'] for group in merge_neighbors(entries)) == sorted(e['text'] for e in entries)
+
+
+def test_deduplicate_drops_repeated_and_contained_texts():
+    entries = [
+        entry('Vendas  do trimestre', 1.0),
+        entry('vendas do trimestre', 0.9),
+        entry('Resumo: vendas do trimestre subiram', 0.8),
+        entry('Outro assunto', 0.7),
+        entry('   ', 0.6),
+    ]
+    kept = deduplicate(entries)
+    assert [e['text'] for e in kept] == ['Resumo: vendas do trimestre subiram', 'Outro assunto']
+    # O texto maior herda a relevância do mais relevante
+    assert kept[0]['score'] == 1.0
+
+
+def test_pack_context_fills_budget_by_relevance():
+    chunks = [
+        chunk('a' * 40, 1, filename='page_1.txt'),
+        chunk('b' * 400, 1, filename='page_2.txt'),
+        chunk('c' * 20, 1, filename='page_3.txt'),
+    ]
+    packed = pack_context(chunks, budget=20, filenames={'d1': 'relatorio.pdf'}, chars_per_token=4)
+    # O segundo não cabe e é pulado; o terceiro, menor, ainda entra
+    assert packed['context'] == 'a' * 40 + '\n\n' + 'c' * 20
+    assert packed['tokens'] == 15
+    assert packed['dropped'] == 1
+    assert packed['sources'] == [
+        {'filename': 'relatorio.pdf', 'page': '1', 'chunk_index': 1},
+        {'filename': 'relatorio.pdf', 'page': '1', 'chunk_index': 1},
+    ]
+
+
+def test_pack_context_truncates_first_chunk_over_budget():
+    chunks = [chunk('x' * 400, 1, filename='page_1.txt'), chunk('y' * 400, 1, filename='page_2.txt')]
+    packed = pack_context(chunks, budget=10, chars_per_token=4)
+    assert packed['context'] == 'x' * 40
+    assert packed['tokens'] == 10
+    assert packed['dropped'] == 1
+    assert packed['sources'] == [{'filename': 'page_1.txt', 'page': '1', 'chunk_index': 1}]
+
+
+def test_pack_context_uses_scores_and_counts_duplicates():
+    chunks = [chunk('menos relevante aqui', 1, filename='page_1.txt'),
+              chunk('mais relevante aqui', 1, filename='page_2.txt'),
+              chunk('mais relevante aqui', 1, filename='page_3.txt')]
+    packed = pack_context(chunks, scores=[0.1, 0.9, 0.5], budget=100)
+    assert packed['context'].startswith('mais relevante aqui')
+    assert packed['duplicates'] == 1
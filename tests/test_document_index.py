@@ -0,0 +1,89 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('faiss')
+
+from chunk_store import ChunkStore
+from document_index import SnapshotChunks
+
+
+def make_chunks(ids, doc_id, text):
+    return [{'id': chunk_id, 'page_content': text,
+             'metadata': {'type': 'text', 'doc_id': doc_id, 'page': '1'}} for chunk_id in ids]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ChunkStore(str(tmp_path / 'chunks.sqlite'), str(tmp_path / 'vectors.bin'))
+    store.add(make_chunks(range(3), 'a', 'vendas do produto A'), np.zeros((3, 4), dtype=np.float32), 'a')
+    return store
+
+
+def test_keyword_search_hides_chunks_added_after_the_snapshot(store):
+    snapshot = SnapshotChunks(store)
+    store.add(make_chunks(range(3, 6), 'b', 'vendas do produto B'), np.zeros((3, 4), dtype=np.float32), 'b')
+
+    ids = [chunk_id for chunk_id, _ in snapshot.keyword_search('vendas produto', top_k=3)]
+    assert sorted(ids) == [0, 1, 2]
+    assert len(SnapshotChunks(store).keyword_search('vendas produto', top_k=10)) == 6
+
+
+def test_keyword_search_hides_removed_chunks(store):
+    snapshot = SnapshotChunks(store, hidden_ids=[0, 1])
+
+    assert [chunk_id for chunk_id, _ in snapshot.keyword_search('vendas')] == [2]
+    # O resto continua vindo do armazenamento
+    assert len(snapshot) == 3
+    assert snapshot.get_many([0])[0]['page_content'] == 'vendas do produto A'
+
+
+def test_check_index_model_refuses_other_variant(tmp_path):
+    from document_index import check_index_model
+    path = tmp_path / 'index_info.json'
+    path.write_text('{"model": "m", "variant": "onnx-int8"}', encoding='utf-8')
+
+    check_index_model('m', str(path), 'onnx-int8')
+    with pytest.raises(ValueError):
+        check_index_model('m', str(path), 'torch')
+    # Índices de antes do registro da variante são do SentenceTransformer
+    path.write_text('{"model": "m"}', encoding='utf-8')
+    check_index_model('m', str(path), 'torch')
+    with pytest.raises(ValueError):
+        check_index_model('m', str(path), 'onnx')
+
+
+class FakeEncoder:
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        return np.array([[len(text), 1.0, 0.0, 0.0] for text in texts], dtype=np.float32)
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def make_document_index(tmp_path, **kwargs):
+    from config import FAISS_INDEX_FILES
+    from document_index import DocumentIndex
+    encoder = FakeEncoder()
+    return DocumentIndex(
+        lambda: encoder, model_name='m', variant='torch',
+        index_files={kind: str(tmp_path / f'{kind}.faiss') for kind in FAISS_INDEX_FILES},
+        info_file=str(tmp_path / 'index_info.json'), cache_file=str(tmp_path / 'cache.sqlite'),
+        db_file=str(tmp_path / 'chunks.sqlite'), vectors_file=str(tmp_path / 'vectors.bin'), **kwargs
+    )
+
+
+def test_without_local_indexes_only_the_store_is_kept(tmp_path):
+    documents = make_document_index(tmp_path, local_indexes=False)
+    documents.add_document('a', make_chunks([0, 1], 'a', 'vendas do produto A'))
+    snapshot = documents.add_document('b', make_chunks([0], 'b', 'compras'))
+
+    assert snapshot.indexes == {}
+    assert not list(tmp_path.glob('*.faiss'))
+    assert len(snapshot.chunks) == 3
+    assert [chunk_id for chunk_id, _ in snapshot.chunks.keyword_search('compras')] == [2]
+
+    # Um processo sem shards monta os índices que faltam a partir do banco
+    local = make_document_index(tmp_path).load()
+    assert local.indexes['text'].ntotal == 3
+    assert local.indexes['page'].ntotal == 2
+    assert make_document_index(tmp_path, local_indexes=False).load().indexes == {}
@@ -0,0 +1,48 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from embedding_cache import EmbeddingCache, encode_with_cache
+
+
+class CountingEncoder:
+    def __init__(self, variant=None, value=1.0):
+        if variant:
+            self.variant = variant
+        self.value = value
+        self.encoded = 0
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True):
+        self.encoded += len(texts)
+        return np.full((len(texts), 4), self.value, dtype=np.float32)
+
+
+def test_key_depends_on_model_and_variant(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    keys = {EmbeddingCache(path, model, variant).key('vendas') for model in ('a', 'b')
+            for variant in ('torch', 'onnx', 'onnx-int8')}
+    assert len(keys) == 6
+
+
+def test_vectors_are_not_shared_between_variants(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    torch_encoder = CountingEncoder(value=1.0)
+    encode_with_cache(lambda: torch_encoder, ['vendas'], EmbeddingCache(path, 'm', 'torch'))
+
+    onnx_encoder = CountingEncoder('onnx-int8', value=2.0)
+    vectors, hits, misses = encode_with_cache(lambda: onnx_encoder, ['vendas'], EmbeddingCache(path, 'm', 'onnx-int8'))
+    assert (hits, misses) == (0, 1)
+    assert vectors[0, 0] == 2.0
+
+
+def test_fallback_encoder_stores_under_its_own_variant(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = EmbeddingCache(path, 'm', 'onnx')
+    # O ONNX não carregou: quem codifica é o SentenceTransformer
+    encode_with_cache(lambda: CountingEncoder(), ['vendas', 'metas'], cache)
+    assert cache.variant == 'torch'
+
+    _, hits, misses = encode_with_cache(lambda: CountingEncoder(), ['vendas'], EmbeddingCache(path, 'm', 'torch'))
+    assert (hits, misses) == (1, 0)
+    _, hits, misses = encode_with_cache(lambda: CountingEncoder('onnx'), ['vendas'], EmbeddingCache(path, 'm', 'onnx'))
+    assert (hits, misses) == (0, 1)
@@ -0,0 +1,58 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('faiss')
+
+from generate_response import process_image_question, retrieve_pages_batch
+
+
+class FakeEncoder:
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+
+def chunk(chunk_type, page, content, **metadata):
+    return {'page_content': content, 'metadata': dict(metadata, type=chunk_type, page=page)}
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    from config import FAISS_INDEX_FILES
+    from document_index import DocumentIndex
+    encoder = FakeEncoder()
+    documents = DocumentIndex(
+        lambda: encoder, model_name='m', variant='torch',
+        index_files={kind: str(tmp_path / f'{kind}.faiss') for kind in FAISS_INDEX_FILES},
+        info_file=str(tmp_path / 'index_info.json'), cache_file=str(tmp_path / 'cache.sqlite'),
+        db_file=str(tmp_path / 'chunks.sqlite'), vectors_file=str(tmp_path / 'vectors.bin')
+    )
+    # Página 1 aponta para o primeiro eixo e a página 2 para o segundo
+    chunks = [
+        chunk('text', '1', 'furadeira na página um'),
+        chunk('image', '1', 'GSR120-LI', path='img/page_1_image_1.png'),
+        chunk('text', '2', 'serra na página dois'),
+        chunk('image', '2', 'GST 650', path='img/page_2_image_1.png'),
+        chunk('table', '2', 'Produto,Vendas'),
+    ]
+    embeddings = np.array([[1, 0, 0, 0], [1, 0.1, 0, 0], [0, 1, 0, 0], [0.1, 1, 0, 0], [0, 0, 1, 0]],
+                          dtype=np.float32)
+    return documents.add_document('a', chunks, embeddings=embeddings)
+
+
+def test_retrieve_pages_batch_searches_the_page_index(snapshot):
+    first, second = snapshot.chunks.page_ids_for([('a', '1'), ('a', '2')])
+    queries = np.array([[0, 2, 0, 0], [3, 0, 0, 0]], dtype=np.float32)
+
+    found = retrieve_pages_batch(snapshot.chunks, snapshot.indexes, ['serra', 'furadeira'], queries,
+                                 top_k=1, mode='vector')
+
+    assert found == [[second], [first]]
+
+
+def test_image_question_returns_only_chunks_of_matched_pages(snapshot):
+    response = process_image_question(np.array([0, 1, 0, 0], dtype=np.float32), snapshot.chunks,
+                                      snapshot.indexes, question='serra', top_k=1, mode='vector')
+
+    assert 'serra na página dois' in response and 'img/page_2_image_1.png' in response
+    assert 'furadeira' not in response and 'page_1' not in response
+    assert 'Produto,Vendas' not in response
@@ -0,0 +1,58 @@
+import sqlite3
+
+import pytest
+
+import keyword_index
+from keyword_index import tokenize, reciprocal_rank_fusion
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    keyword_index.create_tables(conn)
+    keyword_index.index_chunks(conn, [
+        {'id': 0, 'page_content': 'Vendas do produto A cresceram no trimestre', 'metadata': {'type': 'text'}},
+        {'id': 1, 'page_content': 'Furadeira GSR120-LI com luz de LED', 'metadata': {'type': 'image'}},
+        {'id': 2, 'page_content': 'Vendas vendas vendas do produto B', 'metadata': {'type': 'text'}},
+        {'id': 3, 'page_content': 'Atendimento ao cliente e CRM', 'metadata': {'type': 'text'}},
+    ])
+    return conn
+
+
+def test_tokenize_folds_accents_and_drops_stopwords():
+    assert tokenize("Quais são as Vendas do Mês?") == ['vendas', 'mes']
+
+
+def test_tokenize_splits_product_codes():
+    assert tokenize("GSR120-LI") == ['gsr120li', 'gsr120', 'li']
+
+
+def test_search_ranks_by_term_frequency(conn):
+    results = keyword_index.search(conn, "vendas")
+    assert [chunk_id for chunk_id, _ in results] == [2, 0]
+    assert results[0][1] > results[1][1] > 0
+
+
+def test_search_matches_any_spelling_of_a_code(conn):
+    for query in ("gsr120li", "GSR120-LI", "gsr120 li"):
+        assert keyword_index.search(conn, query)[0][0] == 1
+
+
+def test_search_filters_by_type_and_limits(conn):
+    assert keyword_index.search(conn, "vendas furadeira", chunk_type='image') == [
+        (1, keyword_index.search(conn, "furadeira", chunk_type='image')[0][1])
+    ]
+    assert len(keyword_index.search(conn, "vendas", top_k=1)) == 1
+    assert keyword_index.search(conn, "de do a") == []
+
+
+def test_delete_removes_postings_and_stats(conn):
+    keyword_index.delete_chunks(conn, [2])
+    assert [chunk_id for chunk_id, _ in keyword_index.search(conn, "vendas")] == [0]
+    docs, _ = conn.execute("SELECT docs, total_length FROM keyword_stats WHERE type = 'text'").fetchone()
+    assert docs == 2
+
+
+def test_reciprocal_rank_fusion_prefers_ids_in_both_rankings():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4, 1]]) == [1, 3, 2, 4]
+    assert reciprocal_rank_fusion([[1], [2]], weights=[1.0, 2.0]) == [2, 1]
@@ -0,0 +1,75 @@
+import pytest
+
+import llm_server
+import metrics
+from llm_server import FakeGenerator, LLMServer, build_prompt
+from model_registry import ModelRegistry
+
+
+@pytest.fixture(autouse=True)
+def registries(monkeypatch):
+    # Registros novos por teste: o do módulo guardaria o modelo entre os testes
+    monkeypatch.setattr(llm_server, 'REGISTRY', ModelRegistry())
+    monkeypatch.setattr(metrics, 'REGISTRY', metrics.MetricsRegistry())
+
+
+class FailingGenerator:
+    def generate(self, prompt, max_tokens=None, streaming=False):
+        yield "primeiro "
+        raise RuntimeError("falha no meio da geração")
+
+
+def test_stream_yields_tokens_in_order():
+    server = LLMServer('fake', factory=lambda: FakeGenerator(["As ", "vendas ", "cresceram."]))
+    assert list(server.stream("Pergunta")) == ["As ", "vendas ", "cresceram."]
+    assert server.generate("Pergunta") == "As vendas cresceram."
+
+
+def test_stream_respects_max_tokens():
+    server = LLMServer('fake', max_tokens=2, factory=lambda: FakeGenerator(["a ", "b ", "c "]))
+    assert list(server.stream("Pergunta")) == ["a ", "b "]
+    assert list(server.stream("Pergunta", max_tokens=1)) == ["a "]
+
+
+def test_last_stats_records_ttft():
+    server = LLMServer('fake', factory=lambda: FakeGenerator(["a ", "b ", "c "], delay=0.01))
+    stats = {}
+    list(server.stream("Pergunta", stats=stats))
+
+    assert server.last_stats is stats
+    assert stats['tokens'] == 3
+    assert 0.01 <= stats['ttft_seconds'] <= stats['total_seconds']
+    assert stats['tokens_per_second'] > 0
+    text = metrics.REGISTRY.render()
+    assert 'rag_stage_seconds_count{stage="llm_first_token"} 1' in text
+    assert 'rag_stage_items_total{item="tokens",stage="llm_generation"} 3' in text
+
+
+def test_fake_generator_echoes_prompt_without_tokens():
+    server = LLMServer('fake')
+    prompt = build_prompt("Vendas subiram 10%.", "Quanto subiram?")
+    assert server.generate(prompt).split() == prompt.split()[-20:]
+
+
+def test_error_releases_the_model_for_the_next_question():
+    server = LLMServer('fake', factory=FailingGenerator)
+    stream = server.stream("Pergunta")
+    assert next(stream) == "primeiro "
+    with pytest.raises(RuntimeError):
+        next(stream)
+    assert server.last_stats is None
+
+    server.model = FakeGenerator(["ok"])
+    assert server.generate("Pergunta") == "ok"
+
+
+def test_cancelled_stream_releases_the_model():
+    server = LLMServer('fake', factory=lambda: FakeGenerator(["a ", "b ", "c "]))
+    stream = server.stream("Pergunta")
+    assert next(stream) == "a "
+    # O cliente desconectou: o Flask fecha o gerador
+    stream.close()
+
+    assert not server._generate_lock.locked()
+    assert server.last_stats is None
+    assert server.generate("Pergunta") == "a b c "
@@ -0,0 +1,54 @@
+import pytest
+
+import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.MetricsRegistry(buckets=(0.1, 1.0))
+    monkeypatch.setattr(metrics, 'REGISTRY', registry)
+    return registry
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    registry.observe('rag_stage_seconds', 0.05, stage='busca')
+    registry.observe('rag_stage_seconds', 0.5, stage='busca')
+    registry.observe('rag_stage_seconds', 5.0, stage='busca')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE rag_stage_seconds histogram' in lines
+    assert 'rag_stage_seconds_bucket{stage="busca",le="0.1"} 1' in lines
+    assert 'rag_stage_seconds_bucket{stage="busca",le="1.0"} 2' in lines
+    assert 'rag_stage_seconds_bucket{stage="busca",le="+Inf"} 3' in lines
+    assert 'rag_stage_seconds_sum{stage="busca"} 5.550000' in lines
+    assert 'rag_stage_seconds_count{stage="busca"} 3' in lines
+
+
+def test_counters_gauges_and_label_escaping(registry):
+    registry.inc('rag_requests_total', endpoint='/ask', status=200)
+    registry.inc('rag_requests_total', endpoint='/ask', status=200)
+    registry.set('rag_answer_cache_entries', 3)
+    registry.set('rag_answer_cache_entries', 2)
+    registry.inc('custom_total', label='a "b"\nc')
+
+    text = registry.render()
+    assert 'rag_requests_total{endpoint="/ask",status="200"} 2' in text
+    assert '# TYPE rag_answer_cache_entries gauge\nrag_answer_cache_entries 2' in text
+    assert 'custom_total{label="a \\"b\\"\\nc"} 1' in text
+    assert f"# HELP rag_requests_total {metrics.HELP['rag_requests_total']}" in text
+
+
+def test_span_records_counts_errors_and_trace(registry):
+    with metrics.trace() as spans:
+        with metrics.span('chunking', files=2) as info:
+            info['chunks'] = 10
+        with pytest.raises(ValueError):
+            with metrics.span('ocr'):
+                raise ValueError
+
+    assert [span['stage'] for span in spans] == ['chunking', 'ocr']
+    assert spans[0]['chunks'] == 10
+    text = registry.render()
+    assert 'rag_stage_items_total{item="chunks",stage="chunking"} 10' in text
+    assert 'rag_stage_items_total{item="files",stage="chunking"} 2' in text
+    assert 'rag_stage_errors_total{stage="ocr"} 1' in text
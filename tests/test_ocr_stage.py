@@ -0,0 +1,25 @@
+import threading
+
+from ocr_stage import OcrCache
+
+
+def test_cache_is_shared_between_threads(tmp_path):
+    cache = OcrCache(str(tmp_path / 'ocr.sqlite'), ('pt',))
+    errors = []
+
+    def upload(worker):
+        try:
+            for number in range(100):
+                cache.put_many([(f"{worker}-{number}", [f"linha {number}"])])
+                assert cache.get_many([f"{worker}-{number}"]) == {f"{worker}-{number}": [f"linha {number}"]}
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=upload, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(cache.get_many(f"{worker}-{number}" for worker in range(8) for number in range(100))) == 800
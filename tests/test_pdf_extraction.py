@@ -0,0 +1,83 @@
+import tempfile
+
+import pytest
+
+fitz = pytest.importorskip('fitz')
+pytest.importorskip('pdfplumber')
+
+import pdf_extraction
+from benchmarks.synthetic_pdf import MARGIN, PAGE_HEIGHT, PAGE_WIDTH, draw_table, generate_report
+
+
+@pytest.fixture(scope='module')
+def report():
+    pdf_bytes, _ = generate_report(pages=6, images_per_page=1)
+    return pdf_bytes
+
+
+def test_pool_matches_inline_extraction_and_is_reused(report, tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    _, inline = pdf_extraction.extract_pdf(report, workers=1)
+
+    _, pooled = pdf_extraction.extract_pdf(report, workers=2, pages_per_task=2)
+    pool = pdf_extraction._pools[2]
+    _, again = pdf_extraction.extract_pdf(report, workers=2, pages_per_task=2)
+
+    assert [page['page'] for page in pooled] == list(range(1, 7))
+    assert pooled == inline == again
+    # O pool continua o mesmo entre PDFs e o arquivo temporário de cada um é apagado
+    assert pdf_extraction._pools[2] is pool
+    assert not list(tmp_path.glob('extracao_*'))
+
+
+@pytest.fixture(scope='module')
+def table_page():
+    # Parágrafo em cima e tabela com vírgulas nas células, como nos relatórios em reais
+    doc = fitz.open()
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page.insert_textbox(fitz.Rect(MARGIN, MARGIN, PAGE_WIDTH - MARGIN, 150),
+                        "Resumo do trimestre com as vendas por produto.", fontsize=10)
+    draw_table(page, 200, ["Produto", "Receita"], [["Furadeira, 12V", "1.234,50"], ["Serra", "980,00"]])
+    conteudo = doc.tobytes()
+    doc.close()
+    return conteudo
+
+
+def test_outside_bboxes_drops_only_chars_inside_tables():
+    keep = pdf_extraction.outside_bboxes([(0, 0, 10, 10), (50, 50, 60, 60)])
+
+    def char(x, y):
+        return {"object_type": "char", "x0": x - 1, "x1": x + 1, "top": y - 1, "bottom": y + 1}
+
+    assert not keep(char(5, 5)) and not keep(char(55, 55))
+    assert keep(char(30, 30))
+    # Linhas e retângulos das bordas não são filtrados
+    assert keep({"object_type": "rect", "x0": 0, "x1": 10, "top": 0, "bottom": 10})
+
+
+def test_text_outside_tables_comes_from_one_filter_pass(table_page, monkeypatch):
+    import pdfplumber.page
+    filtros = []
+    original = pdfplumber.page.Page.filter
+    monkeypatch.setattr(pdfplumber.page.Page, 'filter',
+                        lambda self, test: filtros.append(test) or original(self, test))
+
+    [pagina] = pdf_extraction.extract_page_range(table_page, 0, 1)
+
+    assert len(filtros) == 1
+    assert pagina["text"] == "Resumo do trimestre com as vendas por produto."
+    assert pagina["tables"] == [[["Produto", "Receita"], ["Furadeira, 12V", "1.234,50"], ["Serra", "980,00"]]]
+
+
+def test_table_cells_with_commas_survive_the_csv(table_page, tmp_path):
+    pd = pytest.importorskip('pandas')
+    from ingestion import write_artifacts
+
+    [pagina] = pdf_extraction.extract_page_range(table_page, 0, 1)
+    pagina["images"] = []
+    paths = write_artifacts(pagina, str(tmp_path), str(tmp_path), str(tmp_path))
+
+    tabela = pd.read_csv(tmp_path / 'page_1_table.csv', dtype=str)
+    assert str(tmp_path / 'page_1_table.csv') in paths
+    assert tabela.columns.tolist() == ["Produto", "Receita"]
+    assert tabela.values.tolist() == [["Furadeira, 12V", "1.234,50"], ["Serra", "980,00"]]
@@ -0,0 +1,124 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip('numpy')
+pytest.importorskip('faiss')
+
+from shard_index import ShardCoordinator, merge_results
+
+
+def documents(sizes, dimension=4, seed=0):
+    rng = np.random.default_rng(seed)
+    docs, start = {}, 0
+    for number, size in enumerate(sizes):
+        ids = list(range(start, start + size))
+        docs[f'doc{number}'] = {'text': (ids, rng.standard_normal((size, dimension)).astype(np.float32))}
+        start += size
+    return docs
+
+
+@pytest.fixture
+def coordinator():
+    coordinator = ShardCoordinator(2, threads=1)
+    yield coordinator
+    coordinator.close()
+
+
+def test_merge_results_orders_by_distance_and_drops_padding():
+    full = (np.array([[0.1, 0.4, 0.9]], dtype=np.float32), np.array([[1, 2, 3]]))
+    # Shard com menos vetores que k: o FAISS completa com -1 (e distância qualquer)
+    partial = (np.array([[0.2, 0.0, 0.0]], dtype=np.float32), np.array([[7, -1, -1]]))
+
+    distances, ids = merge_results([full, partial], 4)
+
+    assert ids.tolist() == [[1, 7, 2, 3]]
+    np.testing.assert_allclose(distances, [[0.1, 0.2, 0.4, 0.9]])
+
+
+def test_merge_results_pads_when_shards_have_fewer_than_k():
+    empty = (np.zeros((2, 0), dtype=np.float32), np.zeros((2, 0), dtype=np.int64))
+    small = (np.array([[0.5], [0.3]], dtype=np.float32), np.array([[4], [5]]))
+
+    distances, ids = merge_results([empty, small], 3)
+
+    assert ids.tolist() == [[4, -1, -1], [5, -1, -1]]
+    assert np.isinf(distances[:, 1:]).all()
+
+
+def test_add_and_remove_shard_rebalance_documents(coordinator):
+    docs = documents([8, 6, 4, 2, 2, 2])
+    coordinator.load_documents(docs)
+    assert sorted(coordinator.load(shard_id) for shard_id in coordinator.shard_ids()) == [12, 12]
+
+    new_id = coordinator.add_shard()
+    # O shard novo recebe documentos dos mais cheios até perto da média (24 / 3)
+    assert 0 < coordinator.load(new_id) <= 8
+    assert coordinator.ntotal('text') == 24
+    assert sum(coordinator.load(shard_id) for shard_id in coordinator.shard_ids()) == 24
+
+    queries = docs['doc0']['text'][1][:2]
+    _, ids = coordinator.search('text', queries, 1)
+    assert ids[:, 0].tolist() == [0, 1]
+
+    on_new = sum(1 for owner in coordinator.assignment.values() if owner == new_id)
+    assert coordinator.remove_shard(new_id) == on_new
+    assert new_id not in coordinator.assignment.values()
+    assert coordinator.shard_ids() == [0, 1]
+    assert coordinator.ntotal('text') == 24
+
+
+def test_remove_shard_refuses_unknown_or_last_shard():
+    coordinator = ShardCoordinator(1, threads=1)
+    try:
+        coordinator.load_documents(documents([2]))
+        with pytest.raises(KeyError):
+            coordinator.remove_shard(5)
+        with pytest.raises(ValueError):
+            coordinator.remove_shard(0)
+    finally:
+        coordinator.close()
+
+
+def test_failed_query_drains_the_other_shards(coordinator):
+    # Dimensões diferentes por shard: a mesma pergunta falha só no shard 1
+    docs = dict(documents([3], dimension=4))
+    docs['other'] = {'text': ([10, 11], np.ones((2, 8), dtype=np.float32))}
+    coordinator.load_documents(docs)
+    assert coordinator.assignment == {'doc0': 0, 'other': 1}
+
+    with pytest.raises(RuntimeError, match='Shard 1'):
+        coordinator.search('text', np.ones((1, 4), dtype=np.float32), 2)
+
+    # As respostas lidas depois são as dos comandos novos, não a busca que ficou para trás
+    assert coordinator._shards[0].call('sizes') == {'text': 3}
+    assert coordinator._shards[1].call('sizes') == {'text': 2}
+
+
+class FakeShard:
+    def __init__(self, shard_id, fail_send=False):
+        self.shard_id = shard_id
+        self.fail_send = fail_send
+        self.lock = threading.Lock()
+        self.sizes = {'text': 1}
+        self.pending = []
+
+    def send(self, command, *args):
+        if self.fail_send:
+            raise BrokenPipeError("canal fechado")
+        self.pending.append(command)
+
+    def receive(self):
+        self.pending.pop(0)
+        return np.zeros((1, 1), dtype=np.float32), np.array([[self.shard_id]])
+
+
+def test_failed_send_still_reads_the_shards_already_asked():
+    coordinator = ShardCoordinator(2)
+    shards = {0: FakeShard(0), 1: FakeShard(1, fail_send=True), 2: FakeShard(2)}
+    coordinator._shards = shards
+
+    with pytest.raises(RuntimeError, match='Shard 1: BrokenPipeError'):
+        coordinator.search('text', np.zeros((1, 4), dtype=np.float32), 1)
+    assert shards[0].pending == [] and shards[2].pending == []
+    assert not any(shard.lock.locked() for shard in shards.values())
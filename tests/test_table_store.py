@@ -0,0 +1,36 @@
+import pytest
+
+from table_store import TableStore
+
+ROWS = [
+    ['Produto', 'Mês', 'Vendas'],
+    ['Produto A', 'Janeiro', '100'],
+    ['Produto A', 'Fevereiro', '300'],
+    ['Produto B', 'Janeiro', '50'],
+    ['Produto B', 'Fevereiro', '70'],
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = TableStore(str(tmp_path / 'tables.sqlite'))
+    store.add_document('relatorio', [(1, 0, ROWS)])
+    return store
+
+
+def test_value_of_the_group_column_filters_instead_of_grouping(store):
+    route = store._route("Qual a média de vendas do Produto A?")
+    assert route['group'] is None
+    assert route['filters'] == {'produto': {'Produto A'}}
+    assert store.answer("Qual a média de vendas do Produto A?").startswith("Média de Vendas (Produto A): 200")
+
+
+def test_explicit_group_keeps_the_filter(store):
+    answer = store.answer("Qual o total de vendas por produto do Produto B?")
+    assert "Produto B: 120" in answer
+    assert "Produto A" not in answer
+
+
+def test_group_without_filter(store):
+    answer = store.answer("Qual é o total de vendas por produto?")
+    assert "Produto A: 400" in answer and "Produto B: 120" in answer
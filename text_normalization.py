@@ -0,0 +1,21 @@
+import re
+import unicodedata
+
+
+def fold(text):
+    """
+    Minúsculas e sem acentos, para comparar textos em português e inglês.
+    """
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def words(text):
+    return re.findall(r'\w+', fold(text))
+
+
+def normalize_question(question):
+    """
+    Forma canônica da pergunta: sem acentos, pontuação ou espaços repetidos.
+    """
+    return " ".join(words(question))